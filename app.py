@@ -1,24 +1,87 @@
-from flask import Flask, request, jsonify, render_template, Response
+from flask import Flask, request, jsonify, render_template, Response, abort, send_file, stream_with_context
 import os
 import base64
+import json
+import math
+import operator
 import re
-from datetime import datetime, timedelta
-from anthropic import Anthropic
-from database import db, Tag, Folder, init_db
+from datetime import datetime, timedelta, timezone
+import export
+import imaging
+import metrics
+from sqlalchemy.orm import joinedload, load_only
+from database import (db, Tag, ArchivedTag, Folder, TAG_FIELD_COLUMNS, ARCHIVED_FIELD_COLUMNS, classify_source,
+                      folder_summaries, init_db, on_tags_committed, price_cents)
+from blobstore import get_archive_blob_store, get_blob_store, release_unreferenced, shares_storage, variant_name
+from dashboard import DashboardCache
+from extraction import get_extractor, fields_from_cache, format_labelled_text
+from governor import ModelGovernor
+from jobs import JobQueue, QueueFull
+from listing_cache import ListingCache
+from ocr_cache import OcrCache
+from reports import outstanding_value
+from staging import StagedUploads
+from search import detect_search_backend, apply_search
+from sync import CursorExpired, record_deletions, tag_changes
 
 app = Flask(__name__)
 
 # Initialize database
 init_db(app)
+with app.app_context():
+    detect_search_backend()
 
-# Initialize Anthropic client
-client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+# Per-route latency, SQL timing and /metrics (see metrics.py)
+metrics.instrument(app, db)
+
+# Initialize tag extractor: optional local tiers, then the model (Anthropic by
+# default, EXTRACTOR_BACKEND=fake for offline). Every model call goes through
+# one governor: concurrency and rate limits, retries and a circuit breaker
+model_governor = ModelGovernor.from_env()
+extractor = get_extractor(model_governor)
+ocr_cache = OcrCache.from_env()
+
+# Tag images live in a content-addressed store, not on the tags rows;
+# archived tags' images in a cold one (see archive.py)
+blob_store = get_blob_store(app)
+archive_blob_store = get_archive_blob_store(app)
+# Where both are the same store, a key may be in use by either table
+if shares_storage(blob_store, archive_blob_store):
+    LIVE_IMAGE_COLUMNS = ARCHIVED_IMAGE_COLUMNS = [Tag.image_key, ArchivedTag.image_key]
+else:
+    LIVE_IMAGE_COLUMNS, ARCHIVED_IMAGE_COLUMNS = [Tag.image_key], [ArchivedTag.image_key]
+
+# Uploaded images wait here between /upload and /save, so the scanner never
+# sends them twice
+staged_uploads = StagedUploads.from_env()
+
+# Due-date summary, recomputed after tag writes
+dashboard_cache = DashboardCache.from_env()
+on_tags_committed(dashboard_cache.invalidate)
+
+# Tracker and tag listings: ETags and rendered responses, stamped per folder on writes
+listing_cache = ListingCache.from_env()
+on_tags_committed(listing_cache.on_commit)
+
+# Listing page sizes
+TRACKER_PAGE_SIZE = int(os.environ.get('TRACKER_PAGE_SIZE', '50'))
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# What /save does with a tag whose style and PO number are already stored:
+# warn (save it and say so), reject (409 unless allow_duplicate) or allow
+DUPLICATE_TAGS = os.environ.get('DUPLICATE_TAGS', 'warn').lower()
+
+def release_images(keys):
+    """Delete blobs that are no longer referenced by any tag"""
+    release_unreferenced(blob_store, keys, LIVE_IMAGE_COLUMNS)
 
 @app.route('/')
 def index():
     """Folder selection / home page"""
-    folders = Folder.query.order_by(Folder.name.asc()).all()
-    return render_template('folders.html', folders=folders)
+    dashboard, _ = dashboard_cache.get()
+    folder_due = {f['folder_id']: f for f in dashboard['by_folder']}
+    return render_template('folders.html', folders=folder_summaries(), dashboard=dashboard, folder_due=folder_due)
 
 @app.route('/scan')
 @app.route('/scan/<int:folder_id>')
@@ -27,13 +90,18 @@ def scan(folder_id=None):
     folder = Folder.query.get(folder_id) if folder_id else None
     return render_template('index.html', folder=folder, folder_id=folder_id)
 
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """Overdue / due this week / due this month counts and value, by folder and by source"""
+    dashboard, cached = dashboard_cache.get()
+    return jsonify({'success': True, 'cached': cached, 'dashboard': dashboard})
+
 @app.route('/api/folders', methods=['GET'])
 def get_folders():
     """Get all folders"""
-    folders = Folder.query.order_by(Folder.name.asc()).all()
     return jsonify({
         'success': True,
-        'folders': [f.to_dict() for f in folders]
+        'folders': [f.to_dict(tag_count=n) for f, n in folder_summaries()]
     })
 
 @app.route('/api/folders', methods=['POST'])
@@ -57,7 +125,7 @@ def create_folder():
         
         return jsonify({
             'success': True,
-            'folder': folder.to_dict()
+            'folder': folder.to_dict(tag_count=0)
         })
     except Exception as e:
         db.session.rollback()
@@ -88,120 +156,411 @@ def rename_folder(folder_id):
 
 @app.route('/api/folders/<int:folder_id>', methods=['DELETE'])
 def delete_folder(folder_id):
-    """Delete a folder and all its tags"""
+    """Delete a folder and all its tags, archived ones included"""
     try:
         folder = Folder.query.get_or_404(folder_id)
+        doomed = dict(db.session.query(Tag.id, Tag.image_key).filter_by(folder_id=folder_id))
+        archived_keys = [k for (k,) in db.session.query(ArchivedTag.image_key).filter_by(folder_id=folder_id)]
         # Delete all tags in this folder
         Tag.query.filter_by(folder_id=folder_id).delete()
+        ArchivedTag.query.filter_by(folder_id=folder_id).delete()
+        record_deletions(doomed)
         db.session.delete(folder)
         db.session.commit()
+        release_images(doomed.values())
+        release_unreferenced(archive_blob_store, archived_keys, ARCHIVED_IMAGE_COLUMNS)
         
         return jsonify({'success': True, 'message': 'Folder deleted'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def run_extraction(upload_token, cache_key=None):
+    """Job handler: extract tag text from a staged upload"""
+    image_bytes = staged_uploads.get(upload_token)
+    if image_bytes is None:
+        raise ValueError('Upload expired, please scan again')
+    # Downscale/re-encode before the model call; the smaller image replaces
+    # the staged original and is what /save stores
+    image_bytes, image_stats = imaging.normalize(image_bytes, imaging.EXTRACTION)
+    staged_uploads.replace(upload_token, image_bytes)
+    
+    extraction = extractor.extract(image_bytes)
+    if cache_key:
+        with app.app_context():
+            ocr_cache.put(cache_key, json.dumps(extraction.fields))
+    return extraction_result(extraction.fields, upload_token,
+                             tier=extraction.tier, image_stats=image_stats)
+
+def extraction_result(fields, upload_token, **extra):
+    """Job result for extracted fields; 'data' is the labelled text older scanner pages parse"""
+    return dict({
+        'fields': fields,
+        'data': format_labelled_text(fields),
+        'upload_token': upload_token
+    }, **extra)
+
+# Extraction runs on a bounded worker pool so web threads are never held
+# for the model round-trip
+extraction_jobs = JobQueue.from_env(run_extraction)
+
+metrics.Gauge('extraction_jobs_pending', 'Extraction jobs queued or running',
+              lambda: extraction_jobs.stats()['pending'])
+metrics.Gauge('staged_upload_bytes', 'Bytes of uploaded images awaiting /save',
+              lambda: staged_uploads.stats()['bytes'])
+metrics.Gauge('model_calls_in_flight', 'Model calls running under the governor',
+              lambda: model_governor.stats()['in_flight'])
+metrics.Gauge('model_circuit_open', 'Model API circuit breaker: 0 closed, 0.5 half-open, 1 open',
+              lambda: {'closed': 0, 'half_open': 0.5, 'open': 1}[model_governor.stats()['state']])
+metrics.Gauge('listing_cache_bytes', 'Bytes of rendered listing responses kept for reuse',
+              lambda: listing_cache.stats()['bytes'])
+
+# Seconds between SSE keep-alive comments while a scan session has work in flight
+SESSION_KEEPALIVE = 15
+
+def read_upload():
+    """
+    Image bytes from an upload request, or None.
+
+    Accepts a multipart form with an 'image' file, a raw image/* or
+    application/octet-stream body, or (older clients) JSON {"image": <base64>}.
+    """
+    if request.files:
+        upload = request.files.get('image')
+        return upload.read() if upload else None
+    if request.is_json:
+        image_data = (request.get_json(silent=True) or {}).get('image')
+        if not image_data:
+            return None
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+        return base64.b64decode(image_data)
+    return request.get_data() or None
+
+def check_ocr_cache(image_bytes):
+    """
+    Look an image up in the extraction cache.
+
+    Returns (cache_key, cached_text); cached_text is None on a miss.
+    """
+    # Re-scans of an image we've already read skip the model call
+    cache_key = ocr_cache.key_for(image_bytes) if ocr_cache.enabled else None
+    return cache_key, ocr_cache.get(cache_key)
+
+def queue_extraction(image_bytes, session_id=None):
+    """
+    Stage an upload and queue its extraction (or answer it from the cache).
+
+    Returns (job_id, cached result); job_id is None for a standalone cache hit.
+    Raises QueueFull if the pool is at its limit.
+    """
+    cache_key, cached_text = check_ocr_cache(image_bytes)
+    upload_token = staged_uploads.put(image_bytes)
+    if cached_text is not None:
+        result = extraction_result(fields_from_cache(cached_text), upload_token, cached=True, tier='cache')
+        job_id = extraction_jobs.add_result(session_id, result) if session_id else None
+        return job_id, result
+    try:
+        return extraction_jobs.submit_to_session(session_id, upload_token, cache_key), None
+    except QueueFull:
+        staged_uploads.discard(upload_token)
+        raise
+
+def job_response(job):
+    """JSON body describing an extraction job (as returned by /upload/<job_id>)"""
+    if job['status'] == 'failed':
+        response = {
+            'success': False,
+            'job_id': job['id'],
+            'status': 'failed',
+            'error': job['error']
+        }
+        if job['retry_after'] is not None:
+            # The model API is busy, not the image: the same scan can be sent again
+            response.update(retryable=True, retry_after=math.ceil(job['retry_after']))
+        return response
+    response = {'success': True, 'job_id': job['id'], 'status': job['status']}
+    if job['status'] == 'done':
+        response.update(job['result'])
+    return response
+
 @app.route('/upload', methods=['POST'])
 def upload_image():
-    """Process uploaded tag image"""
+    """Queue an uploaded tag image for extraction"""
     try:
-        data = request.get_json()
-        image_data = data.get('image')
+        image_bytes = read_upload()
+        if not image_bytes:
+            return jsonify({'success': False, 'error': 'No image provided'}), 400
         
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-        
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=1000,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": image_data,
-                            },
-                        },
-                        {
-                            "type": "text",
-                            "text": "This is a clothing tag label. Please extract ONLY these pieces of information in this exact format:\n\nStyle Number: [the style/item number]\nDescription: [the product description]\nPO Number: [the PO/order number]\nPrice: [the price if visible, or N/A if not found]\n\nBe precise and extract exactly what you see on the tag. The price is often at the bottom of the tag and may include a dollar sign."
-                        }
-                    ],
-                }
-            ],
-        )
-        
-        response_text = message.content[0].text
+        job_id, cached = queue_extraction(image_bytes)
+        if cached:
+            return jsonify(dict(cached, success=True, status='done'))
         
         return jsonify({
             'success': True,
-            'data': response_text,
-            'image_data': image_data
-        })
+            'job_id': job_id,
+            'status': 'queued'
+        }), 202
         
+    except QueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
-@app.route('/save', methods=['POST'])
-def save_tag():
-    """Save a tag to the database"""
+@app.route('/upload/<job_id>', methods=['GET'])
+def upload_status(job_id):
+    """Poll an extraction job"""
+    job = extraction_jobs.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'error': 'Unknown or expired job'}), 404
+    
+    body = job_response(job)
+    if body.get('retryable'):
+        return jsonify(body), 503, {'Retry-After': str(body['retry_after'])}
+    return jsonify(body), 500 if job['status'] == 'failed' else 200
+
+@app.route('/upload/sessions', methods=['POST'])
+def create_scan_session():
+    """Start a batch scan session"""
+    return jsonify({'success': True, 'session_id': extraction_jobs.create_session()}), 201
+
+@app.route('/upload/sessions/<session_id>', methods=['POST'])
+def upload_to_session(session_id):
+    """Queue one image of a batch scan; results arrive on the session's event stream"""
     try:
-        data = request.get_json()
-        style_number = data.get('style_number')
-        description = data.get('description')
-        po_number = data.get('po_number')
-        scan_date_str = data.get('scan_date')
-        return_date_str = data.get('return_date')
-        image_data = data.get('image_data')
-        folder_id = data.get('folder_id')
-        price = data.get('price', '').strip()
-        source = data.get('source', '').strip()
-        
-        # Auto-classify source based on price ending
-        if price and not source:
-            if price.endswith('.95'):
-                source = 'Inline (GAP)'
-            elif price.endswith('.99'):
-                source = 'Gap Factory'
+        if not extraction_jobs.get_session(session_id):
+            return jsonify({'success': False, 'error': 'Unknown or expired session'}), 404
         
-        scan_date = datetime.strptime(scan_date_str, '%Y-%m-%d').date()
+        image_bytes = read_upload()
+        if not image_bytes:
+            return jsonify({'success': False, 'error': 'No image provided'}), 400
         
-        if return_date_str:
-            return_date = datetime.strptime(return_date_str, '%Y-%m-%d').date()
-        else:
-            return_date = scan_date + timedelta(days=30)
-        
-        raw_text = f"Style Number: {style_number}\nDescription: {description}\nPO Number: {po_number}"
-        
-        new_tag = Tag(
-            style_number=style_number,
-            description=description,
-            po_number=po_number,
-            scan_date=scan_date,
-            return_date=return_date,
-            raw_text=raw_text,
-            image_data=base64.b64decode(image_data) if image_data else None,
-            folder_id=folder_id,
-            price=price if price else None,
-            source=source if source else None
-        )
+        job_id, _ = queue_extraction(image_bytes, session_id)
+        return jsonify({'success': True, 'job_id': job_id}), 202
         
+    except QueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/upload/sessions/<session_id>', methods=['GET'])
+def scan_session_status(session_id):
+    """Every job of a scan session, in submission order"""
+    session = extraction_jobs.get_session(session_id)
+    if not session:
+        return jsonify({'success': False, 'error': 'Unknown or expired session'}), 404
+    jobs = [extraction_jobs.get(job_id) for job_id in session['jobs']]
+    return jsonify({
+        'success': True,
+        'session_id': session_id,
+        'jobs': [job_response(job) for job in jobs if job]
+    })
+
+@app.route('/upload/sessions/<session_id>/events', methods=['GET'])
+def scan_session_events(session_id):
+    """
+    Server-sent events for a scan session: one 'result' event per job as it
+    finishes, then 'idle' once every submitted image is done.
+
+    Event ids count finished jobs, so a reconnect (Last-Event-ID, or ?after=N)
+    resumes where the client left off.
+    """
+    if not extraction_jobs.get_session(session_id):
+        return jsonify({'success': False, 'error': 'Unknown or expired session'}), 404
+    try:
+        after = int(request.headers.get('Last-Event-ID') or request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid event id'}), 400
+    
+    def events():
+        sent = after
+        version = 0
+        while True:
+            session = extraction_jobs.get_session(session_id)
+            if not session:
+                return
+            for job_id in session['finished'][sent:]:
+                sent += 1
+                job = extraction_jobs.get(job_id)
+                if job:
+                    payload = dict(job_response(job), index=session['jobs'].index(job_id))
+                    yield f"id: {sent}\nevent: result\ndata: {json.dumps(payload)}\n\n"
+            if sent >= len(session['jobs']):
+                yield f"event: idle\ndata: {json.dumps({'finished': sent})}\n\n"
+                return
+            new_version = extraction_jobs.wait_for_change(version, SESSION_KEEPALIVE)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+            version = new_version
+    
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/ocr-cache', methods=['GET'])
+def ocr_cache_stats():
+    """Extraction cache hit/miss counts and size"""
+    return jsonify({'success': True, 'cache': ocr_cache.stats()})
+
+@app.route('/api/extraction-stats', methods=['GET'])
+def extraction_stats():
+    """Per-tier extraction hit rates and latency"""
+    return jsonify({'success': True, 'tiers': extractor.stats()})
+
+@app.route('/api/model-governor', methods=['GET'])
+def model_governor_stats():
+    """Model call governor: circuit state, in-flight and waiting calls, rate budgets, retries"""
+    return jsonify({'success': True, 'governor': model_governor.stats()})
+
+@app.route('/api/image-stats', methods=['GET'])
+def image_stats():
+    """Before/after image sizes for each normalization profile, and staged upload usage"""
+    return jsonify({'success': True, 'images': imaging.stats(), 'staged_uploads': staged_uploads.stats()})
+
+def build_tag(data):
+    """
+    Tag for a /save payload, and its image bytes.
+
+    The image is the staged upload named by upload_token, or (older clients)
+    base64 image_data. Returns (tag, image_bytes); the caller checks for
+    duplicates, stores the image with store_image(), adds and commits the
+    tag, then discards the staged upload.
+    """
+    style_number = data.get('style_number')
+    description = data.get('description')
+    po_number = data.get('po_number')
+    scan_date_str = data.get('scan_date')
+    return_date_str = data.get('return_date')
+    upload_token = data.get('upload_token')
+    image_data = data.get('image_data')
+    folder_id = data.get('folder_id')
+    price = (data.get('price') or '').strip()
+    source = (data.get('source') or '').strip()
+    
+    # Auto-classify source based on price ending
+    if price and not source:
+        source = classify_source(price) or source
+    
+    scan_date = datetime.strptime(scan_date_str, '%Y-%m-%d').date()
+    
+    if return_date_str:
+        return_date = datetime.strptime(return_date_str, '%Y-%m-%d').date()
+    else:
+        return_date = scan_date + timedelta(days=30)
+    
+    raw_text = f"Style Number: {style_number}\nDescription: {description}\nPO Number: {po_number}"
+    
+    if upload_token:
+        image_bytes = staged_uploads.get(upload_token)
+        if image_bytes is None:
+            raise ValueError('Upload expired, please scan again')
+    else:
+        image_bytes = base64.b64decode(image_data) if image_data else None
+    
+    tag = Tag(
+        style_number=style_number,
+        description=description,
+        po_number=po_number,
+        scan_date=scan_date,
+        return_date=return_date,
+        raw_text=raw_text,
+        folder_id=folder_id,
+        price=price if price else None,
+        source=source if source else None
+    )
+    return tag, image_bytes
+
+def store_image(tag, image_bytes):
+    """Normalize and store a built tag's image (and thumbnail); returns the image stats, or None"""
+    if not image_bytes:
+        return None
+    image_bytes, image_stats = imaging.normalize(image_bytes, imaging.STORAGE)
+    tag.image_key = blob_store.put(image_bytes)
+    store_thumbnail(tag.image_key, image_bytes)
+    return image_stats
+
+def find_duplicates(tags):
+    """
+    Stored tags with the same normalized style and PO number as any of tags,
+    from one lookup on ix_tags_style_po_key: {(style_key, po_key): [summary, ...]}
+    """
+    keys = {(t.style_key, t.po_key) for t in tags if t.style_key and t.po_key}
+    if DUPLICATE_TAGS == 'allow' or not keys:
+        return {}
+    rows = db.session.query(Tag.id, Tag.style_key, Tag.po_key, Tag.folder_id, Folder.name, Tag.scan_date) \
+        .outerjoin(Folder, Tag.folder_id == Folder.id) \
+        .filter(db.tuple_(Tag.style_key, Tag.po_key).in_(keys)) \
+        .order_by(Tag.id.asc()) \
+        .all()
+    found = {}
+    for tag_id, style_key, po_key, folder_id, folder_name, scan_date in rows:
+        found.setdefault((style_key, po_key), []).append({
+            'id': tag_id,
+            'folder_id': folder_id,
+            'folder_name': folder_name,
+            'scan_date': scan_date.isoformat() if scan_date else None
+        })
+    return found
+
+def batch_duplicates(tags):
+    """
+    Stored tags, and earlier tags of the same batch, that each of tags repeats:
+    {index: [summary, ...]}; a batch tag's summary has its batch_index.
+    """
+    stored = find_duplicates(tags)
+    first_seen, duplicates = {}, {}
+    for i, tag in enumerate(tags):
+        key = (tag.style_key, tag.po_key)
+        matches = list(stored.get(key, []))
+        if DUPLICATE_TAGS != 'allow' and tag.style_key and tag.po_key:
+            if key in first_seen:
+                matches.append({'batch_index': first_seen[key], 'folder_id': tags[first_seen[key]].folder_id})
+            else:
+                first_seen[key] = i
+        if matches:
+            duplicates[str(i)] = matches
+    return duplicates
+
+def duplicate_error(tag, matches):
+    where = ', '.join(dict.fromkeys(
+        f"tag {m['batch_index'] + 1} of this batch" if 'batch_index' in m else m['folder_name'] or 'General Inbox'
+        for m in matches))
+    return f"Style {tag.style_number} / PO {tag.po_number} is already saved ({where})"
+
+@app.route('/save', methods=['POST'])
+def save_tag():
+    """Save a tag to the database (see DUPLICATE_TAGS for repeats of a stored style + PO)"""
+    try:
+        data = request.get_json()
+        new_tag, image_bytes = build_tag(data)
+        duplicates = find_duplicates([new_tag]).get((new_tag.style_key, new_tag.po_key), [])
+        if duplicates and DUPLICATE_TAGS == 'reject' and not data.get('allow_duplicate'):
+            # Nothing is stored yet; the staged upload is kept, so the client can
+            # resend with allow_duplicate
+            return jsonify({
+                'success': False,
+                'error': duplicate_error(new_tag, duplicates),
+                'duplicates': duplicates
+            }), 409
+        image_stats = store_image(new_tag, image_bytes)
         db.session.add(new_tag)
         db.session.commit()
+        staged_uploads.discard(data.get('upload_token'))
         
-        return jsonify({
+        response = {
             'success': True,
             'message': 'Tag saved successfully!',
             'id': new_tag.id,
-            'return_date': return_date.isoformat()
-        })
+            'return_date': new_tag.return_date.isoformat(),
+            'image_stats': image_stats
+        }
+        if duplicates:
+            response.update(warning=duplicate_error(new_tag, duplicates), duplicates=duplicates)
+        return jsonify(response)
         
     except Exception as e:
         db.session.rollback()
@@ -210,49 +569,454 @@ def save_tag():
             'error': str(e)
         }), 500
 
+@app.route('/save/batch', methods=['POST'])
+def save_tags_batch():
+    """
+    Save the confirmed tags of a batch scan in one transaction.
+
+    Body: {"tags": [<same fields as /save>, ...]}. Either every tag is saved
+    or none are; the error names the first tag that failed. Tags repeating a
+    stored style + PO number, or an earlier tag of the batch, are reported in
+    "duplicates" (index -> matches), or, with DUPLICATE_TAGS=reject, fail the
+    batch unless allow_duplicate.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('tags')
+    if not isinstance(items, list) or not items:
+        return jsonify({'success': False, 'error': 'tags must be a non-empty list'}), 400
+    
+    tags = []
+    try:
+        built = []
+        for i, item in enumerate(items):
+            try:
+                built.append(build_tag(item))
+            except Exception as e:
+                raise ValueError(f"Tag {i + 1}: {e}")
+        duplicates = batch_duplicates([tag for tag, _ in built])
+        if duplicates and DUPLICATE_TAGS == 'reject' and not data.get('allow_duplicate'):
+            # Rejected before any image is stored
+            first = int(next(iter(duplicates)))
+            return jsonify({
+                'success': False,
+                'error': f"Tag {first + 1}: {duplicate_error(built[first][0], duplicates[str(first)])}",
+                'duplicates': duplicates
+            }), 409
+        for i, (tag, image_bytes) in enumerate(built):
+            try:
+                store_image(tag, image_bytes)
+            except Exception as e:
+                raise ValueError(f"Tag {i + 1}: {e}")
+            tags.append(tag)
+        db.session.add_all(tags)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        # Blobs written for this batch that no tag ended up referencing
+        release_images(t.image_key for t in tags)
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    for item in items:
+        staged_uploads.discard(item.get('upload_token'))
+    return jsonify({
+        'success': True,
+        'saved': len(tags),
+        'tags': [{'id': t.id, 'return_date': t.return_date.isoformat()} for t in tags],
+        'duplicates': duplicates
+    })
+
+def encode_cursor(tag):
+    """Opaque keyset cursor for the position after `tag`"""
+    raw = f"{tag.return_date.isoformat()}|{tag.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    return_date, tag_id = raw.split('|')
+    return datetime.strptime(return_date, '%Y-%m-%d').date(), int(tag_id)
+
+def filter_tags(query, folder_id=None, general=False, model=Tag):
+    """Apply the tracker's folder / General inbox filter"""
+    if general:
+        return query.filter(model.folder_id == None)
+    if folder_id:
+        return query.filter(model.folder_id == folder_id)
+    return query
+
+def filter_price(query, model=Tag):
+    """
+    Apply ?min_price= / ?max_price= (dollars, inclusive) to the indexed
+    price_cents column; raises ValueError for a malformed price.
+    """
+    for arg, compare in (('min_price', operator.ge), ('max_price', operator.le)):
+        value = request.args.get(arg, '').strip()
+        if value:
+            cents = price_cents(value)
+            if cents is None:
+                raise ValueError(f"Invalid {arg}: {value}")
+            query = query.filter(compare(model.price_cents, cents))
+    return query
+
+def paginate_tags(query, cursor=None, limit=TRACKER_PAGE_SIZE, model=Tag):
+    """One keyset page ordered by (return_date, id); returns (tags, next_cursor)"""
+    if cursor:
+        return_date, tag_id = decode_cursor(cursor)
+        query = query.filter(db.or_(
+            model.return_date > return_date,
+            db.and_(model.return_date == return_date, model.id > tag_id)
+        ))
+    tags = query.order_by(model.return_date.asc(), model.id.asc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(tags[limit - 1]) if len(tags) > limit else None
+    return tags[:limit], next_cursor
+
 @app.route('/tracker')
+@listing_cache.cached
 def tracker():
-    """View all stored tags, sorted by return date"""
+    """View stored tags, sorted by return date (first page; the rest load incrementally)"""
     from datetime import date
     folder_id = request.args.get('folder_id', type=int)
     general = request.args.get('general', type=str)  # ?general=1 = no folder
 
-    query = Tag.query
+    query = filter_tags(Tag.query, folder_id, general == '1')
     folder = None
-    if general == '1':
-        query = query.filter(Tag.folder_id == None)
-    elif folder_id:
-        query = query.filter_by(folder_id=folder_id)
+    if folder_id and general != '1':
         folder = Folder.query.get(folder_id)
 
-    tags = query.order_by(Tag.return_date.asc()).all()
+    tags, next_cursor = paginate_tags(query.options(joinedload(Tag.folder)))
+    total = query.count()
     folders = Folder.query.order_by(Folder.name.asc()).all()
     return render_template('tracker.html', tags=tags, today=date.today(),
                          current_folder=folder, folders=folders,
-                         show_general=(general == '1'))
+                         show_general=(general == '1'),
+                         total=total, next_cursor=next_cursor)
 
-@app.route('/api/tags', methods=['GET'])
-def get_tags():
-    """API endpoint to get all tags as JSON"""
+@app.route('/tracker/page')
+@listing_cache.cached
+def tracker_page():
+    """Next page of tracker cards as an HTML fragment (cursor in X-Next-Cursor), optionally searched with ?q="""
+    from datetime import date
     folder_id = request.args.get('folder_id', type=int)
+    general = request.args.get('general', type=str)
+
+    query = filter_tags(Tag.query, folder_id, general == '1')
+    q = request.args.get('q', '').strip()
+    if q:
+        query = apply_search(query, q)
+    try:
+        tags, next_cursor = paginate_tags(query.options(joinedload(Tag.folder)), request.args.get('cursor'))
+    except ValueError:
+        return 'Invalid cursor', 400
+
+    response = Response(render_template('tag_cards.html', tags=tags, today=date.today()))
+    response.headers['X-Next-Cursor'] = next_cursor or ''
+    return response
+
+def tags_page_response(query, model=Tag, field_columns=TAG_FIELD_COLUMNS):
+    """
+    JSON page of a Tag (or ArchivedTag) query: ?limit=N (default 100, max 500),
+    ?cursor=<next_cursor from the previous page>, ?fields=id,style_number,...
+    """
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
     
-    query = Tag.query
-    if folder_id:
-        query = query.filter_by(folder_id=folder_id)
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or None
+    if fields:
+        unknown = [f for f in fields if f not in field_columns]
+        if unknown:
+            return jsonify({'success': False, 'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        # The cursor always needs return_date and id
+        columns = {'id', 'return_date'}.union(*(field_columns[f] for f in fields))
+        query = query.options(load_only(*(getattr(model, c) for c in columns)))
+    if not fields or 'folder_name' in fields:
+        # Folder names in the same query instead of one lazy load per tag
+        query = query.options(joinedload(model.folder).load_only(Folder.name))
+    
+    try:
+        tags, next_cursor = paginate_tags(query, request.args.get('cursor'), limit, model)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
     
-    tags = query.order_by(Tag.return_date.asc()).all()
     return jsonify({
         'success': True,
-        'tags': [t.to_dict() for t in tags]
+        'tags': [t.to_dict(fields) for t in tags],
+        'next_cursor': next_cursor
     })
 
+@app.route('/api/tags', methods=['GET'])
+@listing_cache.cached
+def get_tags():
+    """
+    API endpoint to get tags as JSON, one keyset page at a time
+    (?folder_id=N or ?general=1, ?min_price= / ?max_price=)
+    """
+    folder_id = request.args.get('folder_id', type=int)
+    general = request.args.get('general', type=str)
+    try:
+        query = filter_price(filter_tags(Tag.query, folder_id, general == '1'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return tags_page_response(query)
+
+@app.route('/api/tags/search', methods=['GET'])
+@listing_cache.cached
+def search_tags():
+    """Indexed search over style number, description and PO number (?q=...), paginated like /api/tags"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'success': False, 'error': 'q is required'}), 400
+    folder_id = request.args.get('folder_id', type=int)
+    general = request.args.get('general', type=str)
+    try:
+        query = filter_price(apply_search(filter_tags(Tag.query, folder_id, general == '1'), q))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return tags_page_response(query)
+
+@app.route('/api/tags/duplicates', methods=['GET'])
+def duplicate_tags():
+    """
+    Groups of tags sharing a normalized style and PO number, across every
+    folder, ordered by key; ?limit=N groups (default 100, max 500) and
+    ?cursor=<next_cursor>.
+    """
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    count = db.func.count(Tag.id)
+    groups = db.session.query(Tag.style_key, Tag.po_key, count.label('count')) \
+        .filter(Tag.style_key != '', Tag.po_key != '') \
+        .group_by(Tag.style_key, Tag.po_key) \
+        .having(count > 1)
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            style_key, po_key = json.loads(raw)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+        groups = groups.filter(db.or_(
+            Tag.style_key > style_key,
+            db.and_(Tag.style_key == style_key, Tag.po_key > po_key)
+        ))
+    groups = groups.order_by(Tag.style_key.asc(), Tag.po_key.asc()).limit(limit + 1).subquery()
+    
+    # Members of every group on the page, in the same statement
+    members = Tag.query \
+        .join(groups, db.and_(Tag.style_key == groups.c.style_key, Tag.po_key == groups.c.po_key)) \
+        .options(joinedload(Tag.folder).load_only(Folder.name)) \
+        .order_by(Tag.style_key.asc(), Tag.po_key.asc(), Tag.id.asc()) \
+        .all()
+    
+    found = []
+    for tag in members:
+        if not found or (found[-1]['style_key'], found[-1]['po_key']) != (tag.style_key, tag.po_key):
+            found.append({'style_key': tag.style_key, 'po_key': tag.po_key, 'tags': []})
+        found[-1]['tags'].append(tag.to_dict(DUPLICATE_FIELDS))
+    next_cursor = None
+    if len(found) > limit:
+        found = found[:limit]
+        last = json.dumps([found[-1]['style_key'], found[-1]['po_key']]).encode()
+        next_cursor = base64.urlsafe_b64encode(last).decode('ascii').rstrip('=')
+    for group in found:
+        group['count'] = len(group['tags'])
+    return jsonify({'success': True, 'groups': found, 'next_cursor': next_cursor})
+
+DUPLICATE_FIELDS = ['id', 'style_number', 'description', 'po_number', 'scan_date', 'return_date',
+                    'price', 'folder_id', 'folder_name', 'created_at']
+
+@app.route('/api/reports/outstanding', methods=['GET'])
+def outstanding_report():
+    """Outstanding return value by source, folder and due week, from one aggregate query (?folder_id=N or ?general=1)"""
+    folder_id = request.args.get('folder_id', type=int)
+    general = request.args.get('general', type=str)
+    report = outstanding_value(filter_tags(Tag.query, folder_id, general == '1'))
+    return jsonify({'success': True, 'report': report})
+
+@app.route('/api/tags/changes', methods=['GET'])
+def get_tag_changes():
+    """
+    Tags created or updated, and ids deleted, since ?since=<next_cursor>
+    (omit it for everything); ?limit=N per page. 410 means sync from the start.
+    """
+    limit = min(max(request.args.get('limit', API_PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    try:
+        changes = tag_changes(request.args.get('since'), limit)
+    except CursorExpired:
+        return jsonify({'success': False, 'error': 'Cursor expired, sync from the start'}), 410
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
+    return jsonify({'success': True, **changes})
+
+@app.route('/sw.js')
+def service_worker():
+    """The offline service worker, served from the root so it controls every page"""
+    response = app.send_static_file('sw.js')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/tags/export.<fmt>', methods=['GET'])
+def export_tags(fmt):
+    """Download tags as CSV (streamed) or XLSX, with the tracker's folder filters"""
+    folder_id = request.args.get('folder_id', type=int)
+    general = request.args.get('general', type=str)
+    return export_response(filter_tags(Tag.query, folder_id, general == '1'), fmt, 'tag-tracker')
+
+def export_response(query, fmt, name, model=Tag):
+    """CSV or XLSX download of a Tag (or ArchivedTag) query"""
+    filename = f"{name}-{datetime.now().date().isoformat()}.{fmt}"
+    
+    if fmt == 'csv':
+        return Response(
+            stream_with_context(export.iter_csv(query, model=model)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+    if fmt == 'xlsx':
+        return send_file(
+            export.write_xlsx(query, model=model),
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            as_attachment=True,
+            download_name=filename
+        )
+    return jsonify({'success': False, 'error': 'Export format must be csv or xlsx'}), 404
+
+def archived_query():
+    """Archived tags with the tracker's folder filters, price range and ?q= search; raises ValueError"""
+    folder_id = request.args.get('folder_id', type=int)
+    general = request.args.get('general', type=str)
+    query = filter_price(filter_tags(ArchivedTag.query, folder_id, general == '1', model=ArchivedTag), ArchivedTag)
+    return apply_search(query, request.args.get('q', ''), model=ArchivedTag)
+
+@app.route('/api/archive', methods=['GET'])
+def get_archived_tags():
+    """Archived tags (see archive.py), paginated like /api/tags; ?q= searches them"""
+    try:
+        query = archived_query()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return tags_page_response(query, ArchivedTag, ARCHIVED_FIELD_COLUMNS)
+
+@app.route('/api/archive/export.<fmt>', methods=['GET'])
+def export_archived_tags(fmt):
+    """Download archived tags as CSV or XLSX, with the same filters and ?q= as /api/archive"""
+    try:
+        query = archived_query()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return export_response(query, fmt, 'tag-archive', ArchivedTag)
+
+@app.route('/api/archive/<int:archived_id>/image')
+def archived_tag_image(archived_id):
+    """Serve an archived tag's image from the cold store"""
+    image_key = db.session.query(ArchivedTag.image_key).filter(ArchivedTag.id == archived_id).scalar()
+    response = archive_blob_store.response(image_key) if image_key else None
+    if response is None:
+        abort(404)
+    response.set_etag(image_key)
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+BATCH_RESULTS = {'move': 'moved', 'delete': 'deleted', 'redate': 'redated'}
+BATCH_CHUNK = 1000
+
+def batch_selection(data):
+    """
+    Tag query for a batch request and the ids asked for (None for a filter).
+
+    Either {"ids": [...]} or {"filter": {"folder_id": N | "general",
+    "general": true, "overdue": true, "source": "..."}} with at least one
+    criterion; raises ValueError for a malformed id.
+    """
+    from datetime import date
+    if data.get('ids') is not None:
+        ids = [int(i) for i in data['ids']]
+        return Tag.query.filter(Tag.id.in_(ids)), ids
+    
+    criteria = data.get('filter') or {}
+    if not any(criteria.get(k) for k in ('folder_id', 'general', 'overdue', 'source')):
+        raise ValueError('ids or a filter (folder_id, general, overdue, source) is required')
+    folder_id, general = criteria.get('folder_id'), bool(criteria.get('general'))
+    if folder_id == 'general':
+        folder_id, general = None, True
+    elif folder_id:
+        try:
+            folder_id = int(folder_id)
+        except (TypeError, ValueError):
+            raise ValueError(f'filter.folder_id must be a folder id or "general", not {folder_id!r}')
+    query = filter_tags(Tag.query, folder_id, general)
+    if criteria.get('overdue'):
+        query = query.filter(Tag.return_date < date.today())
+    if criteria.get('source'):
+        query = query.filter(Tag.source == criteria['source'])
+    return query, None
+
+@app.route('/api/tags/batch', methods=['POST'])
+def batch_tags():
+    """
+    Move, delete or re-date many tags in one transaction.
+
+    {"action": "move", "folder_id": N|null, ...selection}
+    {"action": "redate", "return_date": "YYYY-MM-DD", ...selection}
+    {"action": "delete", ...selection}
+    where the selection is "ids" or "filter" (see batch_selection).
+    """
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'success': False, 'error': 'Invalid request: expected a JSON object'}), 400
+        action = data.get('action')
+        if action not in BATCH_RESULTS:
+            return jsonify({'success': False, 'error': 'action must be move, delete or redate'}), 400
+        
+        values = None
+        if action == 'move':
+            folder_id = data.get('folder_id') or None
+            if folder_id and not db.session.get(Folder, folder_id):
+                return jsonify({'success': False, 'error': 'Folder not found'}), 400
+            values = {'folder_id': folder_id}
+        elif action == 'redate':
+            values = {'return_date': datetime.strptime(data['return_date'], '%Y-%m-%d').date()}
+        
+        query, requested_ids = batch_selection(data)
+        # One SELECT for the matching ids (and image keys, for deletes)
+        found = dict(query.with_entities(Tag.id, Tag.image_key).all())
+        target_ids = sorted(found)
+        
+        for i in range(0, len(target_ids), BATCH_CHUNK):
+            chunk = Tag.query.filter(Tag.id.in_(target_ids[i:i + BATCH_CHUNK]))
+            if action == 'delete':
+                chunk.delete(synchronize_session=False)
+                record_deletions(target_ids[i:i + BATCH_CHUNK])
+            else:
+                chunk.update(values, synchronize_session=False)
+        db.session.commit()
+        
+        if action == 'delete':
+            release_images(found.values())
+        
+        results = {str(i): 'not_found' for i in requested_ids or []}
+        results.update({str(i): BATCH_RESULTS[action] for i in target_ids})
+        return jsonify({
+            'success': True,
+            'action': action,
+            'count': len(target_ids),
+            'results': results
+        })
+    except (KeyError, TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/tag/<int:tag_id>', methods=['DELETE'])
 def delete_tag(tag_id):
     """Delete a tag by ID"""
     try:
         tag = Tag.query.get_or_404(tag_id)
+        image_key = tag.image_key
         db.session.delete(tag)
+        record_deletions([tag_id])
         db.session.commit()
+        release_images([image_key])
         
         return jsonify({
             'success': True,
@@ -283,10 +1047,7 @@ def update_tag(tag_id):
             tag.source = data['source'].strip() if data['source'] else None
         # Auto-classify if price changed but source wasn't explicitly set
         if 'price' in data and 'source' not in data and tag.price:
-            if tag.price.endswith('.95'):
-                tag.source = 'Inline (GAP)'
-            elif tag.price.endswith('.99'):
-                tag.source = 'Gap Factory'
+            tag.source = classify_source(tag.price) or tag.source
         
         if 'scan_date' in data:
             scan_date = datetime.strptime(data['scan_date'], '%Y-%m-%d').date()
@@ -333,13 +1094,68 @@ def move_tag(tag_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
+def store_thumbnail(image_key, image_bytes):
+    """Generate and store the tracker thumbnail for an image"""
+    thumb_bytes, _ = imaging.normalize(image_bytes, imaging.THUMBNAIL)
+    return blob_store.put_variant(image_key, 'thumb', thumb_bytes)
+
 @app.route('/api/tag/<int:tag_id>/image')
 def tag_image(tag_id):
-    """Serve the stored tag image"""
-    tag = Tag.query.get_or_404(tag_id)
-    if tag.image_data:
-        return Response(tag.image_data, mimetype='image/jpeg')
-    return '', 404
+    """Serve the stored tag image (?size=thumb for the tracker thumbnail)"""
+    size = request.args.get('size', 'full')
+    if size not in ('full', 'thumb'):
+        return jsonify({'success': False, 'error': 'size must be full or thumb'}), 400
+    
+    row = db.session.query(Tag.image_key, Tag.created_at).filter(Tag.id == tag_id).first()
+    if row is None:
+        abort(404)
+    image_key, created_at = row
+    
+    if not image_key:
+        # Not yet moved by migrate_images_to_blobstore.py
+        legacy = db.session.query(Tag.image_data).filter(Tag.id == tag_id).scalar()
+        if legacy:
+            return Response(legacy, mimetype='image/jpeg')
+        return '', 404
+    
+    # Images never change once stored, so the content hash is a strong ETag
+    etag = image_key if size == 'full' else variant_name(image_key, 'thumb')
+    last_modified = created_at.replace(tzinfo=timezone.utc, microsecond=0) if created_at else None
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        not_modified = bool(last_modified and request.if_modified_since
+                            and last_modified <= request.if_modified_since)
+    if not_modified:
+        response = Response(status=304)
+    else:
+        name = image_key
+        if size == 'thumb':
+            name = variant_name(image_key, 'thumb')
+            if not blob_store.exists(name):
+                original = blob_store.get(image_key)
+                if original is None:
+                    return '', 404
+                store_thumbnail(image_key, original)
+                db.session.commit()
+        response = blob_store.response(name)
+        if response is None:
+            return '', 404
+        if last_modified:
+            response.last_modified = last_modified
+    
+    response.set_etag(etag)
+    # A URL pinned to the content hash (?v=<key prefix>) can be cached forever
+    version = request.args.get('v')
+    if version and image_key.startswith(version):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, max-age=86400'
+    return response
 
 if __name__ == '__main__':
+    from migrations import run_migrations
+    run_migrations(app)
+    with app.app_context():
+        detect_search_backend()
     app.run(debug=True)
@@ -0,0 +1,156 @@
+"""
+Hot/cold archival: move settled tags out of the live tags table.
+
+Tags whose return date is more than ARCHIVE_AFTER_DAYS days past (--days)
+move to the archived_tags table, --batch-size at a time. For each batch:
+    1. every image is recompressed with the archive profile
+       (ARCHIVE_MAX_DIM / ARCHIVE_JPEG_QUALITY) and written to the cold
+       blob store (ARCHIVE_BLOB_STORE / ARCHIVE_BLOB_STORE_DIR);
+    2. one transaction inserts the archived_tags rows, deletes the tags rows
+       and records tombstones, so offline clients drop them as well;
+    3. live images (and thumbnails) that no live tag still uses are deleted,
+       unless stored in the last BLOB_RELEASE_GRACE seconds (sweep_blobs.py
+       collects those later).
+Images are copied before the rows move, so an interrupted run loses nothing:
+the next run picks up the tags that are still live.
+
+The tracker, /api/tags, search, folder counts and the dashboard only read
+tags, so they stay the size of the open returns. Archived tags are listed
+and searched at GET /api/archive and exported at GET /api/archive/export.csv
+(or .xlsx).
+
+Run it on a schedule, e.g. daily from Heroku Scheduler:
+    python archive.py --yes
+
+Usage:
+    python archive.py [--days N] [--batch-size N] [--limit N] [--dry-run] [--yes]
+
+Environment:
+    ARCHIVE_AFTER_DAYS  days past the return date before a tag is archived (default 365)
+    ARCHIVE_BATCH_SIZE  tags moved per transaction (default 200)
+"""
+import argparse
+import os
+from datetime import date, datetime, timedelta
+from flask import Flask
+from sqlalchemy.orm import undefer
+import imaging
+from blobstore import get_archive_blob_store, get_blob_store, release_unreferenced, shares_storage
+from database import db, ArchivedTag, ARCHIVED_COLUMNS, Tag, init_db
+from migrations import run_migrations
+from sync import record_deletions
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '200'))
+
+
+def archivable(cutoff):
+    """Query for the live tags due before cutoff"""
+    return Tag.query.filter(Tag.return_date < cutoff)
+
+
+def image_columns(store, other_store, own_column, other_column):
+    """Columns whose keys live in store: both tables' if the two stores are one and the same"""
+    return [own_column, other_column] if shares_storage(store, other_store) else [own_column]
+
+
+def copy_images(hot, cold, tags):
+    """Recompress each tag's image into the cold store; returns ({tag id: cold key}, bytes before, bytes after)"""
+    keys, before, after = {}, 0, 0
+    for tag in tags:
+        image_bytes = hot.get(tag.image_key) if tag.image_key else tag.image_data
+        if not image_bytes:
+            continue
+        archived_bytes, info = imaging.normalize(image_bytes, imaging.ARCHIVE)
+        keys[tag.id] = cold.put(archived_bytes)
+        before += info['bytes_before']
+        after += info['bytes_after']
+    return keys, before, after
+
+
+def archive_batch(hot, cold, cutoff, batch_size):
+    """
+    Archive up to batch_size tags due before cutoff.
+
+    Returns (tags archived, image bytes before, image bytes after).
+    """
+    candidates = archivable(cutoff).options(undefer(Tag.image_data)) \
+        .order_by(Tag.id.asc()).limit(batch_size).all()
+    if not candidates:
+        return 0, 0, 0
+    cold_keys, before, after = copy_images(hot, cold, candidates)
+    # Images are written (and committed, for the db store) before any row moves
+    db.session.commit()
+
+    # Re-read in the moving transaction, so an edit made meanwhile is kept, and
+    # a tag re-dated into the future stays live
+    ids = [t.id for t in candidates]
+    tags = archivable(cutoff).filter(Tag.id.in_(ids)).all()
+    now = datetime.utcnow()
+    rows = [dict({c: getattr(t, c) for c in ARCHIVED_COLUMNS},
+                 tag_id=t.id, image_key=cold_keys.get(t.id), archived_at=now)
+            for t in tags]
+    moved = [t.id for t in tags]
+    hot_keys = {t.image_key for t in tags}
+    if rows:
+        db.session.execute(db.insert(ArchivedTag), rows)
+        Tag.query.filter(Tag.id.in_(moved)).delete(synchronize_session=False)
+        record_deletions(moved)
+    db.session.commit()
+
+    release_unreferenced(hot, hot_keys, image_columns(hot, cold, Tag.image_key, ArchivedTag.image_key))
+    # Cold copies of tags that stayed live
+    release_unreferenced(cold, set(cold_keys.values()), image_columns(cold, hot, ArchivedTag.image_key, Tag.image_key))
+    return len(rows), before, after
+
+
+def archive(app, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, limit=None):
+    """Archive tags due more than days ago, in batches; returns the number archived"""
+    hot, cold = get_blob_store(app), get_archive_blob_store(app)
+    cutoff = date.today() - timedelta(days=days)
+    archived = before = after = 0
+    with app.app_context():
+        while limit is None or archived < limit:
+            size = batch_size if limit is None else min(batch_size, limit - archived)
+            count, batch_before, batch_after = archive_batch(hot, cold, cutoff, size)
+            if not count:
+                break
+            archived += count
+            before += batch_before
+            after += batch_after
+            print(f"  Archived {archived} tags (images {before / 1024 / 1024:.1f} MB -> "
+                  f"{after / 1024 / 1024:.1f} MB)...")
+    return archived
+
+
+def main(app, args):
+    run_migrations(app)
+    cutoff = date.today() - timedelta(days=args.days)
+    with app.app_context():
+        due = archivable(cutoff).count()
+        live = Tag.query.count()
+        already = ArchivedTag.query.count()
+    print(f"🏷️  {due} of {live} live tags were due before {cutoff.isoformat()} ({already} already archived)")
+    if args.dry_run or not due:
+        return
+    if not args.yes and input(f"Archive {min(due, args.limit or due)} tags? (yes/no): ").lower() != 'yes':
+        print("Cancelled.")
+        return
+    archived = archive(app, args.days, args.batch_size, args.limit)
+    print(f"✅ Archived {archived} tags")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move settled tags to the archive')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help='archive tags whose return date is more than this many days past')
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='tags moved per transaction')
+    parser.add_argument('--limit', type=int, help='archive at most this many tags')
+    parser.add_argument('--dry-run', action='store_true', help='only count the tags that would move')
+    parser.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    init_db(app)
+    print(f"🗄️  Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    main(app, args)
@@ -0,0 +1,237 @@
+"""
+Endpoint benchmarks: latency percentiles, throughput, SQL queries and peak RSS.
+
+Runs the app in-process through the WSGI test client, with --concurrency
+threads issuing --requests requests per scenario, against whatever
+DATABASE_URL points at (fill it with generate_data.py first). Every SQL
+statement is counted per request. Model calls go to the stub Anthropic
+client (EXTRACTOR_BACKEND=stub, STUB_ANTHROPIC_LATENCY) unless the
+environment says otherwise, so the scan scenario measures the app rather
+than the API. The governor's rate limits are off too
+(GOVERNOR_REQUESTS_PER_MINUTE=0, GOVERNOR_TOKENS_PER_MINUTE=0), so scans
+aren't paced to the real API's quota.
+
+The listing and dashboard caches are off by default (LISTING_CACHE_SIZE=0,
+DASHBOARD_CACHE_TTL=0), so the listing scenarios measure the database path
+and catch query regressions; set them to benchmark cached responses instead.
+
+Results can be saved as a baseline and later runs compared against it;
+the comparison exits non-zero when a scenario regresses by more than
+--tolerance (latency/throughput) or issues more queries per request.
+
+Usage:
+    python benchmark.py [--requests N] [--concurrency C] [--only NAME ...]
+                        [--save-baseline FILE] [--compare FILE] [--tolerance 0.2]
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Before the app is imported: stub model, no extraction cache (every scan is a model call)
+os.environ.setdefault('EXTRACTOR_BACKEND', 'stub')
+os.environ.setdefault('OCR_CACHE_MODE', 'off')
+# No model rate limits: the stub answers instantly, and pacing isn't what's measured
+os.environ.setdefault('GOVERNOR_REQUESTS_PER_MINUTE', '0')
+os.environ.setdefault('GOVERNOR_TOKENS_PER_MINUTE', '0')
+# Listings and the dashboard come from the database on every request
+os.environ.setdefault('LISTING_CACHE_SIZE', '0')
+os.environ.setdefault('DASHBOARD_CACHE_TTL', '0')
+
+from PIL import Image
+from sqlalchemy import event
+from app import app
+from database import db, Tag
+
+SCAN_POLL_INTERVAL = 0.05
+
+_local = threading.local()
+
+
+def count_queries(conn, cursor, statement, parameters, context, executemany):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def load_context():
+    """Ids and search words the scenarios pick from"""
+    with app.app_context():
+        image_ids = [i for (i,) in db.session.query(Tag.id).filter(Tag.image_key.isnot(None)).limit(1000)]
+        words = [d.split()[0] for (d,) in db.session.query(Tag.description).limit(200) if d]
+        tag_count = db.session.query(db.func.count(Tag.id)).scalar()
+        dialect = db.engine.dialect.name
+    return {'image_ids': image_ids, 'words': words or ['SHIRT'], 'tag_count': tag_count, 'dialect': dialect}
+
+
+def scan_image():
+    """A distinct small JPEG per call, so nothing is answered from a cache"""
+    image = Image.new('RGB', (640, 480), tuple(random.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=80)
+    return out.getvalue()
+
+
+def scan(client, ctx):
+    """Upload, then poll until the extraction job finishes"""
+    response = client.post('/upload', data=scan_image(), content_type='image/jpeg')
+    job = response.get_json()
+    while response.status_code < 400 and job.get('status') not in ('done', 'failed'):
+        time.sleep(SCAN_POLL_INTERVAL)
+        response = client.get(f"/upload/{job['job_id']}")
+        job = response.get_json()
+    return response
+
+
+def get(path):
+    def run(client, ctx):
+        return client.get(path(ctx) if callable(path) else path)
+    return run
+
+
+SCENARIOS = {
+    'home': get('/'),
+    'tracker': get('/tracker'),
+    'api_tags': get('/api/tags'),
+    'api_tags_fields': get('/api/tags?fields=id,style_number,return_date&limit=500'),
+    'api_search': get(lambda ctx: f"/api/tags/search?q={random.choice(ctx['words'])}"),
+    'api_folders': get('/api/folders'),
+    'api_dashboard': get('/api/dashboard'),
+    'tag_image': get(lambda ctx: f"/api/tag/{random.choice(ctx['image_ids'])}/image"),
+    'tag_thumb': get(lambda ctx: f"/api/tag/{random.choice(ctx['image_ids'])}/image?size=thumb"),
+    'scan': scan,
+}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(name, requests, concurrency, warmup, ctx):
+    fn = SCENARIOS[name]
+
+    def one(_):
+        client = app.test_client()
+        _local.queries = 0
+        started = time.perf_counter()
+        response = fn(client, ctx)
+        response.get_data()
+        response.close()
+        return time.perf_counter() - started, _local.queries, response.status_code
+
+    for i in range(warmup):
+        one(i)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(s[0] * 1000 for s in samples)
+    return {
+        'requests': requests,
+        'errors': sum(1 for s in samples if s[2] >= 400),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p90_ms': round(percentile(latencies, 90), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'throughput': round(requests / elapsed, 1),
+        'queries_per_request': round(sum(s[1] for s in samples) / requests, 2),
+        # ru_maxrss is KB on Linux: the process peak so far, not per scenario
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def print_results(results):
+    header = f"{'scenario':16s} {'reqs':>5s} {'err':>4s} {'p50':>8s} {'p90':>8s} {'p99':>8s} {'max':>8s} " \
+             f"{'req/s':>8s} {'queries':>8s} {'rss MB':>7s}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        print(f"{name:16s} {r['requests']:5d} {r['errors']:4d} {r['p50_ms']:8.1f} {r['p90_ms']:8.1f} "
+              f"{r['p99_ms']:8.1f} {r['max_ms']:8.1f} {r['throughput']:8.1f} "
+              f"{r['queries_per_request']:8.2f} {r['peak_rss_mb']:7.1f}")
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against baseline; returns the regressions found"""
+    regressions = []
+    print(f"\nCompared with baseline ({baseline['meta']['recorded_at']}):")
+    for name, r in results.items():
+        base = baseline['results'].get(name)
+        if not base:
+            print(f"  {name:16s} (not in baseline)")
+            continue
+        changes = []
+        for metric, worse_if_higher in (('p50_ms', True), ('p99_ms', True), ('throughput', False)):
+            if not base[metric]:
+                continue
+            change = (r[metric] - base[metric]) / base[metric]
+            changes.append(f"{metric} {change:+.0%}")
+            if (change > tolerance) if worse_if_higher else (change < -tolerance):
+                regressions.append(f"{name}: {metric} {base[metric]} -> {r[metric]}")
+        if r['queries_per_request'] > base['queries_per_request']:
+            regressions.append(f"{name}: queries/request {base['queries_per_request']} -> {r['queries_per_request']}")
+        changes.append(f"queries {base['queries_per_request']} -> {r['queries_per_request']}")
+        print(f"  {name:16s} " + ', '.join(changes))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the main endpoints')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--only', nargs='+', choices=sorted(SCENARIOS), help='scenarios to run')
+    parser.add_argument('--save-baseline', metavar='FILE')
+    parser.add_argument('--compare', metavar='FILE')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed latency/throughput change before it counts as a regression')
+    args = parser.parse_args()
+
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_queries)
+    ctx = load_context()
+    if not ctx['tag_count']:
+        print("❌ No tags in the database; run generate_data.py first.")
+        sys.exit(1)
+
+    names = args.only or list(SCENARIOS)
+    if not ctx['image_ids']:
+        names = [n for n in names if n not in ('tag_image', 'tag_thumb')]
+    print(f"🗄️  {ctx['dialect']}, {ctx['tag_count']} tags; {args.requests} requests x {args.concurrency} threads\n")
+
+    results = {name: run_scenario(name, args.requests, args.concurrency, args.warmup, ctx) for name in names}
+    print_results(results)
+
+    meta = {
+        'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'dialect': ctx['dialect'],
+        'tag_count': ctx['tag_count'],
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+    }
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        differs = [k for k in ('dialect', 'tag_count', 'concurrency') if baseline['meta'].get(k) != meta[k]]
+        if differs:
+            print(f"\n⚠️  Baseline was recorded with different {', '.join(differs)}; numbers may not be comparable")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions:\n  " + '\n  '.join(regressions))
+            exit_code = 1
+        else:
+            print("\n✅ No regressions")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+    sys.exit(exit_code)
@@ -0,0 +1,267 @@
+"""
+Content-addressed storage for tag images.
+
+Images are stored once under the SHA-256 of their bytes; a Tag only keeps
+the key (Tag.image_key), so listing tags never reads image data. Derived
+images (e.g. thumbnails) are stored alongside as "<key>.<variant>".
+
+Select the backend with BLOB_STORE:
+    fs - files under BLOB_STORE_DIR (default <instance>/blobs), served with
+         sendfile; the default for SQLite
+    db - the blobs table; the default when DATABASE_URL is Postgres, which
+         on Heroku means the dyno's filesystem is wiped on every restart
+
+Archived tags (archive.py) keep their images in a separate cold store,
+selected the same way with ARCHIVE_BLOB_STORE (default: BLOB_STORE) and
+ARCHIVE_BLOB_STORE_DIR (default <instance>/archive-blobs).
+
+A blob is shared by every tag with the same image, so one being released
+(its last tag deleted) may at the same moment be put() again by a save that
+hasn't committed yet. put() refreshes a blob's stored time, and
+release_unreferenced() only deletes blobs stored more than
+BLOB_RELEASE_GRACE seconds ago (default 3600); the ones it leaves are
+collected later by sweep_blobs.py.
+"""
+import glob
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from flask import Response, send_file
+from database import db, Blob
+
+NAME_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+KEY_RE = re.compile(r'^[0-9a-f]{64}$')
+BLOB_RELEASE_GRACE = float(os.environ.get('BLOB_RELEASE_GRACE', '3600'))
+
+
+def blob_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def variant_name(key, variant):
+    return f'{key}.{variant}'
+
+
+class BlobStore:
+    """Interface for image storage backends"""
+
+    def put(self, data):
+        """Store data and return its key"""
+        return self.put_named(blob_key(data), data)
+
+    def put_variant(self, key, variant, data):
+        """Store a derived image of key and return its name"""
+        return self.put_named(variant_name(key, variant), data)
+
+    def put_named(self, name, data):
+        raise NotImplementedError
+
+    def get(self, name):
+        """Return the bytes for a key or variant name, or None"""
+        raise NotImplementedError
+
+    def exists(self, name):
+        """True if a key or variant name is stored, without reading it"""
+        raise NotImplementedError
+
+    def delete(self, key, stored_before=None):
+        """
+        Delete key and all of its variants; returns False if it was kept.
+
+        With stored_before (a time.time() timestamp), a key put() since then
+        is kept.
+        """
+        raise NotImplementedError
+
+    def keys(self):
+        """Iterate over every stored key (not variants)"""
+        raise NotImplementedError
+
+    def response(self, name, mimetype='image/jpeg'):
+        """Flask response serving name, or None if it is missing"""
+        data = self.get(name)
+        if data is None:
+            return None
+        return Response(data, mimetype=mimetype)
+
+
+class FilesystemBlobStore(BlobStore):
+    """Blobs as files, sharded two levels deep by key prefix"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        if not NAME_RE.match(name):
+            raise ValueError(f"Invalid blob name: {name!r}")
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def put_named(self, name, data):
+        path = self.path(name)
+        try:
+            # Already stored: mark it as just stored, so a release in progress keeps it
+            os.utime(path)
+            return name
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return name
+
+    def get(self, name):
+        try:
+            with open(self.path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def delete(self, key, stored_before=None):
+        path = self.path(key)
+        if stored_before is not None:
+            # Moved aside before its time is checked: a put() from now on writes
+            # a fresh copy rather than refreshing the one being deleted
+            aside = f'{path}.{os.getpid()}-{threading.get_ident()}.releasing'
+            try:
+                os.rename(path, aside)
+            except FileNotFoundError:
+                return False
+            if os.path.getmtime(aside) >= stored_before:
+                os.replace(aside, path)
+                return False
+            os.remove(aside)
+        for p in [path] + glob.glob(glob.escape(path) + '.*'):
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+        return True
+
+    def keys(self):
+        for _, _, names in os.walk(self.root):
+            yield from (name for name in names if KEY_RE.match(name))
+
+    def response(self, name, mimetype='image/jpeg'):
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        # send_file hands the open file to the server's wsgi.file_wrapper (sendfile)
+        return send_file(path, mimetype=mimetype, etag=False)
+
+
+class DatabaseBlobStore(BlobStore):
+    """Blobs in their own table, away from the tags rows"""
+
+    def put_named(self, name, data):
+        # Already stored: mark it as just stored (created_at is the last put), so
+        # a release in progress keeps it; the row lock orders the two
+        stored = Blob.query.filter(Blob.key == name) \
+            .update({Blob.created_at: datetime.utcnow()}, synchronize_session=False)
+        if not stored:
+            db.session.add(Blob(key=name, data=data, size=len(data)))
+            db.session.flush()
+        return name
+
+    def get(self, name):
+        row = db.session.query(Blob.data).filter(Blob.key == name).first()
+        return row[0] if row else None
+
+    def exists(self, name):
+        return db.session.query(Blob.query.filter(Blob.key == name).exists()).scalar()
+
+    def delete(self, key, stored_before=None):
+        if stored_before is not None:
+            cutoff = datetime.utcfromtimestamp(stored_before)
+            stale = db.or_(Blob.created_at < cutoff, Blob.created_at.is_(None))
+            if not Blob.query.filter(Blob.key == key, stale).delete(synchronize_session=False):
+                return False
+        Blob.query.filter(db.or_(Blob.key == key, Blob.key.like(key + '.%'))) \
+            .delete(synchronize_session=False)
+        return True
+
+    def keys(self):
+        return [key for (key,) in db.session.query(Blob.key).filter(~Blob.key.like('%.%'))]
+
+
+def shares_storage(a, b):
+    """True if two stores keep their blobs in the same place"""
+    return type(a) is type(b) and getattr(a, 'root', None) == getattr(b, 'root', None)
+
+
+def unreferenced(keys, columns):
+    """The keys that no row refers to in any of columns"""
+    in_use = set()
+    for column in columns:
+        in_use.update(k for (k,) in db.session.query(column).filter(column.in_(keys)).distinct())
+    return keys - in_use
+
+
+def release_unreferenced(store, keys, columns, grace=BLOB_RELEASE_GRACE):
+    """
+    Delete the blobs for keys that no row refers to in any of columns (e.g.
+    Tag.image_key) and that weren't put() in the last grace seconds; commits.
+
+    Returns the number deleted; the recent ones are left for sweep_unreferenced().
+    """
+    keys = {k for k in keys if k}
+    if not keys:
+        return 0
+    stored_before = time.time() - grace
+    deleted = sum(store.delete(key, stored_before) for key in unreferenced(keys, columns))
+    db.session.commit()
+    return deleted
+
+
+def sweep_unreferenced(store, columns, grace=BLOB_RELEASE_GRACE, batch_size=500, dry_run=False):
+    """Delete every blob in store that release_unreferenced() would; returns (deleted, unreferenced)"""
+    keys = list(store.keys())
+    deleted = orphans = 0
+    for i in range(0, len(keys), batch_size):
+        batch = unreferenced(set(keys[i:i + batch_size]), columns)
+        orphans += len(batch)
+        if not dry_run:
+            deleted += release_unreferenced(store, batch, columns, grace)
+    return deleted, orphans
+
+
+def default_backend():
+    """db when DATABASE_URL is Postgres (Heroku: an ephemeral filesystem), otherwise fs"""
+    return 'db' if os.environ.get('DATABASE_URL', '').startswith(('postgres://', 'postgresql')) else 'fs'
+
+
+def get_blob_store(app, backend=None):
+    """Build the blob store selected by backend, else BLOB_STORE, else default_backend()"""
+    backend = backend or os.environ.get('BLOB_STORE') or default_backend()
+    return _blob_store(app, backend, 'BLOB_STORE_DIR', 'blobs')
+
+
+def get_archive_blob_store(app):
+    """Build the cold store for archived tags' images, selected by ARCHIVE_BLOB_STORE"""
+    backend = os.environ.get('ARCHIVE_BLOB_STORE') or os.environ.get('BLOB_STORE') or default_backend()
+    return _blob_store(app, backend, 'ARCHIVE_BLOB_STORE_DIR', 'archive-blobs')
+
+
+def _blob_store(app, backend, dir_variable, default_dir):
+    backend = backend.lower()
+    if backend == 'fs':
+        root = os.environ.get(dir_variable) or os.path.join(app.instance_path, default_dir)
+        return FilesystemBlobStore(root)
+    if backend == 'db':
+        return DatabaseBlobStore()
+    raise ValueError(f"Unknown blob store backend: {backend}")
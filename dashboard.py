@@ -0,0 +1,123 @@
+"""
+Due-date dashboard: overdue, due this week and due this month.
+
+One GROUP BY query over the tags due before the end of the month window
+(served by the return_date index) returns the count and price total (of
+Tag.price_cents) of each window per (folder, source). Those few rows are rolled up into
+totals, by-folder and by-source views; no tag rows are loaded.
+
+Windows: overdue is before today; this week is today to 6 days out; this
+month is today to 29 days out (so it includes this week).
+
+The result is cached in memory until a commit writes tags or folders
+(database.on_tags_committed), the date changes, or DASHBOARD_CACHE_TTL
+seconds pass. The TTL covers writes from other processes such as
+import_tags.py.
+
+Environment:
+    DASHBOARD_CACHE_TTL  seconds a computed dashboard is reused (default 300)
+"""
+import os
+import threading
+import time
+from datetime import date, timedelta
+from database import db, Tag, Folder
+
+WINDOWS = ('overdue', 'due_this_week', 'due_this_month')
+
+
+def window_conditions(today):
+    return {
+        'overdue': Tag.return_date < today,
+        'due_this_week': db.and_(Tag.return_date >= today, Tag.return_date < today + timedelta(days=7)),
+        'due_this_month': db.and_(Tag.return_date >= today, Tag.return_date < today + timedelta(days=30)),
+    }
+
+
+def empty_windows():
+    return {name: {'count': 0, 'value': 0.0} for name in WINDOWS}
+
+
+def add_windows(target, row_windows):
+    for name in WINDOWS:
+        target[name]['count'] += row_windows[name]['count']
+        target[name]['value'] += row_windows[name]['value']
+
+
+def round_values(entry):
+    for name in WINDOWS:
+        entry[name]['value'] = round(entry[name]['value'], 2)
+    return entry
+
+
+def compute_dashboard(today=None):
+    """Counts and price totals per due window: overall, by folder and by source"""
+    today = today or date.today()
+    conditions = window_conditions(today)
+
+    columns = []
+    for name in WINDOWS:
+        columns.append(db.func.sum(db.case((conditions[name], 1), else_=0)))
+        columns.append(db.func.sum(db.case((conditions[name], Tag.price_cents))))
+
+    rows = db.session.query(Tag.folder_id, Folder.name, Tag.source, *columns) \
+        .outerjoin(Folder, Tag.folder_id == Folder.id) \
+        .filter(Tag.return_date < today + timedelta(days=30)) \
+        .group_by(Tag.folder_id, Folder.name, Tag.source) \
+        .all()
+
+    totals = empty_windows()
+    by_folder = {}
+    by_source = {}
+    for folder_id, folder_name, source, *sums in rows:
+        row_windows = {
+            name: {'count': int(sums[2 * i] or 0), 'value': (sums[2 * i + 1] or 0) / 100}
+            for i, name in enumerate(WINDOWS)
+        }
+        add_windows(totals, row_windows)
+        folder = by_folder.setdefault(folder_id, dict(empty_windows(), folder_id=folder_id, folder_name=folder_name))
+        add_windows(folder, row_windows)
+        add_windows(by_source.setdefault(source, dict(empty_windows(), source=source)), row_windows)
+
+    def ordered(entries, label):
+        # Most overdue first
+        return sorted((round_values(e) for e in entries),
+                      key=lambda e: (-e['overdue']['count'], -e['due_this_week']['count'], e[label] or ''))
+
+    return {
+        'as_of': today.isoformat(),
+        'week_ends': (today + timedelta(days=6)).isoformat(),
+        'month_ends': (today + timedelta(days=29)).isoformat(),
+        'totals': round_values(totals),
+        'by_folder': ordered(by_folder.values(), 'folder_name'),
+        'by_source': ordered(by_source.values(), 'source')
+    }
+
+
+class DashboardCache:
+    """The last computed dashboard, dropped on tag writes, date change or TTL"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._value = None
+        self._computed_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(ttl=int(os.environ.get('DASHBOARD_CACHE_TTL', '300')))
+
+    def get(self):
+        """Return (dashboard, cached); computes it if missing or stale. Needs an app context."""
+        with self._lock:
+            value = self._value
+            if value and value['as_of'] == date.today().isoformat() \
+                    and time.time() - self._computed_at < self.ttl:
+                return value, True
+            value = compute_dashboard()
+            self._value, self._computed_at = value, time.time()
+            return value, False
+
+    def invalidate(self, changes=None):
+        with self._lock:
+            self._value = None
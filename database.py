@@ -1,9 +1,43 @@
+import itertools
 import os
+import re
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 db = SQLAlchemy()
 
+PRICE_RE = re.compile(r'^\$?(\d+)(?:\.(\d{1,2}))?$')
+
+def price_cents(price):
+    """A price as entered ("49.99", "$1,049.9", "12") in integer cents, or None if it isn't one"""
+    match = PRICE_RE.match(re.sub(r'[\s,]', '', price or ''))
+    if not match:
+        return None
+    dollars, cents = match.groups()
+    return int(dollars) * 100 + int((cents or '0').ljust(2, '0'))
+
+def lookup_key(value):
+    """Style or PO number reduced for duplicate matching: uppercased, letters and digits only"""
+    return re.sub(r'[^0-9A-Z]', '', (value or '').upper())
+
+def classify_source(price):
+    """Source implied by the price's cents (.95 = Inline, .99 = Factory), or None"""
+    cents = price_cents(price)
+    if cents is None:
+        return None
+    return {95: 'Inline (GAP)', 99: 'Gap Factory'}.get(cents % 100)
+
+def gap_link(style_number, source):
+    """Product page link for a style: gapfactory.com for Gap Factory, gap.com otherwise"""
+    if not style_number:
+        return ''
+    base_style = style_number.split('-')[0]
+    if source == 'Gap Factory':
+        return f"https://www.gapfactory.com/browse/product.do?pid={style_number.replace('-', '')}&searchText={base_style}&vid=1#pdp-page-content"
+    return f"https://www.gap.com/browse/product.do?pid={base_style}012&searchText={base_style}#pdp-page-content"
+
 class Folder(db.Model):
     """Model for organizing tags into folders/seasons"""
     __tablename__ = 'folders'
@@ -18,27 +52,90 @@ class Folder(db.Model):
     def __repr__(self):
         return f'<Folder {self.name}>'
     
-    def to_dict(self):
+    def to_dict(self, tag_count=None):
+        """Pass tag_count (e.g. from folder_summaries()) to skip the count query"""
+        if tag_count is None:
+            tag_count = Tag.query.filter_by(folder_id=self.id).count()
         return {
             'id': self.id,
             'name': self.name,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'tag_count': len(self.tags)
+            'tag_count': tag_count
+        }
+
+class TagFields:
+    """Properties and serialization shared by live and archived tags"""
+    
+    @property
+    def gap_link(self):
+        return gap_link(self.style_number, self.source)
+    
+    @property
+    def has_image(self):
+        """True if the tag has an image in the blob store (doesn't load the bytes)"""
+        return self.image_key is not None
+    
+    @property
+    def days_until_due(self):
+        """Calculate days until due (negative = overdue)"""
+        from datetime import date
+        delta = self.return_date - date.today()
+        return delta.days
+    
+    def field_getters(self):
+        return {
+            'id': lambda: self.id,
+            'style_number': lambda: self.style_number,
+            'description': lambda: self.description,
+            'po_number': lambda: self.po_number,
+            'scan_date': lambda: self.scan_date.isoformat() if self.scan_date else None,
+            'return_date': lambda: self.return_date.isoformat() if self.return_date else None,
+            'days_until_due': lambda: self.days_until_due,
+            'price': lambda: self.price,
+            'price_cents': lambda: self.price_cents,
+            'source': lambda: self.source,
+            'folder_id': lambda: self.folder_id,
+            'folder_name': lambda: self.folder.name if self.folder else None,
+            'raw_text': lambda: self.raw_text,
+            'created_at': lambda: self.created_at.isoformat() if self.created_at else None,
+            'updated_at': lambda: self.updated_at.isoformat() if self.updated_at else None
         }
+    
+    def to_dict(self, fields=None):
+        """Convert to dictionary for JSON serialization (optionally only `fields`)"""
+        getters = self.field_getters()
+        return {name: getters[name]() for name in (fields or getters)}
 
-class Tag(db.Model):
+class Tag(TagFields, db.Model):
     """Model for storing scanned clothing tags"""
     __tablename__ = 'tags'
+    __table_args__ = (
+        # Listings sort by (return_date, id), optionally within a folder
+        db.Index('ix_tags_folder_return', 'folder_id', 'return_date', 'id'),
+        db.Index('ix_tags_return_date', 'return_date', 'id'),
+        db.Index('ix_tags_style_number', 'style_number'),
+        db.Index('ix_tags_po_number', 'po_number'),
+        # Price range filters
+        db.Index('ix_tags_price_cents', 'price_cents'),
+        # Duplicate detection: one lookup per save, GROUP BY for the report
+        db.Index('ix_tags_style_po_key', 'style_key', 'po_key'),
+        # Delta sync reads changes in (updated_at, id) order
+        db.Index('ix_tags_updated', 'updated_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     style_number = db.Column(db.String(200), nullable=False)
     description = db.Column(db.String(500), nullable=False)
     po_number = db.Column(db.String(200), nullable=False)
+    style_key = db.Column(db.String(200), nullable=True)  # lookup_key(style_number)
+    po_key = db.Column(db.String(200), nullable=True)  # lookup_key(po_number)
     scan_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
     return_date = db.Column(db.Date, nullable=False)
     raw_text = db.Column(db.Text)
-    image_data = db.Column(db.LargeBinary)
+    image_data = db.deferred(db.Column(db.LargeBinary))  # legacy; new images live in the blob store
+    image_key = db.Column(db.String(64), nullable=True, index=True)  # SHA-256 of the image in the blob store
     price = db.Column(db.String(20), nullable=True)  # e.g. "49.99"
+    price_cents = db.Column(db.Integer, nullable=True)  # price_cents(price), kept in step by set_price_cents
     source = db.Column(db.String(50), nullable=True)  # "Inline (GAP)" or "Gap Factory"
     folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -47,31 +144,174 @@ class Tag(db.Model):
     def __repr__(self):
         return f'<Tag {self.style_number}: {self.description}>'
     
-    @property
-    def days_until_due(self):
-        """Calculate days until due (negative = overdue)"""
-        from datetime import date
-        delta = self.return_date - date.today()
-        return delta.days
+    @db.validates('price')
+    def set_price_cents(self, key, price):
+        # Bulk inserts/updates bypass this and set price_cents themselves
+        self.price_cents = price_cents(price)
+        return price
     
-    def to_dict(self):
-        """Convert to dictionary for JSON serialization"""
-        return {
-            'id': self.id,
-            'style_number': self.style_number,
-            'description': self.description,
-            'po_number': self.po_number,
-            'scan_date': self.scan_date.isoformat() if self.scan_date else None,
-            'return_date': self.return_date.isoformat() if self.return_date else None,
-            'days_until_due': self.days_until_due,
-            'price': self.price,
-            'source': self.source,
-            'folder_id': self.folder_id,
-            'folder_name': self.folder.name if self.folder else None,
-            'raw_text': self.raw_text,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
+    @db.validates('style_number', 'po_number')
+    def set_lookup_key(self, key, value):
+        # Likewise for style_key / po_key
+        setattr(self, 'style_key' if key == 'style_number' else 'po_key', lookup_key(value))
+        return value
+
+def folder_summaries():
+    """All folders with their tag counts as (folder, count) pairs, from one GROUP BY query"""
+    return db.session.query(Folder, db.func.count(Tag.id)) \
+        .outerjoin(Tag, Tag.folder_id == Folder.id) \
+        .group_by(Folder.id) \
+        .order_by(Folder.name.asc()) \
+        .all()
+
+# Callbacks run after a commit that wrote tags or folders
+_commit_listeners = []
+
+class TagChanges:
+    """What a transaction wrote, as far as listings are concerned"""
+
+    def __init__(self):
+        self.folder_ids = set()   # folders (None = General inbox) whose tags changed
+        self.all_folders = False  # a bulk statement changed tags in unknown folders
+        self.folders = False      # folders were created, renamed or deleted
+
+def on_tags_committed(callback):
+    """Call callback(changes) after every commit that inserted, updated or deleted tags or folders"""
+    _commit_listeners.append(callback)
+    return callback
+
+def _changes(session):
+    return session.info.setdefault('tag_changes', TagChanges())
+
+@event.listens_for(Session, 'after_flush')
+def _note_flushed_writes(session, flush_context):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Tag):
+            changes = _changes(session)
+            changes.folder_ids.add(obj.folder_id)
+            # The folder a moved tag left
+            changes.folder_ids.update(db.inspect(obj).attrs.folder_id.history.deleted)
+        elif isinstance(obj, Folder):
+            _changes(session).folders = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_writes(state):
+    # Bulk query.update()/.delete() and Core inserts don't go through the flush
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement, 'table', None)
+        if table is Tag.__table__:
+            _changes(state.session).all_folders = True
+        elif table is Folder.__table__:
+            _changes(state.session).folders = True
+
+@event.listens_for(Session, 'after_commit')
+def _notify_tag_writes(session):
+    changes = session.info.pop('tag_changes', None)
+    if changes:
+        for callback in _commit_listeners:
+            callback(changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_tag_writes(session):
+    session.info.pop('tag_changes', None)
+
+# Columns each to_dict() field needs, so projected queries can load only those
+TAG_FIELD_COLUMNS = {
+    'id': ['id'],
+    'style_number': ['style_number'],
+    'description': ['description'],
+    'po_number': ['po_number'],
+    'scan_date': ['scan_date'],
+    'return_date': ['return_date'],
+    'days_until_due': ['return_date'],
+    'price': ['price'],
+    'price_cents': ['price_cents'],
+    'source': ['source'],
+    'folder_id': ['folder_id'],
+    'folder_name': ['folder_id'],
+    'raw_text': ['raw_text'],
+    'created_at': ['created_at'],
+    'updated_at': ['updated_at']
+}
+ARCHIVED_FIELD_COLUMNS = dict(TAG_FIELD_COLUMNS, tag_id=['tag_id'], archived_at=['archived_at'])
+
+class Blob(db.Model):
+    """Image bytes for the database blob store backend, keyed by SHA-256"""
+    __tablename__ = 'blobs'
+    
+    key = db.Column(db.String(80), primary_key=True)  # sha256 hex, or "<sha256>.<variant>"
+    data = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Blob {self.key}>'
+
+class OcrCacheEntry(db.Model):
+    """Cached extraction result, keyed by a hash of the tag image"""
+    __tablename__ = 'ocr_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(80), nullable=False, unique=True)  # "sha256:<hex>" or "dhash:<hex>"
+    text = db.Column(db.Text, nullable=False)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<OcrCacheEntry {self.key}>'
+
+class TagTombstone(db.Model):
+    """A deleted tag, kept so offline clients syncing via /api/tags/changes can drop it"""
+    __tablename__ = 'tag_tombstones'
+    
+    id = db.Column(db.Integer, primary_key=True)  # sync cursors track this, in insert order
+    tag_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<TagTombstone {self.tag_id}>'
+
+class ArchivedTag(TagFields, db.Model):
+    """A settled tag moved out of tags by archive.py; its image is in the cold blob store"""
+    __tablename__ = 'archived_tags'
+    __table_args__ = (
+        db.Index('ix_archived_tags_return_date', 'return_date', 'id'),
+        db.Index('ix_archived_tags_folder_return', 'folder_id', 'return_date', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tag_id = db.Column(db.Integer, nullable=False, index=True)  # id it had in tags
+    style_number = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.String(500), nullable=False)
+    po_number = db.Column(db.String(200), nullable=False)
+    scan_date = db.Column(db.Date, nullable=False)
+    return_date = db.Column(db.Date, nullable=False)
+    raw_text = db.Column(db.Text)
+    image_key = db.Column(db.String(64), nullable=True, index=True)  # key in the archive blob store
+    price = db.Column(db.String(20), nullable=True)
+    price_cents = db.Column(db.Integer, nullable=True)
+    source = db.Column(db.String(50), nullable=True)
+    folder_id = db.Column(db.Integer, db.ForeignKey('folders.id'), nullable=True)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    folder = db.relationship('Folder')
+    
+    def __repr__(self):
+        return f'<ArchivedTag {self.style_number}: {self.description}>'
+    
+    def field_getters(self):
+        return dict(
+            super().field_getters(),
+            tag_id=lambda: self.tag_id,
+            archived_at=lambda: self.archived_at.isoformat() if self.archived_at else None
+        )
+
+# Columns archive.py copies from tags to archived_tags (image_key is replaced)
+ARCHIVED_COLUMNS = ['style_number', 'description', 'po_number', 'scan_date', 'return_date', 'raw_text',
+                    'price', 'price_cents', 'source', 'folder_id', 'created_at', 'updated_at']
 
 def init_db(app):
     """Initialize the database"""
@@ -87,6 +327,4 @@ def init_db(app):
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     db.init_app(app)
-    
-    with app.app_context():
-        db.create_all()
+    # Schema changes are applied by migrations.py, not on every boot
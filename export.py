@@ -0,0 +1,77 @@
+"""
+Server-side tag export (CSV, XLSX).
+
+Rows are read with a server-side cursor (yield_per) as plain column tuples,
+so memory stays flat however many tags are exported. CSV is streamed to the
+client as it is produced; XLSX is written in openpyxl's write-only mode to
+a spooled temp file and then sent.
+
+Archived tags export the same way: pass model=ArchivedTag with a query over
+archived_tags.
+"""
+import csv
+import io
+import tempfile
+from datetime import date
+from database import Tag, Folder, gap_link
+
+HEADER = ['Style Number', 'Description', 'PO Number', 'Price', 'Source', 'Scan Date',
+          'Return Date', 'Days Until Due', 'Folder', 'Gap Link']
+
+YIELD_PER = 1000
+
+
+def export_query(query, model=Tag):
+    """Column-tuple query over the tags selected by a Tag (or ArchivedTag) query's filters"""
+    return query.with_entities(
+        model.style_number, model.description, model.po_number, model.price, model.source,
+        model.scan_date, model.return_date, Folder.name
+    ).outerjoin(Folder, model.folder_id == Folder.id) \
+     .order_by(model.return_date.asc(), model.id.asc()) \
+     .yield_per(YIELD_PER)
+
+
+def export_rows(query, model=Tag):
+    """Yield one list per tag, in HEADER order"""
+    today = date.today()
+    for style_number, description, po_number, price, source, scan_date, return_date, folder_name in export_query(query, model):
+        yield [
+            style_number,
+            description,
+            po_number,
+            price or '',
+            source or '',
+            scan_date.isoformat() if scan_date else '',
+            return_date.isoformat() if return_date else '',
+            (return_date - today).days if return_date else '',
+            folder_name or '',
+            gap_link(style_number, source)
+        ]
+
+
+def iter_csv(query, chunk_rows=500, model=Tag):
+    """Yield CSV text in chunks of chunk_rows rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(HEADER)
+    for i, row in enumerate(export_rows(query, model), 1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx(query, model=Tag):
+    """Write an XLSX workbook to a temp file and return it, rewound"""
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Tags')
+    sheet.append(HEADER)
+    for row in export_rows(query, model):
+        sheet.append(row)
+    out = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    workbook.save(out)
+    out.seek(0)
+    return out
@@ -0,0 +1,525 @@
+"""
+Tag field extraction.
+
+Extraction returns typed fields - style_number, description, po_number and
+price (strings; '' when not read) - validated on the server by clean_fields().
+
+Reads go through a TieredExtractor: cheap local tiers named in
+EXTRACTOR_TIERS are tried first, in order, and the first result whose
+confidence reaches EXTRACTOR_MIN_CONFIDENCE is used. Otherwise the model
+backend (EXTRACTOR_BACKEND, always the last tier) reads the tag. Per-tier
+hit rates and latency are kept in memory (TieredExtractor.stats()).
+
+Model backends (EXTRACTOR_BACKEND):
+    anthropic  (default) - Claude vision, answering through a forced tool call
+                           so the fields come back as JSON
+    stub                 - the anthropic backend talking to StubAnthropicClient:
+                           the real request/tool-call handling with a canned
+                           answer after STUB_ANTHROPIC_LATENCY seconds
+                           (default 1.0); for benchmarks. STUB_ANTHROPIC_ERROR_RATE
+                           of calls fail with STUB_ANTHROPIC_ERROR_STATUS (default
+                           429, retry-after STUB_ANTHROPIC_RETRY_AFTER)
+    fake                 - canned response, no network; for local/offline testing
+
+Calls to the anthropic and stub backends go through a ModelGovernor
+(governor.py) when one is passed in: concurrency and rate limits, retries
+and a circuit breaker.
+
+Local tiers (EXTRACTOR_TIERS, comma-separated; default none):
+    barcode  - decode barcodes with pyzbar and match known tag layouts
+    ocr      - local OCR with pytesseract, then the same layout regexes
+    fake     - canned fields, a confident read FAKE_LOCAL_HIT_RATE of the time
+               (default 1.0); exercises the fallback offline
+A local tier whose library isn't installed is skipped with a warning.
+"""
+import base64
+import io
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import namedtuple
+from types import SimpleNamespace
+from metrics import Counter, Histogram
+
+log = logging.getLogger(__name__)
+
+MODEL = "claude-sonnet-4-20250514"
+
+# Output budget for the tool call; four short fields need well under this
+MAX_TOKENS = int(os.environ.get('EXTRACT_MAX_TOKENS', '256'))
+
+# Rough input cost of a call besides the image (prompt and tool schema), and
+# the most an image can cost, for the governor's token budget
+PROMPT_TOKENS = 500
+IMAGE_TOKEN_CAP = 1600
+
+FIELDS = ('style_number', 'description', 'po_number', 'price')
+REQUIRED_FIELDS = ('style_number', 'description', 'po_number')
+
+PROMPT = "This is a clothing tag label. Record the style number, description, PO number and price exactly as printed on it using the record_tag tool. The price is often at the bottom of the tag. Use an empty string for anything you cannot read."
+
+TAG_TOOL = {
+    "name": "record_tag",
+    "description": "Record the fields read from a clothing tag label.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "style_number": {"type": "string", "description": "Style/item number, e.g. 123456-00"},
+            "description": {"type": "string", "description": "Product description"},
+            "po_number": {"type": "string", "description": "PO/order number"},
+            "price": {"type": "string", "description": "Price without the dollar sign, e.g. 29.95; empty if not shown"}
+        },
+        "required": list(FIELDS)
+    }
+}
+
+FAKE_RESPONSE = "Style Number: 123456-00\nDescription: FAKE TEE SHIRT\nPO Number: 0000000\nPrice: $29.95"
+
+PRICE_RE = re.compile(r'\d{1,5}(\.\d{1,2})?')
+
+# Labelled text, as older clients and cache entries have it
+LABELLED_RE = {
+    'style_number': re.compile(r'Style Number:\s*(.+?)(?:\n|$)', re.I),
+    'description': re.compile(r'Description:\s*(.+?)(?:\n|$)', re.I),
+    'po_number': re.compile(r'PO Number:\s*(.+?)(?:\n|$)', re.I),
+    'price': re.compile(r'Price:\s*\$?([\d.,]+|N/A)(?:\n|$)', re.I),
+}
+
+# Printed tag layout, for the local tiers
+LAYOUT_RE = {
+    'style_number': re.compile(r'\b(\d{6}-\d{2,3})\b'),
+    'po_number': re.compile(r'\bP\.?\s?O\.?\s*(?:#|NO\.?|NUMBER)?\s*:?\s*(\d{5,10})\b', re.I),
+    'price': re.compile(r'\$\s?(\d{1,4}\.\d{2})\b'),
+}
+DESCRIPTION_LINE_RE = re.compile(r"^[A-Z][A-Z&'/-]*(?: [A-Z&'/-]+)+$")
+
+Extraction = namedtuple('Extraction', 'fields tier confidence')
+
+MODEL_LATENCY = Histogram('model_call_duration_seconds', 'Anthropic API call latency',
+                          ['model', 'outcome'], buckets=(0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60))
+MODEL_CALLS = Counter('model_calls_total', 'Anthropic API calls by outcome (ok or the error type)',
+                      ['model', 'outcome'])
+MODEL_TOKENS = Counter('model_tokens_total', 'Anthropic tokens used', ['model', 'direction'])
+TIER_LATENCY = Histogram('extraction_tier_duration_seconds', 'Time spent in each extraction tier',
+                         ['tier', 'result'])
+
+
+class ExtractionError(Exception):
+    """Raised when a backend answers without usable tag fields"""
+
+
+def clean_fields(raw):
+    """Validate and normalize extracted fields: every field a stripped string, price digits only"""
+    fields = {}
+    for name in FIELDS:
+        value = raw.get(name) if isinstance(raw, dict) else None
+        fields[name] = re.sub(r'\s+', ' ', str(value)).strip() if value is not None else ''
+    price = fields['price'].lstrip('$').replace(',', '').strip()
+    fields['price'] = price if PRICE_RE.fullmatch(price) else ''
+    return fields
+
+
+def confidence(fields):
+    """Share of the required fields that were read"""
+    return sum(1 for name in REQUIRED_FIELDS if fields.get(name)) / len(REQUIRED_FIELDS)
+
+
+def parse_labelled_text(text):
+    """Fields from "Style Number: ... / Description: ..." text"""
+    raw = {}
+    for name, pattern in LABELLED_RE.items():
+        match = pattern.search(text or '')
+        raw[name] = match.group(1) if match else ''
+    return clean_fields(raw)
+
+
+def format_labelled_text(fields):
+    """Inverse of parse_labelled_text (the format older scanner pages read)"""
+    return (f"Style Number: {fields['style_number']}\nDescription: {fields['description']}\n"
+            f"PO Number: {fields['po_number']}\nPrice: {'$' + fields['price'] if fields['price'] else 'N/A'}")
+
+
+def fields_from_cache(text):
+    """Fields from an extraction cache entry: JSON, or labelled text from before structured extraction"""
+    try:
+        return clean_fields(json.loads(text))
+    except ValueError:
+        return parse_labelled_text(text)
+
+
+def parse_tag_layout(text):
+    """Fields from raw text printed on a tag (local OCR or barcode payloads)"""
+    raw = {}
+    for name, pattern in LAYOUT_RE.items():
+        match = pattern.search(text)
+        raw[name] = match.group(1) if match else ''
+    # The description is the first line of two or more all-caps words
+    for line in text.splitlines():
+        line = line.strip()
+        if DESCRIPTION_LINE_RE.match(line):
+            raw['description'] = line
+            break
+    return clean_fields(raw)
+
+
+class AnthropicExtractor:
+    """Read tag fields with Claude through a forced tool call"""
+
+    name = 'anthropic'
+
+    def __init__(self, api_key=None, model=MODEL, max_tokens=MAX_TOKENS, client=None, governor=None):
+        if client is None:
+            from anthropic import Anthropic
+            # Retries are the governor's job when there is one
+            client = Anthropic(api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"),
+                               **({'max_retries': 0} if governor else {}))
+        self.client = client
+        self.model = model
+        self.max_tokens = max_tokens
+        self.governor = governor
+
+    def read(self, image_bytes, media_type='image/jpeg'):
+        started = time.perf_counter()
+        try:
+            if self.governor:
+                message = self.governor.call(lambda: self._create(image_bytes, media_type),
+                                             tokens=self.estimate_tokens(image_bytes),
+                                             usage=lambda m: m.usage.input_tokens + m.usage.output_tokens)
+            else:
+                message = self._create(image_bytes, media_type)
+        except Exception as e:
+            MODEL_LATENCY.observe(time.perf_counter() - started, model=self.model, outcome='error')
+            MODEL_CALLS.inc(model=self.model, outcome=type(e).__name__)
+            raise
+        MODEL_LATENCY.observe(time.perf_counter() - started, model=self.model, outcome='ok')
+        MODEL_CALLS.inc(model=self.model, outcome='ok')
+        return self.fields_from_message(message)
+
+    def fields_from_message(self, message):
+        """Tag fields from the record_tag tool call in a response; records token usage"""
+        usage = getattr(message, 'usage', None)
+        if usage:
+            MODEL_TOKENS.inc(usage.input_tokens, model=self.model, direction='input')
+            MODEL_TOKENS.inc(usage.output_tokens, model=self.model, direction='output')
+
+        for block in message.content:
+            if block.type == 'tool_use' and block.name == TAG_TOOL['name']:
+                return clean_fields(block.input)
+        raise ExtractionError(f"Model did not return tag fields (stop reason: {message.stop_reason})")
+
+    def estimate_tokens(self, image_bytes):
+        """Upper estimate of a call's tokens, for the governor's rate limit"""
+        try:
+            from PIL import Image
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                width, height = image.size
+            # The API bills about width * height / 750 per image, scaling big ones down to ~1600
+            image_tokens = min(width * height // 750, IMAGE_TOKEN_CAP)
+        except Exception:
+            image_tokens = IMAGE_TOKEN_CAP
+        return image_tokens + PROMPT_TOKENS + self.max_tokens
+
+    def request_params(self, image_bytes, media_type):
+        """Arguments of the messages.create() call that reads one tag"""
+        return dict(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            tools=[TAG_TOOL],
+            tool_choice={"type": "tool", "name": TAG_TOOL["name"]},
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": media_type,
+                                "data": base64.b64encode(image_bytes).decode('ascii'),
+                            },
+                        },
+                        {
+                            "type": "text",
+                            "text": PROMPT
+                        }
+                    ],
+                }
+            ],
+        )
+
+    def _create(self, image_bytes, media_type):
+        return self.client.messages.create(**self.request_params(image_bytes, media_type))
+
+    # Message Batches: many reads in one asynchronous submission, at a lower
+    # price, for bulk work (see reextract.py)
+
+    @property
+    def supports_batches(self):
+        return hasattr(self.client.messages, 'batches')
+
+    def submit_batch(self, items):
+        """Submit [(custom_id, image_bytes, media_type), ...] as one batch; returns the batch id"""
+        requests = [{'custom_id': custom_id, 'params': self.request_params(image_bytes, media_type)}
+                    for custom_id, image_bytes, media_type in items]
+        create = lambda: self.client.messages.batches.create(requests=requests)
+        batch = self.governor.call(create) if self.governor else create()
+        return batch.id
+
+    def batch_ended(self, batch_id):
+        return self.client.messages.batches.retrieve(batch_id).processing_status == 'ended'
+
+    def batch_results(self, batch_id):
+        """Yield (custom_id, fields, error) for each request of an ended batch"""
+        for entry in self.client.messages.batches.results(batch_id):
+            result = entry.result
+            if result.type != 'succeeded':
+                error = getattr(getattr(result, 'error', None), 'error', None)
+                yield entry.custom_id, None, f"{result.type}: {getattr(error, 'message', '') or result.type}"
+                continue
+            try:
+                yield entry.custom_id, self.fields_from_message(result.message), None
+            except ExtractionError as e:
+                yield entry.custom_id, None, str(e)
+
+
+class StubAPIError(Exception):
+    """Shaped like the anthropic SDK's APIStatusError: status_code and response.headers"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"Error code: {status_code} (stub)")
+        self.status_code = status_code
+        headers = {'retry-after': str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+
+class StubAnthropicClient:
+    """
+    Stands in for anthropic.Anthropic: messages.create() sleeps for the
+    configured latency (plus up to `jitter` seconds) and answers with a
+    record_tag tool call.
+
+    error_rate of the calls fail instead, with error_status (429 by default,
+    carrying a retry-after of retry_after seconds), to exercise the governor.
+    messages.batches mimics the Message Batches API for reextract.py.
+    """
+
+    def __init__(self, latency=1.0, jitter=0.0, response=FAKE_RESPONSE, error_rate=0.0,
+                 error_status=429, retry_after=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.fields = parse_labelled_text(response)
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self._batches = {}
+        self.messages = SimpleNamespace(
+            create=self._create,
+            batches=SimpleNamespace(create=self._create_batch, retrieve=self._retrieve_batch,
+                                    results=self._batch_results)
+        )
+
+    def _create(self, model, max_tokens, messages, tools=None, tool_choice=None, **kwargs):
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubAPIError(self.error_status, self.retry_after)
+        return self._message(model, messages)
+
+    def _message(self, model, messages):
+        image = messages[0]['content'][0]['source']['data']
+        return SimpleNamespace(
+            id='msg_stub',
+            model=model,
+            stop_reason='tool_use',
+            content=[SimpleNamespace(type='tool_use', id='toolu_stub', name=TAG_TOOL['name'],
+                                     input=dict(self.fields))],
+            # Roughly what a tag photo and the tool answer cost
+            usage=SimpleNamespace(input_tokens=len(image) // 1000 + 400, output_tokens=60)
+        )
+
+    # A batch "ends" one latency after it is created; error_rate of its requests error
+
+    def _create_batch(self, requests):
+        batch_id = f"msgbatch_stub_{len(self._batches) + 1}"
+        self._batches[batch_id] = (time.time() + self.latency, requests)
+        return self._retrieve_batch(batch_id)
+
+    def _retrieve_batch(self, batch_id):
+        ends_at, requests = self._batches[batch_id]
+        return SimpleNamespace(id=batch_id, processing_status='ended' if time.time() >= ends_at else 'in_progress',
+                               request_counts=SimpleNamespace(processing=0, succeeded=len(requests)))
+
+    def _batch_results(self, batch_id):
+        _, requests = self._batches[batch_id]
+        for request in requests:
+            if self.error_rate and random.random() < self.error_rate:
+                result = SimpleNamespace(type='errored', error=SimpleNamespace(
+                    type='error', error=SimpleNamespace(type='overloaded_error', message='Overloaded (stub)')))
+            else:
+                params = request['params']
+                result = SimpleNamespace(type='succeeded', message=self._message(params['model'], params['messages']))
+            yield SimpleNamespace(custom_id=request['custom_id'], result=result)
+
+
+class FakeExtractor:
+    """Offline model backend that returns a fixed response after an optional delay"""
+
+    name = 'fake'
+
+    def __init__(self, delay=0.0, response=FAKE_RESPONSE):
+        self.delay = delay
+        self.fields = parse_labelled_text(response)
+
+    def read(self, image_bytes, media_type='image/jpeg'):
+        if self.delay:
+            time.sleep(self.delay)
+        return dict(self.fields)
+
+
+class FakeLocalTier:
+    """Offline local tier: the fake fields, confidently read hit_rate of the time"""
+
+    name = 'fake-local'
+
+    def __init__(self, hit_rate=1.0, response=FAKE_RESPONSE):
+        self.hit_rate = hit_rate
+        self.fields = parse_labelled_text(response)
+
+    def read(self, image_bytes, media_type='image/jpeg'):
+        if random.random() < self.hit_rate:
+            return dict(self.fields)
+        return dict(self.fields, description='')
+
+
+class BarcodeTier:
+    """Decode barcodes/QR codes on the tag and match known layouts (needs pyzbar)"""
+
+    name = 'barcode'
+
+    def __init__(self):
+        from pyzbar import pyzbar
+        self._decode = pyzbar.decode
+
+    def read(self, image_bytes, media_type='image/jpeg'):
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            payloads = [b.data.decode('utf-8', 'replace') for b in self._decode(image)]
+        return parse_tag_layout('\n'.join(payloads))
+
+
+class LocalOcrTier:
+    """Local OCR with Tesseract, then the tag layout regexes (needs pytesseract)"""
+
+    name = 'ocr'
+
+    def __init__(self):
+        import pytesseract
+        self._ocr = pytesseract.image_to_string
+
+    def read(self, image_bytes, media_type='image/jpeg'):
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return parse_tag_layout(self._ocr(image.convert('L')))
+
+
+class TieredExtractor:
+    """
+    Try each tier in order; the first read at or above min_confidence wins.
+
+    The last tier (the model) is always accepted. A local tier that raises
+    is counted as an error and skipped.
+    """
+
+    def __init__(self, tiers, min_confidence=1.0):
+        self.tiers = tiers
+        self.min_confidence = min_confidence
+        self._stats = {t.name: {'calls': 0, 'accepted': 0, 'errors': 0, 'seconds': 0.0} for t in tiers}
+        self._lock = threading.Lock()
+
+    def extract(self, image_bytes, media_type='image/jpeg'):
+        """Return an Extraction(fields, tier, confidence)"""
+        for i, tier in enumerate(self.tiers):
+            last = i == len(self.tiers) - 1
+            started = time.perf_counter()
+            try:
+                fields = tier.read(image_bytes, media_type)
+            except Exception:
+                self._record(tier.name, started, error=True)
+                if last:
+                    raise
+                continue
+            score = confidence(fields)
+            accepted = last or score >= self.min_confidence
+            self._record(tier.name, started, accepted=accepted)
+            if accepted:
+                return Extraction(fields, tier.name, score)
+
+    def _record(self, name, started, accepted=False, error=False):
+        TIER_LATENCY.observe(time.perf_counter() - started, tier=name,
+                             result='error' if error else 'accepted' if accepted else 'low_confidence')
+        with self._lock:
+            s = self._stats[name]
+            s['calls'] += 1
+            s['accepted'] += accepted
+            s['errors'] += error
+            s['seconds'] += time.perf_counter() - started
+
+    def stats(self):
+        """Per-tier calls, hit rate (accepted / calls) and mean latency"""
+        with self._lock:
+            return {
+                name: {
+                    'calls': s['calls'],
+                    'accepted': s['accepted'],
+                    'errors': s['errors'],
+                    'hit_rate': round(s['accepted'] / s['calls'], 3) if s['calls'] else None,
+                    'avg_ms': round(s['seconds'] * 1000 / s['calls'], 1) if s['calls'] else None
+                }
+                for name, s in self._stats.items()
+            }
+
+
+def get_model_backend(governor=None):
+    backend = os.environ.get('EXTRACTOR_BACKEND', 'anthropic').lower()
+    if backend == 'fake':
+        return FakeExtractor(
+            delay=float(os.environ.get('FAKE_EXTRACTOR_DELAY', '0')),
+            response=os.environ.get('FAKE_EXTRACTOR_RESPONSE', FAKE_RESPONSE)
+        )
+    if backend == 'stub':
+        retry_after = os.environ.get('STUB_ANTHROPIC_RETRY_AFTER')
+        return AnthropicExtractor(client=StubAnthropicClient(
+            latency=float(os.environ.get('STUB_ANTHROPIC_LATENCY', '1.0')),
+            jitter=float(os.environ.get('STUB_ANTHROPIC_JITTER', '0')),
+            response=os.environ.get('FAKE_EXTRACTOR_RESPONSE', FAKE_RESPONSE),
+            error_rate=float(os.environ.get('STUB_ANTHROPIC_ERROR_RATE', '0')),
+            error_status=int(os.environ.get('STUB_ANTHROPIC_ERROR_STATUS', '429')),
+            retry_after=float(retry_after) if retry_after else None
+        ), governor=governor)
+    if backend == 'anthropic':
+        return AnthropicExtractor(governor=governor)
+    raise ValueError(f"Unknown EXTRACTOR_BACKEND: {backend}")
+
+
+LOCAL_TIERS = {
+    'barcode': BarcodeTier,
+    'ocr': LocalOcrTier,
+    'fake': lambda: FakeLocalTier(hit_rate=float(os.environ.get('FAKE_LOCAL_HIT_RATE', '1.0'))),
+}
+
+
+def get_extractor(governor=None):
+    """Build the tiered extractor from EXTRACTOR_TIERS and EXTRACTOR_BACKEND; model calls go through governor"""
+    tiers = []
+    for name in filter(None, (n.strip().lower() for n in os.environ.get('EXTRACTOR_TIERS', '').split(','))):
+        if name not in LOCAL_TIERS:
+            raise ValueError(f"Unknown extractor tier: {name}")
+        try:
+            tiers.append(LOCAL_TIERS[name]())
+        except ImportError as e:
+            log.warning("Extractor tier '%s' disabled: %s", name, e)
+    tiers.append(get_model_backend(governor))
+    return TieredExtractor(tiers, min_confidence=float(os.environ.get('EXTRACTOR_MIN_CONFIDENCE', '1.0')))
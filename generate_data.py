@@ -0,0 +1,134 @@
+"""
+Synthetic data for benchmarks: N folders and M tags, with images.
+
+Fills the database named by DATABASE_URL (SQLite or PostgreSQL) and the
+configured blob store. Images are drawn from a pool of --image-pool distinct
+generated JPEGs (longest edge --image-dim pixels), each stored once with
+its thumbnail, so large tag counts don't need gigabytes of images.
+
+Usage:
+    python generate_data.py [--folders N] [--tags M] [--image-dim PX] [--image-pool K]
+                            [--image-share F] [--general-share F] [--seed S] [--yes]
+"""
+import argparse
+import io
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from flask import Flask
+from PIL import Image
+import imaging
+from blobstore import get_blob_store
+from database import db, Folder, Tag, classify_source, init_db, lookup_key, price_cents
+from import_tags import COPY_COLUMNS, ensure_folders, insert_batch
+from migrations import run_migrations
+
+BATCH_SIZE = 5000
+
+WORDS = ['KNIT', 'POLO', 'SHIRT', 'TEE', 'CREW', 'V-NECK', 'DENIM', 'JACKET', 'SLIM', 'FIT', 'JEAN',
+         'CHINO', 'SHORT', 'HOODIE', 'FLEECE', 'STRIPED', 'LINEN', 'OXFORD', 'CARGO', 'PANT', 'DRESS',
+         'MIDI', 'SKIRT', 'CARDIGAN', 'SWEATER', 'WAFFLE', 'HENLEY', 'PUFFER', 'VEST', 'LOGO']
+PRICES = ['9.95', '14.99', '19.95', '24.99', '29.95', '34.99', '39.95', '49.99', '59.95', '79.99', '12.00', None]
+
+COLUMNS = COPY_COLUMNS + ['image_key']
+
+
+def make_image(rng, dim):
+    """A tag-photo-sized JPEG with enough texture to compress like a real one"""
+    size = (dim, dim * 3 // 4)
+    noise = Image.effect_noise((size[0] // 8, size[1] // 8), 48).resize(size, Image.BILINEAR)
+    tint = Image.new('RGB', size, tuple(rng.randrange(120, 255) for _ in range(3)))
+    image = Image.blend(tint, noise.convert('RGB'), 0.35)
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=imaging.STORAGE.quality)
+    return out.getvalue()
+
+
+def store_images(store, rng, count, dim):
+    keys, total = [], 0
+    for _ in range(count):
+        data = make_image(rng, dim)
+        key = store.put(data)
+        thumb, _ = imaging.normalize(data, imaging.THUMBNAIL)
+        store.put_variant(key, 'thumb', thumb)
+        keys.append(key)
+        total += len(data)
+    return keys, total
+
+
+def make_row(rng, folder_ids, image_keys, args, now):
+    scan_date = date.today() - timedelta(days=rng.randrange(60))
+    price = rng.choice(PRICES)
+    style_number = f"{rng.randrange(100000, 999999)}-{rng.randrange(100):02d}"
+    description = ' '.join(rng.sample(WORDS, rng.randrange(2, 5)))
+    po_number = str(rng.randrange(1000000, 9999999))
+    return {
+        'style_number': style_number,
+        'description': description,
+        'po_number': po_number,
+        'style_key': lookup_key(style_number),
+        'po_key': lookup_key(po_number),
+        'scan_date': scan_date,
+        'return_date': scan_date + timedelta(days=30),
+        'raw_text': f"Style Number: {style_number}\nDescription: {description}\nPO Number: {po_number}",
+        'price': price,
+        'price_cents': price_cents(price),
+        'source': classify_source(price) if price else None,
+        'folder_id': None if rng.random() < args.general_share else rng.choice(folder_ids),
+        'image_key': rng.choice(image_keys) if image_keys and rng.random() < args.image_share else None,
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def generate(app, args):
+    rng = random.Random(args.seed)
+    store = get_blob_store(app)
+    started = time.perf_counter()
+
+    run_migrations(app)
+    with app.app_context():
+        image_keys, image_bytes = store_images(store, rng, args.image_pool, args.image_dim) \
+            if args.image_share > 0 else ([], 0)
+        print(f"  {len(image_keys)} images stored ({image_bytes / max(len(image_keys), 1) / 1024:.0f} KB each)")
+
+        names = [f"Bench folder {i + 1:03d}" for i in range(args.folders)]
+        folder_ids = {name: fid for fid, name in db.session.query(Folder.id, Folder.name)}
+        ensure_folders(set(names), folder_ids)
+        db.session.commit()
+        ids = [folder_ids[n] for n in names]
+
+        now = datetime.utcnow()
+        for offset in range(0, args.tags, BATCH_SIZE):
+            rows = [make_row(rng, ids, image_keys, args, now)
+                    for _ in range(min(BATCH_SIZE, args.tags - offset))]
+            insert_batch(rows, COLUMNS)
+            db.session.commit()
+            print(f"  {offset + len(rows)} tags inserted")
+
+        total = db.session.query(db.func.count(Tag.id)).scalar()
+    print(f"\n✅ Generated {args.tags} tags in {args.folders} folders in "
+          f"{time.perf_counter() - started:.1f}s ({total} tags in the database)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill the database with synthetic tags for benchmarking')
+    parser.add_argument('--folders', type=int, default=20)
+    parser.add_argument('--tags', type=int, default=10000)
+    parser.add_argument('--image-dim', type=int, default=imaging.STORAGE.max_dim,
+                        help='longest edge of generated images, in pixels')
+    parser.add_argument('--image-pool', type=int, default=50, help='distinct images to generate')
+    parser.add_argument('--image-share', type=float, default=1.0, help='fraction of tags with an image')
+    parser.add_argument('--general-share', type=float, default=0.1, help='fraction of tags in the General Inbox')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    init_db(app)
+    print(f"🗄️  Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    if not args.yes and input(f"Add {args.tags} synthetic tags? (yes/no): ").lower() != 'yes':
+        print("Cancelled.")
+        sys.exit(0)
+    generate(app, args)
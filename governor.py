@@ -0,0 +1,294 @@
+"""
+Governor for model API calls: concurrency cap, rate limits, retries and a
+circuit breaker, shared by every call the process makes.
+
+ModelGovernor.call(fn, tokens) runs fn():
+    - at most GOVERNOR_MAX_IN_FLIGHT calls run at once; the rest wait their turn
+    - token buckets hold calls to GOVERNOR_REQUESTS_PER_MINUTE and
+      GOVERNOR_TOKENS_PER_MINUTE (tokens are estimated up front and corrected
+      from the response's usage); a call is paced before it takes a slot,
+      and charged once however many times it is retried
+    - retryable failures (429, 408, 409, 5xx, 529 overloaded, timeouts and
+      connection errors) are retried up to GOVERNOR_MAX_RETRIES times with
+      full-jitter exponential backoff, never sooner than the server's
+      retry-after
+    - GOVERNOR_FAILURE_THRESHOLD retryable failures in a row open the
+      circuit. While it is open calls don't reach the API: they queue for
+      up to GOVERNOR_QUEUE_TIMEOUT seconds for it to close, or fail fast
+      with ModelUnavailable. After GOVERNOR_RESET_TIMEOUT seconds one probe
+      call is let through; its success closes the circuit.
+
+Errors are recognised by status_code / response.headers, as the anthropic
+SDK raises them, so the governor works against the real API, a local fake
+server (ANTHROPIC_BASE_URL) or extraction.StubAnthropicClient with
+STUB_ANTHROPIC_ERROR_RATE.
+
+Environment:
+    GOVERNOR_MAX_IN_FLIGHT       concurrent model calls (default 4)
+    GOVERNOR_REQUESTS_PER_MINUTE request rate limit (default 50; 0 = none)
+    GOVERNOR_TOKENS_PER_MINUTE   input + output token rate limit (default 40000; 0 = none)
+    GOVERNOR_MAX_RETRIES         retries of a retryable failure (default 4)
+    GOVERNOR_BACKOFF_BASE        first backoff ceiling in seconds, doubling per retry (default 1)
+    GOVERNOR_BACKOFF_MAX         backoff ceiling in seconds (default 30)
+    GOVERNOR_FAILURE_THRESHOLD   consecutive failures that open the circuit (default 5)
+    GOVERNOR_RESET_TIMEOUT       seconds the circuit stays open before a probe (default 30)
+    GOVERNOR_QUEUE_TIMEOUT       seconds a call waits for a slot or an open circuit (default 60)
+"""
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from metrics import Counter
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = ('APITimeoutError', 'APIConnectionError')
+
+MODEL_RETRIES = Counter('model_call_retries_total', 'Model calls retried by the governor', ['reason'])
+MODEL_REJECTED = Counter('model_calls_rejected_total', 'Model calls the governor gave up on or refused', ['reason'])
+
+
+class ModelUnavailable(Exception):
+    """The model API is overloaded or down; try again after retry_after seconds"""
+
+    retryable = True
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_retryable(error):
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (retry-after-ms / retry-after header), or None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        value = headers.get('retry-after')
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills at `per_minute` a minute, holding at most one minute's worth"""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount):
+        """Take amount now (the level may go negative); returns seconds to wait before using it"""
+        self._refill()
+        self.level -= min(amount, self.capacity)
+        return -self.level / self.rate if self.level < 0 else 0.0
+
+    def give_back(self, amount):
+        """Correct an earlier take (negative to charge more)"""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class ModelGovernor:
+    """Bounds, paces and retries model calls, and stops calling a failing API for a while"""
+
+    def __init__(self, max_in_flight=4, requests_per_minute=50, tokens_per_minute=40000, max_retries=4,
+                 backoff_base=1.0, backoff_max=30.0, failure_threshold=5, reset_timeout=30.0,
+                 queue_timeout=60.0, clock=time.monotonic, sleep=time.sleep):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.queue_timeout = queue_timeout
+        self._clock = clock
+        self._sleep = sleep
+        self._requests = TokenBucket(requests_per_minute, clock) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute, clock) if tokens_per_minute else None
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._waiting = 0
+        self._state = 'closed'
+        self._failures = 0       # consecutive retryable failures
+        self._opened_at = None
+        self._probing = False    # a half-open probe is in flight
+        self._stats = {'calls': 0, 'succeeded': 0, 'failed': 0, 'retries': 0, 'rejected': 0,
+                       'throttled_seconds': 0.0, 'circuit_opened': 0}
+
+    @classmethod
+    def from_env(cls):
+        env = os.environ.get
+        return cls(
+            max_in_flight=int(env('GOVERNOR_MAX_IN_FLIGHT', '4')),
+            requests_per_minute=float(env('GOVERNOR_REQUESTS_PER_MINUTE', '50')),
+            tokens_per_minute=float(env('GOVERNOR_TOKENS_PER_MINUTE', '40000')),
+            max_retries=int(env('GOVERNOR_MAX_RETRIES', '4')),
+            backoff_base=float(env('GOVERNOR_BACKOFF_BASE', '1')),
+            backoff_max=float(env('GOVERNOR_BACKOFF_MAX', '30')),
+            failure_threshold=int(env('GOVERNOR_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(env('GOVERNOR_RESET_TIMEOUT', '30')),
+            queue_timeout=float(env('GOVERNOR_QUEUE_TIMEOUT', '60'))
+        )
+
+    def call(self, fn, tokens=0, usage=None):
+        """
+        Run fn() under the governor and return its result.
+
+        tokens is the call's estimated input + output tokens; usage(result),
+        if given, returns the tokens it really used. Raises ModelUnavailable
+        when the circuit is open past the queue timeout or retries run out;
+        non-retryable errors from fn are raised unchanged.
+        """
+        deadline = self._clock() + self.queue_timeout
+        with self._lock:
+            self._stats['calls'] += 1
+        # Paced before taking a slot, so a call waiting on the rate limit doesn't
+        # keep a slot (or the half-open probe) from anyone else. Charged once:
+        # retries of a throttled call don't take budget from other callers
+        self._throttle(tokens)
+        attempt = 0
+        while True:
+            try:
+                probe = self._acquire(deadline)
+            except ModelUnavailable:
+                if not attempt:
+                    self._refund(tokens)
+                raise
+            try:
+                result = fn()
+            except Exception as e:
+                self._release(probe, success=False if is_retryable(e) else None)
+                if not is_retryable(e):
+                    self._count('failed')
+                    raise
+                wait = self._backoff(attempt, retry_after(e))
+                if attempt >= self.max_retries:
+                    self._count('failed')
+                    MODEL_REJECTED.inc(reason='retries_exhausted')
+                    raise ModelUnavailable(f"Model API unavailable after {attempt + 1} attempts: {e}",
+                                           retry_after=wait) from e
+                attempt += 1
+                self._count('retries')
+                MODEL_RETRIES.inc(reason=str(getattr(e, 'status_code', None) or type(e).__name__))
+                self._sleep(wait)
+                continue
+            self._release(probe, success=True)
+            self._count('succeeded')
+            if usage and self._tokens:
+                with self._lock:
+                    self._tokens.give_back(tokens - usage(result))
+            return result
+
+    def _backoff(self, attempt, server_wait):
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return max(random.uniform(0, ceiling), server_wait or 0.0)
+
+    def _acquire(self, deadline):
+        """Wait for a slot and a closed (or probing) circuit; returns True if this call is the probe"""
+        with self._changed:
+            self._waiting += 1
+            try:
+                while True:
+                    now = self._clock()
+                    if self._state == 'open' and now - self._opened_at >= self.reset_timeout:
+                        self._state = 'half_open'
+                    probe = self._state == 'half_open' and not self._probing
+                    if (self._state == 'closed' or probe) and self._in_flight < self.max_in_flight:
+                        self._in_flight += 1
+                        self._probing = self._probing or probe
+                        return probe
+                    if now >= deadline:
+                        reopen = self._opened_at + self.reset_timeout - now if self._opened_at else None
+                        reason = 'circuit_open' if self._state != 'closed' else 'queue_timeout'
+                        self._stats['rejected'] += 1
+                        MODEL_REJECTED.inc(reason=reason)
+                        raise ModelUnavailable(
+                            'Model API is unavailable, try again shortly' if reason == 'circuit_open'
+                            else 'Too many model calls in progress, try again shortly',
+                            retry_after=max(reopen or 0.0, 1.0))
+                    # Wake up for a released slot, or when the circuit may half-open
+                    timeout = deadline - now
+                    if self._state == 'open':
+                        timeout = min(timeout, self._opened_at + self.reset_timeout - now)
+                    self._changed.wait(max(timeout, 0.01))
+            finally:
+                self._waiting -= 1
+
+    def _release(self, probe, success):
+        """success: True, False (a retryable failure) or None (doesn't say anything about the API)"""
+        with self._changed:
+            self._in_flight -= 1
+            if probe:
+                self._probing = False
+            if success:
+                self._failures = 0
+                self._state, self._opened_at = 'closed', None
+            elif success is False:
+                self._failures += 1
+                if probe or (self._state == 'closed' and self._failures >= self.failure_threshold):
+                    self._state, self._opened_at = 'open', self._clock()
+                    self._stats['circuit_opened'] += 1
+            self._changed.notify_all()
+
+    def _throttle(self, tokens):
+        with self._lock:
+            wait = max(self._requests.take(1) if self._requests else 0.0,
+                       self._tokens.take(tokens) if self._tokens else 0.0)
+            self._stats['throttled_seconds'] += wait
+        if wait:
+            self._sleep(wait)
+
+    def _refund(self, tokens):
+        """Return the budget taken by _throttle for a call that was never made"""
+        with self._lock:
+            if self._requests:
+                self._requests.give_back(1)
+            if self._tokens:
+                self._tokens.give_back(tokens)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stats(self):
+        with self._lock:
+            state = self._state
+            if state == 'open' and self._clock() - self._opened_at >= self.reset_timeout:
+                state = 'half_open'
+            return dict(
+                self._stats,
+                throttled_seconds=round(self._stats['throttled_seconds'], 2),
+                state=state,
+                consecutive_failures=self._failures,
+                reopens_in=round(max(self._opened_at + self.reset_timeout - self._clock(), 0.0), 1)
+                if state == 'open' else None,
+                in_flight=self._in_flight,
+                waiting=self._waiting,
+                max_in_flight=self.max_in_flight,
+                request_budget=round(self._requests.level, 1) if self._requests else None,
+                token_budget=round(self._tokens.level) if self._tokens else None
+            )
@@ -0,0 +1,150 @@
+"""
+Server-side image normalization.
+
+Camera captures arrive at full sensor resolution. Before an image goes to the
+model it is auto-oriented, downscaled and re-encoded with the extraction
+profile; before it is stored it gets the (smaller) storage profile.
+
+Environment:
+    EXTRACT_MAX_DIM       longest edge sent to the model, px (default 1568)
+    EXTRACT_JPEG_QUALITY  JPEG quality sent to the model (default 85)
+    STORE_MAX_DIM         longest edge stored, px (default 1024)
+    STORE_JPEG_QUALITY    JPEG quality stored (default 75)
+    THUMB_MAX_DIM         longest edge of tracker thumbnails, px (default 192)
+    THUMB_JPEG_QUALITY    JPEG quality of tracker thumbnails (default 70)
+    ARCHIVE_MAX_DIM       longest edge of archived images, px (default 800)
+    ARCHIVE_JPEG_QUALITY  JPEG quality of archived images (default 60)
+    CROP_TO_LABEL         1 to crop to the bright label area before extraction (default 0)
+"""
+import io
+import os
+import threading
+import time
+from PIL import Image, ImageOps
+from metrics import BYTES_BUCKETS, Histogram
+
+
+class Profile:
+    """Target size/quality for one use of an image"""
+
+    def __init__(self, name, max_dim, quality, crop=False):
+        self.name = name
+        self.max_dim = max_dim
+        self.quality = quality
+        self.crop = crop
+
+    @classmethod
+    def from_env(cls, name, prefix, max_dim, quality, crop=False):
+        return cls(
+            name,
+            max_dim=int(os.environ.get(f'{prefix}_MAX_DIM', str(max_dim))),
+            quality=int(os.environ.get(f'{prefix}_JPEG_QUALITY', str(quality))),
+            crop=crop
+        )
+
+
+EXTRACTION = Profile.from_env('extraction', 'EXTRACT', 1568, 85,
+                              crop=os.environ.get('CROP_TO_LABEL') == '1')
+STORAGE = Profile.from_env('storage', 'STORE', 1024, 75)
+THUMBNAIL = Profile.from_env('thumb', 'THUMB', 192, 70)
+ARCHIVE = Profile.from_env('archive', 'ARCHIVE', 800, 60)
+
+# Running totals per profile, for tuning the limits
+_totals = {}
+_totals_lock = threading.Lock()
+
+IMAGE_BYTES = Histogram('image_bytes', 'Image size before and after normalization',
+                        ['profile', 'stage'], buckets=BYTES_BUCKETS)
+NORMALIZE_LATENCY = Histogram('image_normalize_duration_seconds', 'Image decode + resize + encode time',
+                              ['profile'])
+
+
+def crop_to_label(img, padding=0.04):
+    """Crop to the bounding box of the bright (label) region, if it is a clear subset"""
+    gray = ImageOps.autocontrast(img.convert('L'))
+    mask = gray.point(lambda p: 255 if p > 200 else 0)
+    box = mask.getbbox()
+    if not box:
+        return img
+    left, top, right, bottom = box
+    area = (right - left) * (bottom - top)
+    # Ignore boxes that are specks or the whole frame
+    if area < 0.2 * img.width * img.height or area > 0.95 * img.width * img.height:
+        return img
+    pad_x, pad_y = int(img.width * padding), int(img.height * padding)
+    return img.crop((max(0, left - pad_x), max(0, top - pad_y),
+                     min(img.width, right + pad_x), min(img.height, bottom + pad_y)))
+
+
+def normalize(image_bytes, profile):
+    """
+    Auto-orient, optionally crop, downscale and re-encode image_bytes as JPEG.
+
+    Returns (bytes, info). Undecodable input is returned unchanged.
+    """
+    started = time.perf_counter()
+    info = {
+        'profile': profile.name,
+        'bytes_before': len(image_bytes),
+        'bytes_after': len(image_bytes)
+    }
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        info['size_before'] = list(img.size)
+        original_format = img.format
+        oriented = ImageOps.exif_transpose(img)
+        changed = oriented is not img
+        img = oriented
+
+        if profile.crop:
+            cropped = crop_to_label(img)
+            changed = changed or cropped is not img
+            img = cropped
+
+        if max(img.size) > profile.max_dim:
+            img.thumbnail((profile.max_dim, profile.max_dim), Image.LANCZOS)
+            changed = True
+
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        out = io.BytesIO()
+        img.save(out, format='JPEG', quality=profile.quality, optimize=True)
+        result = out.getvalue()
+        # Re-encoding an already-small JPEG can grow it; keep the original then
+        if not changed and original_format == 'JPEG' and len(result) >= len(image_bytes):
+            result = image_bytes
+        info['size_after'] = list(img.size)
+    except Exception as e:
+        info['error'] = str(e)
+        result = image_bytes
+
+    info['bytes_after'] = len(result)
+    NORMALIZE_LATENCY.observe(time.perf_counter() - started, profile=profile.name)
+    _record(info)
+    return result, info
+
+
+def _record(info):
+    with _totals_lock:
+        t = _totals.setdefault(info['profile'], {'images': 0, 'bytes_before': 0, 'bytes_after': 0})
+        t['images'] += 1
+        t['bytes_before'] += info['bytes_before']
+        t['bytes_after'] += info['bytes_after']
+    IMAGE_BYTES.observe(info['bytes_before'], profile=info['profile'], stage='before')
+    IMAGE_BYTES.observe(info['bytes_after'], profile=info['profile'], stage='after')
+
+
+def stats():
+    """Before/after byte totals per profile"""
+    with _totals_lock:
+        result = {name: dict(t) for name, t in _totals.items()}
+    for t in result.values():
+        t['ratio'] = round(t['bytes_after'] / t['bytes_before'], 3) if t['bytes_before'] else None
+    return {
+        'profiles': {
+            p.name: {'max_dim': p.max_dim, 'quality': p.quality, 'crop': p.crop}
+            for p in (EXTRACTION, STORAGE, THUMBNAIL, ARCHIVE)
+        },
+        'totals': result
+    }
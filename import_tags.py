@@ -0,0 +1,233 @@
+"""
+Bulk tag import from CSV or JSONL.
+
+Accepts the columns of /api/tags/export.csv ("Style Number", "PO Number", ...)
+or the JSON field names (style_number, po_number, ...). Folders are matched
+by name and created if missing. Rows already in the database (same style
+number, PO number and scan date) or repeated in the file are skipped, using
+one set-based lookup per batch. Inserts go in batches: COPY on PostgreSQL,
+executemany elsewhere.
+
+Usage:
+    python import_tags.py <file.csv|file.jsonl> [--folder NAME] [--batch-size N] [--dry-run] [--yes]
+"""
+import argparse
+import csv
+import functools
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, date, timedelta
+from flask import Flask
+from sqlalchemy import insert
+from database import db, Tag, Folder, classify_source, init_db, lookup_key, price_cents
+from migrations import run_migrations
+
+# Accepted input names -> Tag field
+COLUMN_ALIASES = {
+    'style number': 'style_number', 'style_number': 'style_number', 'style': 'style_number',
+    'description': 'description',
+    'po number': 'po_number', 'po_number': 'po_number', 'po': 'po_number',
+    'price': 'price',
+    'source': 'source',
+    'scan date': 'scan_date', 'scan_date': 'scan_date',
+    'return date': 'return_date', 'return_date': 'return_date',
+    'folder': 'folder_name', 'folder_name': 'folder_name',
+}
+
+COPY_COLUMNS = ['style_number', 'description', 'po_number', 'style_key', 'po_key', 'scan_date', 'return_date',
+                'raw_text', 'price', 'price_cents', 'source', 'folder_id', 'created_at', 'updated_at']
+
+MAX_ERRORS_SHOWN = 10
+
+
+def read_records(path):
+    """Yield dicts keyed by Tag field name"""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if path.endswith('.jsonl') or path.endswith('.ndjson'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            yield {COLUMN_ALIASES[k.strip().lower()]: v
+                   for k, v in row.items() if k and k.strip().lower() in COLUMN_ALIASES}
+
+
+def parse_date(value):
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    return _parse_date_string(str(value).strip())
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date_string(value):
+    # Imports repeat the same few hundred dates, so strptime results are cached
+    for fmt in ('%Y-%m-%d', '%m/%d/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognised date: {value!r}")
+
+
+def build_row(record, default_folder, now):
+    """
+    Tag column values for one input record, with save_tag()'s defaults.
+
+    Returns (row, folder name); folder_id is filled in per batch.
+    """
+    style_number = str(record.get('style_number') or '').strip()
+    description = str(record.get('description') or '').strip()
+    po_number = str(record.get('po_number') or '').strip()
+    if not (style_number and description and po_number):
+        raise ValueError('style number, description and PO number are required')
+
+    price = str(record.get('price') or '').strip().lstrip('$')
+    source = str(record.get('source') or '').strip()
+    if price and not source:
+        source = classify_source(price) or source
+
+    scan_date = parse_date(record.get('scan_date')) or now.date()
+    return_date = parse_date(record.get('return_date')) or scan_date + timedelta(days=30)
+    folder_name = str(record.get('folder_name') or '').strip() or default_folder
+
+    return {
+        'style_number': style_number,
+        'description': description,
+        'po_number': po_number,
+        'style_key': lookup_key(style_number),
+        'po_key': lookup_key(po_number),
+        'scan_date': scan_date,
+        'return_date': return_date,
+        'raw_text': f"Style Number: {style_number}\nDescription: {description}\nPO Number: {po_number}",
+        'price': price or None,
+        'price_cents': price_cents(price),
+        'source': source or None,
+        'folder_id': None,
+        'created_at': now,
+        'updated_at': now,
+    }, folder_name
+
+
+def ensure_folders(names, folder_ids):
+    """Create any folders in names that don't exist yet, updating folder_ids"""
+    missing = sorted(n for n in names if n and n not in folder_ids)
+    if not missing:
+        return
+    db.session.execute(insert(Folder), [{'name': n, 'created_at': datetime.utcnow()} for n in missing])
+    for folder in Folder.query.filter(Folder.name.in_(missing)):
+        folder_ids[folder.name] = folder.id
+
+
+def existing_keys(rows):
+    """(style, PO, scan date) keys of rows already stored, in one query"""
+    pairs = {(r['style_number'], r['po_number']) for r in rows}
+    found = db.session.query(Tag.style_number, Tag.po_number, Tag.scan_date) \
+        .filter(db.tuple_(Tag.style_number, Tag.po_number).in_(pairs))
+    return set(found)
+
+
+def insert_batch(rows, columns=COPY_COLUMNS):
+    """Insert tag rows (dicts with at least `columns`) in one statement"""
+    if db.engine.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for r in rows:
+            writer.writerow(['' if r[c] is None else r[c] for c in columns])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.dbapi_connection.cursor()
+        cursor.copy_expert(f"COPY tags ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    else:
+        db.session.execute(Tag.__table__.insert(), rows)
+
+
+def import_tags(path, default_folder=None, batch_size=5000, dry_run=False):
+    started = time.perf_counter()
+    stats = {'read': 0, 'added': 0, 'duplicates': 0, 'errors': 0}
+    folder_ids = {name: fid for fid, name in db.session.query(Folder.id, Folder.name)}
+    seen = set()
+    batch = []
+
+    def flush():
+        ensure_folders({name for _, name in batch}, folder_ids)
+        rows = []
+        for row, folder_name in batch:
+            row['folder_id'] = folder_ids.get(folder_name)
+            rows.append(row)
+        stored = existing_keys(rows)
+        new_rows = [r for r in rows if (r['style_number'], r['po_number'], r['scan_date']) not in stored]
+        stats['duplicates'] += len(rows) - len(new_rows)
+        if not dry_run:
+            if new_rows:
+                insert_batch(new_rows)
+            # Also commits folders created for a batch that turned out to be all duplicates
+            db.session.commit()
+        stats['added'] += len(new_rows)
+        batch.clear()
+        elapsed = time.perf_counter() - started
+        print(f"  {stats['read']} rows read, {stats['added']} added ({stats['read'] / elapsed:,.0f} rows/s)")
+
+    for record in read_records(path):
+        stats['read'] += 1
+        try:
+            row, folder_name = build_row(record, default_folder, datetime.utcnow())
+        except Exception as e:
+            stats['errors'] += 1
+            if stats['errors'] <= MAX_ERRORS_SHOWN:
+                print(f"  Row {stats['read']}: {e}")
+            continue
+
+        key = (row['style_number'], row['po_number'], row['scan_date'])
+        if key in seen:
+            stats['duplicates'] += 1
+            continue
+        seen.add(key)
+        batch.append((row, folder_name))
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+    if dry_run:
+        db.session.rollback()
+
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import tags from CSV or JSONL')
+    parser.add_argument('path')
+    parser.add_argument('--folder', help='folder for rows without one (created if missing)')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--dry-run', action='store_true', help='count what would be imported without writing')
+    parser.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"❌ Error: File '{args.path}' not found!")
+        sys.exit(1)
+
+    app = Flask(__name__)
+    init_db(app)
+    print(f"📂 Reading: {args.path}")
+    print(f"🗄️  Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+
+    if not args.yes and input("Proceed with import? (yes/no): ").lower() != 'yes':
+        print("Cancelled.")
+        sys.exit(0)
+
+    run_migrations(app)
+    with app.app_context():
+        stats = import_tags(args.path, args.folder, args.batch_size, args.dry_run)
+
+    rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"\n✅ Import {'dry run ' if args.dry_run else ''}complete in {stats['seconds']}s ({rate:,.0f} rows/s)")
+    print(f"   Rows read:  {stats['read']}")
+    print(f"   Added:      {stats['added']}")
+    print(f"   Duplicates: {stats['duplicates']}")
+    print(f"   Errors:     {stats['errors']}")
@@ -0,0 +1,189 @@
+"""
+Background job queue for tag extraction.
+
+/upload hands the model call to a bounded thread pool and returns a job id
+straight away, so a web worker is never held for the whole round-trip. The
+scanner page then polls /upload/<job_id> for the result.
+
+Jobs can also be grouped into a scan session (batch scan mode). A session
+records the order its jobs finished in, and wait_for_change() lets the
+session's event stream block until any job moves instead of polling.
+
+Jobs live in process memory, so the app must run as a single process
+(see Procfile: one gunicorn worker, many threads).
+
+Environment:
+    EXTRACTION_WORKERS      max concurrent extractions (default 4)
+    EXTRACTION_QUEUE_LIMIT  max queued + running jobs before /upload returns 503 (default 32)
+    EXTRACTION_JOB_TTL      seconds a finished job (or idle session) is kept for polling (default 600)
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    """Raised when the queue is at its pending limit"""
+
+
+class JobQueue:
+    """Bounded thread pool that tracks job status by id"""
+
+    def __init__(self, handler, max_workers=4, max_pending=32, ttl=600):
+        self.handler = handler
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='extract')
+        self._jobs = {}
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+
+    @classmethod
+    def from_env(cls, handler):
+        return cls(
+            handler,
+            max_workers=int(os.environ.get('EXTRACTION_WORKERS', '4')),
+            max_pending=int(os.environ.get('EXTRACTION_QUEUE_LIMIT', '32')),
+            ttl=int(os.environ.get('EXTRACTION_JOB_TTL', '600'))
+        )
+
+    def submit(self, *args, **kwargs):
+        """Queue a job and return its id"""
+        return self.submit_to_session(None, *args, **kwargs)
+
+    def submit_to_session(self, session_id, *args, **kwargs):
+        """Queue a job as part of a scan session (None for a standalone job)"""
+        with self._lock:
+            self._expire()
+            if self.pending_count() >= self.max_pending:
+                raise QueueFull('Too many scans in progress, please retry')
+            job_id = self._add_job(session_id, status='queued')
+        self._executor.submit(self._run, job_id, args, kwargs)
+        return job_id
+
+    def add_result(self, session_id, result):
+        """Record an already-finished job (e.g. an extraction cache hit) in a session"""
+        with self._lock:
+            job_id = self._add_job(session_id, status='done', result=result, finished_at=time.time())
+            self._finished(job_id)
+        return job_id
+
+    def create_session(self):
+        """Start a scan session and return its id"""
+        with self._lock:
+            self._expire()
+            session_id = uuid.uuid4().hex
+            self._sessions[session_id] = {
+                'id': session_id,
+                'jobs': [],
+                'finished': [],
+                'updated_at': time.time()
+            }
+        return session_id
+
+    def get_session(self, session_id):
+        """
+        Snapshot of a session, or None if unknown/expired.
+
+        'jobs' lists job ids in submission order, 'finished' in the order
+        they completed.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if not session:
+                return None
+            return dict(session, jobs=list(session['jobs']), finished=list(session['finished']))
+
+    def wait_for_change(self, version, timeout):
+        """
+        Block until a job changes state after `version` (or timeout).
+
+        Returns the current version; pass it back in on the next call. Start
+        with version 0.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def get(self, job_id):
+        """Return a snapshot of a job, or None if unknown/expired"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self.pending_count(),
+                'jobs': len(self._jobs),
+                'sessions': len(self._sessions)
+            }
+
+    def pending_count(self):
+        return sum(1 for j in self._jobs.values() if j['status'] in ('queued', 'running'))
+
+    def _run(self, job_id, args, kwargs):
+        self._update(job_id, status='running')
+        try:
+            result = self.handler(*args, **kwargs)
+        except Exception as e:
+            # Errors that say when to try again (governor.ModelUnavailable) keep that
+            self._update(job_id, status='failed', error=str(e), retry_after=getattr(e, 'retry_after', None),
+                         finished_at=time.time())
+        else:
+            self._update(job_id, status='done', result=result, finished_at=time.time())
+
+    def _add_job(self, session_id, **fields):
+        # Caller holds the lock
+        job_id = uuid.uuid4().hex
+        self._jobs[job_id] = dict({
+            'id': job_id,
+            'session_id': session_id,
+            'status': 'queued',
+            'result': None,
+            'error': None,
+            'retry_after': None,
+            'created_at': time.time(),
+            'finished_at': None
+        }, **fields)
+        if session_id:
+            session = self._sessions[session_id]
+            session['jobs'].append(job_id)
+            session['updated_at'] = time.time()
+        return job_id
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+                if fields.get('finished_at'):
+                    self._finished(job_id)
+                else:
+                    self._version += 1
+                    self._changed.notify_all()
+
+    def _finished(self, job_id):
+        # Caller holds the lock
+        session = self._sessions.get(self._jobs[job_id]['session_id'])
+        if session:
+            session['finished'].append(job_id)
+            session['updated_at'] = time.time()
+        self._version += 1
+        self._changed.notify_all()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        stale = [jid for jid, j in self._jobs.items()
+                 if j['finished_at'] and j['finished_at'] < cutoff]
+        for jid in stale:
+            del self._jobs[jid]
+        idle = [sid for sid, s in self._sessions.items()
+                if s['updated_at'] < cutoff and len(s['finished']) == len(s['jobs'])]
+        for sid in idle:
+            del self._sessions[sid]
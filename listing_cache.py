@@ -0,0 +1,155 @@
+"""
+Conditional GET and a response cache for the tracker and tag listings.
+
+Every commit that writes tags or folders (database.on_tags_committed) stamps
+the folders it touched with a new version number. A listing scoped to one
+folder (?folder_id=N, or ?general=1 for the General inbox) is only as new as
+that folder's stamp; an unscoped listing changes with any write. Bulk
+statements (batch move/delete, imports) and folder changes (names show up in
+every listing) move every scope on.
+
+The version, today's date and the process start make the ETag, so a phone
+reloading an unchanged folder gets a 304 without a query being run. Rendered
+bodies are also kept in an LRU keyed by URL, so another client asking for the
+same unchanged page gets it without touching the database either.
+
+Writes from other processes (import_tags.py, generate_data.py) don't reach
+the stamps, so ETags also roll over every LISTING_CACHE_TTL seconds.
+
+Environment:
+    LISTING_CACHE_SIZE    rendered responses kept (default 256, 0 disables the body cache)
+    LISTING_CACHE_MAX_MB  total size of kept responses before the oldest are evicted (default 32)
+    LISTING_CACHE_TTL     seconds an ETag stays valid without a local write (default 300)
+"""
+import functools
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from flask import current_app, request
+from metrics import Counter
+
+LISTING_REQUESTS = Counter('listing_cache_requests_total', 'Cached listing requests by result', ['result'])
+
+# Response headers that are recomputed per request rather than replayed
+UNCACHED_HEADERS = {'Content-Length', 'Server-Timing', 'Set-Cookie'}
+
+
+class ListingCache:
+    """Per-folder version stamps, ETags and an LRU of rendered listing responses"""
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._epoch = secrets.token_hex(4)  # ETags from a previous process never match
+        self._version = 0           # bumped on every write
+        self._folder_versions = {}  # folder id (None = General inbox) -> version of its last write
+        self._all_version = 0       # version of the last write that touched every folder
+        self._items = OrderedDict()  # path -> (etag, body, status, headers), least recently used first
+        self._size = 0
+        self._evicted = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get('LISTING_CACHE_SIZE', '256')),
+            max_bytes=int(os.environ.get('LISTING_CACHE_MAX_MB', '32')) * 1024 * 1024,
+            ttl=int(os.environ.get('LISTING_CACHE_TTL', '300'))
+        )
+
+    def on_commit(self, changes):
+        """database.on_tags_committed listener: move the touched folders' stamps on"""
+        with self._lock:
+            self._version += 1
+            if changes.all_folders or changes.folders:
+                self._all_version = self._version
+            for folder_id in changes.folder_ids:
+                self._folder_versions[folder_id] = self._version
+
+    def version(self, folder_id=None, general=False, scoped=False):
+        """Version of a listing: one folder's (scoped=True) or everything's"""
+        with self._lock:
+            if not scoped:
+                return self._version
+            key = None if general else folder_id
+            return max(self._folder_versions.get(key, 0), self._all_version)
+
+    def etag(self, version):
+        window = int(time.time() // self.ttl) if self.ttl else 0
+        return f'{self._epoch}-{version}-{date.today().isoformat()}-{window}'
+
+    def get(self, path, etag):
+        """Kept response for path if it was rendered for etag"""
+        with self._lock:
+            item = self._items.get(path)
+            if not item or item[0] != etag:
+                return None
+            self._items.move_to_end(path)
+            return item
+
+    def put(self, path, etag, body, status, headers):
+        if not self.max_entries or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old:
+                self._size -= len(old[1])
+            self._items[path] = (etag, body, status, headers)
+            self._size += len(body)
+            while len(self._items) > self.max_entries or self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted[1])
+                self._evicted += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._items),
+                'bytes': self._size,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'evicted': self._evicted,
+                'version': self._version
+            }
+
+    def cached(self, view):
+        """
+        Serve a listing view with ETag/304 and the response cache.
+
+        The scope comes from the request's ?folder_id= / ?general=1, the
+        same arguments filter_tags() applies.
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            folder_id = request.args.get('folder_id', type=int)
+            general = request.args.get('general') == '1'
+            # Taken before rendering, so a write during the render only makes the ETag older
+            etag = self.etag(self.version(folder_id, general, scoped=bool(folder_id or general)))
+            path = request.full_path
+
+            if request.if_none_match.contains(etag):
+                LISTING_REQUESTS.inc(result='not_modified')
+                response = current_app.response_class(status=304)
+            else:
+                item = self.get(path, etag)
+                if item:
+                    LISTING_REQUESTS.inc(result='hit')
+                    _, body, status, headers = item
+                    response = current_app.response_class(body, status=status, headers=headers)
+                else:
+                    LISTING_REQUESTS.inc(result='miss')
+                    response = current_app.make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    headers = [(k, v) for k, v in response.headers.items() if k not in UNCACHED_HEADERS]
+                    self.put(path, etag, response.get_data(), response.status_code, headers)
+
+            response.set_etag(etag)
+            # Always revalidate; the 304 makes that cheap
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
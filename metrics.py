@@ -0,0 +1,171 @@
+"""
+Prometheus metrics and opt-in request profiling.
+
+A minimal in-process registry (counters, histograms, callback gauges)
+rendered in the Prometheus text format at /metrics; the app runs as one
+process, so there is nothing to aggregate across workers.
+
+instrument(app) records, per Flask route:
+    http_request_duration_seconds   latency histogram (route, method, status)
+    http_request_db_queries         SQL statements per request (route)
+    db_query_duration_seconds       every SQL statement's time (via SQLAlchemy cursor events)
+Other modules record their own metrics (model calls in extraction.py,
+image sizes in imaging.py).
+
+Profiling: set PROFILE_TOKEN and send a request with the header
+"X-Profile: <token>". The response body is replaced by a cProfile report of
+that request (top PROFILE_LINES functions by cumulative time).
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from flask import Response, g, has_app_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+BYTES_BUCKETS = (10e3, 50e3, 100e3, 250e3, 500e3, 1e6, 2.5e6, 5e6, 10e6)
+
+PROFILE_LINES = int(os.environ.get('PROFILE_LINES', '40'))
+
+_registry = []
+
+
+def _labels_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels_text(self.labels, key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labels = name, documentation, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            series = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f'{self.name}_bucket{_labels_text(self.labels, key, [("le", bound)])} {count}')
+                lines.append(f'{self.name}_bucket{_labels_text(self.labels, key, [("le", "+Inf")])} {series[-1]}')
+                lines.append(f'{self.name}_sum{_labels_text(self.labels, key)} {series[-2]}')
+                lines.append(f'{self.name}_count{_labels_text(self.labels, key)} {series[-1]}')
+        return lines
+
+
+class Gauge:
+    """A value read from a callback at scrape time"""
+
+    def __init__(self, name, documentation, callback):
+        self.name, self.documentation, self.callback = name, documentation, callback
+        _registry.append(self)
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge',
+                f'{self.name} {self.callback()}']
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by route',
+                            ['route', 'method', 'status'])
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements issued per request',
+                            ['route'], buckets=QUERY_BUCKETS)
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'SQL statement execution time')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_started', time.perf_counter())
+    QUERY_LATENCY.observe(elapsed)
+    if has_app_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+        g.db_seconds = g.get('db_seconds', 0.0) + elapsed
+
+
+def instrument(app, db):
+    """Add request timing, SQL hooks, /metrics and X-Profile support to app"""
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    profile_token = os.environ.get('PROFILE_TOKEN')
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries, g.db_seconds = 0, 0.0
+        if profile_token and request.headers.get('X-Profile') == profile_token:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def record_request(response):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        if 'request_started' in g:
+            REQUEST_LATENCY.observe(time.perf_counter() - g.request_started,
+                                    route=route, method=request.method, status=response.status_code)
+            REQUEST_QUERIES.observe(g.db_queries, route=route)
+        # Server-Timing shows the DB share in the browser's network panel
+        response.headers['Server-Timing'] = f"db;desc=\"{g.get('db_queries', 0)} queries\";dur={g.get('db_seconds', 0) * 1000:.1f}"
+        profiler = g.pop('profiler', None)
+        if profiler:
+            profiler.disable()
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            return Response(f"{request.method} {request.full_path} -> {response.status}\n\n{report.getvalue()}",
+                            mimetype='text/plain')
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,73 @@
+"""
+Migration script: Move tag images out of tags.image_data into the blob store.
+
+Applies pending schema migrations (which add tags.image_key), then copies
+each stored image into the blob store named by --backend (or BLOB_STORE;
+BLOB_STORE_DIR for fs) and clears image_data. Safe to re-run; it only
+touches tags that still have image_data and no image_key.
+
+Clearing image_data can't be undone, so the backend must be chosen
+explicitly: an fs store on an ephemeral disk (a Heroku dyno) loses every
+image on the next restart.
+
+Usage:
+    python migrate_images_to_blobstore.py --backend db|fs
+"""
+import argparse
+import os
+import sys
+from flask import Flask
+from database import db, Tag, init_db
+from blobstore import get_blob_store
+from migrations import run_migrations
+
+BATCH_SIZE = 100
+
+
+def migrate(app, backend):
+    store = get_blob_store(app, backend)
+    moved = 0
+    total_bytes = 0
+
+    run_migrations(app)
+
+    with app.app_context():
+        while True:
+            # Only id + bytes, one batch at a time, so memory stays bounded
+            rows = db.session.query(Tag.id, Tag.image_data) \
+                .filter(Tag.image_data.isnot(None), Tag.image_key.is_(None)) \
+                .order_by(Tag.id).limit(BATCH_SIZE).all()
+            if not rows:
+                break
+
+            for tag_id, image_data in rows:
+                key = store.put(image_data)
+                Tag.query.filter_by(id=tag_id).update(
+                    {'image_key': key, 'image_data': None}, synchronize_session=False)
+                moved += 1
+                total_bytes += len(image_data)
+            db.session.commit()
+            print(f"Moved {moved} images ({total_bytes / 1024 / 1024:.1f} MB)...")
+
+    print(f"Image migration completed successfully! {moved} images moved.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move tag images into the blob store')
+    parser.add_argument('--backend', type=str.lower, choices=['db', 'fs'], default=os.environ.get('BLOB_STORE'),
+                        help='blob store to move images into (default: BLOB_STORE)')
+    args = parser.parse_args()
+    if not args.backend:
+        print("Refusing to clear tags.image_data without an explicit blob store: pass --backend db "
+              "(Heroku and other ephemeral filesystems) or --backend fs (a persistent disk), "
+              "or set BLOB_STORE.")
+        sys.exit(1)
+
+    app = Flask(__name__)
+    try:
+        init_db(app)
+    except Exception as e:
+        print(f"Could not open database: {e}")
+        sys.exit(1)
+    print(f"Moving images into the {args.backend} blob store")
+    migrate(app, args.backend)
@@ -0,0 +1,190 @@
+"""
+Versioned schema migrations for SQLite and PostgreSQL.
+
+Migrations run in order, each in its own transaction, and every applied
+version is recorded in the schema_migrations table. Each migration is
+idempotent (IF NOT EXISTS / column checks), so databases created by the old
+db.create_all() boot or the hand-run migrate_add_folders.py / fix_columns.py
+scripts are brought up to date safely.
+
+Migrations run once per deploy (Procfile release phase) instead of on
+every worker boot. To add one, append a function decorated with
+@migration(<next version>, '<description>').
+
+Usage:
+    python migrations.py            apply pending migrations
+    python migrations.py --status   list applied and pending versions
+"""
+import sys
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import inspect, text
+from database import db, init_db, lookup_key, price_cents
+from search import ensure_search_index
+
+MIGRATIONS = []
+BACKFILL_BATCH = 5000
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def has_column(conn, table, column):
+    return column in [c['name'] for c in inspect(conn).get_columns(table)]
+
+
+def add_column(conn, table, column, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    if not has_column(conn, table, column):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+@migration(1, 'initial schema')
+def create_tables(conn):
+    # Creates any missing tables from the models; existing tables are left alone
+    db.metadata.create_all(bind=conn, checkfirst=True)
+
+
+@migration(2, 'tags.folder_id, price and source columns')
+def add_folder_price_source(conn):
+    add_column(conn, 'tags', 'folder_id', 'INTEGER REFERENCES folders(id)')
+    add_column(conn, 'tags', 'price', 'VARCHAR(20)')
+    add_column(conn, 'tags', 'source', 'VARCHAR(50)')
+
+
+@migration(3, 'tags.image_key for the blob store')
+def add_image_key(conn):
+    add_column(conn, 'tags', 'image_key', 'VARCHAR(64)')
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_image_key ON tags (image_key)"))
+
+
+@migration(4, 'tag search index')
+def add_search_index(conn):
+    # Search falls back to LIKE if the index can't be built (no FTS5 / pg_trgm)
+    try:
+        with conn.begin_nested():
+            ensure_search_index(conn)
+    except Exception as e:
+        print(f"  Search index not created, search will use LIKE: {e}")
+
+
+@migration(5, 'indexes for tag listings')
+def add_listing_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_folder_return ON tags (folder_id, return_date, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_return_date ON tags (return_date, id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_style_number ON tags (style_number)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_po_number ON tags (po_number)"))
+
+
+@migration(6, 'tag tombstones and updated_at index for delta sync')
+def add_delta_sync(conn):
+    db.metadata.tables['tag_tombstones'].create(bind=conn, checkfirst=True)
+    # Rows from before updated_at was set on every insert
+    conn.execute(text("UPDATE tags SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_updated ON tags (updated_at, id)"))
+
+
+@migration(7, 'archived_tags for hot/cold archival')
+def add_archive(conn):
+    # Creates the table and its indexes
+    db.metadata.tables['archived_tags'].create(bind=conn, checkfirst=True)
+
+
+@migration(8, 'integer price_cents on tags and archived_tags')
+def add_price_cents(conn):
+    add_column(conn, 'tags', 'price_cents', 'INTEGER')
+    add_column(conn, 'archived_tags', 'price_cents', 'INTEGER')
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_price_cents ON tags (price_cents)"))
+    # Parsed in Python so existing prices get exactly what a save would store
+    for table in ('tags', 'archived_tags'):
+        last_id = 0
+        while True:
+            rows = conn.execute(text(
+                f"SELECT id, price FROM {table} WHERE id > :last_id AND price IS NOT NULL "
+                f"ORDER BY id LIMIT {BACKFILL_BATCH}"), {'last_id': last_id}).all()
+            if not rows:
+                break
+            values = [{'id': i, 'cents': price_cents(p)} for i, p in rows]
+            values = [v for v in values if v['cents'] is not None]
+            if values:
+                conn.execute(text(f"UPDATE {table} SET price_cents = :cents WHERE id = :id"), values)
+            last_id = rows[-1][0]
+
+
+@migration(9, 'normalized style/PO lookup keys for duplicate detection')
+def add_lookup_keys(conn):
+    add_column(conn, 'tags', 'style_key', 'VARCHAR(200)')
+    add_column(conn, 'tags', 'po_key', 'VARCHAR(200)')
+    last_id = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, style_number, po_number FROM tags WHERE id > :last_id AND style_key IS NULL "
+            f"ORDER BY id LIMIT {BACKFILL_BATCH}"), {'last_id': last_id}).all()
+        if not rows:
+            break
+        conn.execute(text("UPDATE tags SET style_key = :style_key, po_key = :po_key WHERE id = :id"),
+                     [{'id': i, 'style_key': lookup_key(s), 'po_key': lookup_key(p)} for i, s, p in rows])
+        last_id = rows[-1][0]
+    # Built after the backfill, so it isn't updated row by row
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_tags_style_po_key ON tags (style_key, po_key)"))
+
+
+def ensure_version_table(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """))
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(app):
+    """Apply pending migrations; returns the versions applied"""
+    applied = []
+    with app.app_context():
+        with db.engine.begin() as conn:
+            ensure_version_table(conn)
+            done = applied_versions(conn)
+
+        for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+            if version in done:
+                continue
+            print(f"Applying migration {version}: {description}")
+            with db.engine.begin() as conn:
+                fn(conn)
+                conn.execute(
+                    text("INSERT INTO schema_migrations (version, description, applied_at) "
+                         "VALUES (:version, :description, :applied_at)"),
+                    {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+                )
+            applied.append(version)
+    return applied
+
+
+def status(app):
+    with app.app_context():
+        with db.engine.begin() as conn:
+            ensure_version_table(conn)
+            done = applied_versions(conn)
+    for version, description, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+        state = 'applied' if version in done else 'pending'
+        print(f"{version:4d}  {state:8s} {description}")
+
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    init_db(app)
+    if '--status' in sys.argv:
+        status(app)
+    else:
+        applied = run_migrations(app)
+        print(f"Database is up to date ({len(applied)} migration(s) applied).")
@@ -0,0 +1,137 @@
+"""
+Extraction result cache.
+
+Re-scans of the same tag (or a duplicate upload after a flaky connection)
+are answered from the ocr_cache table instead of a fresh model call.
+
+Keys are a hash of the decoded image bytes:
+    sha256  exact match on the bytes (default)
+    dhash   64-bit perceptual difference hash, so near-identical photos
+            of the same tag share an entry (requires Pillow)
+
+Environment:
+    OCR_CACHE_MODE         sha256 | dhash | off (default sha256)
+    OCR_CACHE_MAX_ENTRIES  entries kept before least-recently-used are evicted (default 5000)
+    OCR_CACHE_TTL_DAYS     entries unused for this long are evicted (default 30)
+"""
+import hashlib
+import io
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import db, OcrCacheEntry
+
+
+def dhash(image_bytes, size=8):
+    """Perceptual difference hash of an image, as a hex string"""
+    from PIL import Image
+    img = Image.open(io.BytesIO(image_bytes)).convert('L').resize((size + 1, size), Image.LANCZOS)
+    pixels = list(img.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f'{bits:0{size * size // 4}x}'
+
+
+class OcrCache:
+    """DB-backed cache of extracted tag text with LRU + TTL eviction"""
+
+    def __init__(self, mode='sha256', max_entries=5000, ttl=timedelta(days=30)):
+        if mode not in ('sha256', 'dhash', 'off'):
+            raise ValueError(f"Unknown OCR_CACHE_MODE: {mode}")
+        self.mode = mode
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get('OCR_CACHE_MODE', 'sha256').lower(),
+            max_entries=int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '5000')),
+            ttl=timedelta(days=float(os.environ.get('OCR_CACHE_TTL_DAYS', '30')))
+        )
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    def key_for(self, image_bytes):
+        """Cache key for decoded image bytes, or None if caching is off"""
+        if self.mode == 'sha256':
+            return 'sha256:' + hashlib.sha256(image_bytes).hexdigest()
+        if self.mode == 'dhash':
+            try:
+                return 'dhash:' + dhash(image_bytes)
+            except Exception:
+                # Not a decodable image - fall back to an exact match
+                return 'sha256:' + hashlib.sha256(image_bytes).hexdigest()
+        return None
+
+    def get(self, key):
+        """Return cached text for key, or None. Needs an app context."""
+        if key is None:
+            return None
+        entry = OcrCacheEntry.query.filter_by(key=key).first()
+        if entry and entry.last_used_at and entry.last_used_at < datetime.utcnow() - self.ttl:
+            entry = None
+        with self._lock:
+            if entry:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not entry:
+            return None
+        entry.hits += 1
+        entry.last_used_at = datetime.utcnow()
+        db.session.commit()
+        return entry.text
+
+    def put(self, key, text):
+        """Store text for key and evict stale entries. Needs an app context."""
+        if key is None:
+            return
+        try:
+            entry = OcrCacheEntry.query.filter_by(key=key).first()
+            if entry:
+                entry.text = text
+                entry.last_used_at = datetime.utcnow()
+            else:
+                db.session.add(OcrCacheEntry(key=key, text=text))
+            db.session.commit()
+            self.evict()
+        except IntegrityError:
+            # Another worker cached the same image first
+            db.session.rollback()
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones over the size cap"""
+        cutoff = datetime.utcnow() - self.ttl
+        OcrCacheEntry.query.filter(OcrCacheEntry.last_used_at < cutoff).delete()
+        overflow = OcrCacheEntry.query.count() - self.max_entries
+        if overflow > 0:
+            oldest = db.session.query(OcrCacheEntry.id) \
+                .order_by(OcrCacheEntry.last_used_at.asc()).limit(overflow).subquery()
+            OcrCacheEntry.query.filter(OcrCacheEntry.id.in_(db.select(oldest.c.id))) \
+                .delete(synchronize_session=False)
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            'mode': self.mode,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / lookups, 3) if lookups else None,
+            'entries': OcrCacheEntry.query.count(),
+            'max_entries': self.max_entries,
+            'ttl_days': self.ttl.total_seconds() / 86400
+        }
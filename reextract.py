@@ -0,0 +1,353 @@
+"""
+Bulk re-extraction: read stored tag images again with the current prompt and model.
+
+Selects tags that have a stored image - by folder (--folder ID or --general),
+scan date range (--since / --until), missing price (--missing-price) or
+--ids - and re-reads each image with the model backend (EXTRACTOR_BACKEND;
+use stub to try it offline). Reads run on --workers threads through the
+model governor (GOVERNOR_* limits), or with --batch as Message Batches of
+--batch-size requests where the backend offers them (anthropic and stub).
+
+Every result is appended to a JSONL checkpoint (--checkpoint), one line per
+tag with the fields that changed as [old, new]:
+    {"type": "tag", "tag_id": 12, "status": "changed", "changes": {"po_number": ["1234", "1284"]}}
+Running again with the same checkpoint resumes: tags already recorded are
+skipped, failed ones are retried, and submitted batches are collected rather
+than sent again. The checkpoint is the diff to review.
+
+Changes are written to the tags only with --apply (at the end of the run) or
+--apply-diff FILE (a reviewed checkpoint, without reading anything again), in
+bulk. A field is only changed if it still holds the value that was read over,
+so edits made in the meantime win (reported as conflicts), and an empty read
+never blanks a field.
+
+Usage:
+    python reextract.py [--folder ID | --general] [--since YYYY-MM-DD] [--until YYYY-MM-DD]
+                        [--missing-price] [--ids N ...] [--limit N] [--fields style_number,po_number,...]
+                        [--workers N] [--batch] [--batch-size N] [--checkpoint FILE] [--apply] [--yes]
+    python reextract.py --apply-diff FILE [--yes]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import update
+import imaging
+from blobstore import get_blob_store
+from database import db, Tag, classify_source, init_db, lookup_key, price_cents
+from extraction import FIELDS, get_model_backend
+from governor import ModelGovernor
+from migrations import run_migrations
+
+APPLY_CHUNK = 500
+BATCH_POLL_INTERVAL = 30
+
+
+class Checkpoint:
+    """Append-only JSONL record of a run; safe to write from worker threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tags = {}     # tag_id -> latest record
+        self.batches = {}  # batch_id -> tag ids
+        self.collected = set()  # batch ids whose results are recorded
+        self.run = None
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        self._load(json.loads(line))
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _load(self, record):
+        if record['type'] == 'run':
+            self.run = record
+        elif record['type'] == 'batch':
+            self.batches[record['batch_id']] = record['tag_ids']
+        elif record['type'] == 'batch_collected':
+            self.collected.add(record['batch_id'])
+        elif record['type'] == 'tag':
+            self.tags[record['tag_id']] = record
+
+    def write(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            self._load(record)
+
+    def done(self):
+        """Tag ids with a result that doesn't need another read"""
+        return {tag_id for tag_id, r in self.tags.items() if r['status'] != 'failed'}
+
+    def pending_batches(self):
+        """Submitted batches whose results haven't been collected: batch_id -> tag ids"""
+        return {batch_id: ids for batch_id, ids in self.batches.items() if batch_id not in self.collected}
+
+    def close(self):
+        if self._file:
+            self._file.close()
+
+
+def selection_of(args):
+    return {k: getattr(args, k) for k in ('folder', 'general', 'since', 'until', 'missing_price', 'ids', 'limit')}
+
+
+def select_tags(args, fields):
+    """(id, image_key, current field values) of the selected tags that have an image"""
+    query = db.session.query(Tag.id, Tag.image_key, *(getattr(Tag, f) for f in fields)) \
+        .filter(db.or_(Tag.image_key.isnot(None), Tag.image_data.isnot(None)))
+    if args.general:
+        query = query.filter(Tag.folder_id.is_(None))
+    elif args.folder:
+        query = query.filter(Tag.folder_id == args.folder)
+    if args.since:
+        query = query.filter(Tag.scan_date >= datetime.strptime(args.since, '%Y-%m-%d').date())
+    if args.until:
+        query = query.filter(Tag.scan_date <= datetime.strptime(args.until, '%Y-%m-%d').date())
+    if args.missing_price:
+        query = query.filter(db.or_(Tag.price.is_(None), Tag.price == ''))
+    if args.ids:
+        query = query.filter(Tag.id.in_(args.ids))
+    query = query.order_by(Tag.id.asc())
+    if args.limit:
+        query = query.limit(args.limit)
+    return [(tag_id, image_key, dict(zip(fields, values))) for tag_id, image_key, *values in query]
+
+
+def load_image(app, store, tag_id, image_key):
+    """A tag's stored image, normalized for the model as /upload does"""
+    with app.app_context():
+        if image_key:
+            data = store.get(image_key)
+        else:
+            # Legacy image on the row (see migrate_images_to_blobstore.py)
+            data = db.session.query(Tag.image_data).filter_by(id=tag_id).scalar()
+    image, _ = imaging.normalize(data, imaging.EXTRACTION)
+    return image
+
+
+def diff(old, new, fields):
+    """{field: [old, new]} for fields the read changed; empty reads are ignored"""
+    return {f: [old[f], new[f]] for f in fields if new.get(f) and new[f] != (old[f] or '')}
+
+
+def record_result(checkpoint, tag_id, old, fields, new=None, error=None, batch_id=None):
+    record = {'type': 'tag', 'tag_id': tag_id, 'at': datetime.utcnow().isoformat(timespec='seconds')}
+    if batch_id:
+        record['batch_id'] = batch_id
+    if error:
+        record.update(status='failed', error=error)
+    else:
+        changes = diff(old, new, fields)
+        record.update(status='changed' if changes else 'unchanged', changes=changes)
+    checkpoint.write(record)
+
+
+def read_concurrently(app, store, backend, tags, fields, checkpoint, workers):
+    started = time.perf_counter()
+    counts = Counter()
+    lock = threading.Lock()
+
+    def read_one(item):
+        tag_id, image_key, old = item
+        try:
+            new = backend.read(load_image(app, store, tag_id, image_key))
+        except Exception as e:
+            record_result(checkpoint, tag_id, old, fields, error=str(e))
+            outcome = 'failed'
+        else:
+            record_result(checkpoint, tag_id, old, fields, new=new)
+            outcome = 'read'
+        with lock:
+            counts[outcome] += 1
+            done = counts['read'] + counts['failed']
+            rate = done / max(time.perf_counter() - started, 1e-6)
+            print(f"\r  {done}/{len(tags)} read, {counts['failed']} failed ({rate:.1f}/s)", end='', flush=True)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reextract') as pool:
+        list(pool.map(read_one, tags))
+    print()
+
+
+def read_in_batches(app, store, backend, tags, fields, checkpoint, batch_size, workers):
+    old_values = {tag_id: old for tag_id, _, old in tags}
+    in_flight = {i for ids in checkpoint.pending_batches().values() for i in ids}
+    to_submit = [t for t in tags if t[0] not in in_flight]
+
+    for offset in range(0, len(to_submit), batch_size):
+        chunk = to_submit[offset:offset + batch_size]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            images = list(pool.map(lambda t: load_image(app, store, t[0], t[1]), chunk))
+        batch_id = backend.submit_batch([(f"tag-{t[0]}", image, 'image/jpeg') for t, image in zip(chunk, images)])
+        checkpoint.write({'type': 'batch', 'batch_id': batch_id, 'tag_ids': [t[0] for t in chunk]})
+        print(f"  Submitted batch {batch_id} ({len(chunk)} tags)")
+
+    pending = checkpoint.pending_batches()
+    while pending:
+        for batch_id, ids in list(pending.items()):
+            if not backend.batch_ended(batch_id):
+                continue
+            for custom_id, new, error in backend.batch_results(batch_id):
+                tag_id = int(custom_id.split('-', 1)[1])
+                old = old_values.get(tag_id)
+                if old is None:
+                    # Submitted by an earlier run but no longer selected (or deleted)
+                    continue
+                record_result(checkpoint, tag_id, old, fields, new=new, error=error, batch_id=batch_id)
+            checkpoint.write({'type': 'batch_collected', 'batch_id': batch_id})
+            del pending[batch_id]
+            print(f"  Batch {batch_id} collected")
+        if pending:
+            print(f"  Waiting for {len(pending)} batch(es)...")
+            time.sleep(BATCH_POLL_INTERVAL)
+
+
+def apply_changes(records):
+    """Write checkpointed changes to the tags in bulk; returns (tags updated, field conflicts)"""
+    records = [r for r in records if r['status'] == 'changed']
+    updated, conflicts = 0, 0
+    for offset in range(0, len(records), APPLY_CHUNK):
+        chunk = records[offset:offset + APPLY_CHUNK]
+        current = {t.id: t for t in Tag.query.filter(Tag.id.in_([r['tag_id'] for r in chunk]))}
+        rows = []
+        now = datetime.utcnow()
+        for record in chunk:
+            tag = current.get(record['tag_id'])
+            if not tag:
+                continue
+            values = {f: getattr(tag, f) for f in FIELDS}
+            for field, (old, new) in record['changes'].items():
+                if (values[field] or '') == (old or ''):
+                    values[field] = new
+                else:
+                    conflicts += 1
+            if all(values[f] == getattr(tag, f) for f in FIELDS):
+                continue
+            # Same derived columns as update_tag(): source is only reclassified when the price changed
+            source = tag.source
+            if values['price'] != tag.price and values['price']:
+                source = classify_source(values['price']) or source
+            rows.append(dict(
+                values,
+                id=tag.id,
+                price_cents=price_cents(values['price']),
+                style_key=lookup_key(values['style_number']),
+                po_key=lookup_key(values['po_number']),
+                source=source,
+                raw_text=f"Style Number: {values['style_number']}\nDescription: {values['description']}\n"
+                         f"PO Number: {values['po_number']}",
+                updated_at=now
+            ))
+        if rows:
+            db.session.execute(update(Tag), rows)
+        db.session.commit()
+        updated += len(rows)
+    return updated, conflicts
+
+
+def summarize(checkpoint, ids):
+    records = [checkpoint.tags[i] for i in ids if i in checkpoint.tags]
+    statuses = Counter(r['status'] for r in records)
+    fields = Counter(f for r in records for f in r.get('changes', {}))
+    print(f"\n  {statuses['changed']} changed, {statuses['unchanged']} unchanged, {statuses['failed']} failed")
+    if fields:
+        print("  Fields changed: " + ', '.join(f"{f} {n}" for f, n in fields.most_common()))
+    return records
+
+
+def confirm(args, prompt):
+    return args.yes or input(f"{prompt} (yes/no): ").lower() == 'yes'
+
+
+def main(app, args):
+    run_migrations(app)
+    if args.apply_diff:
+        checkpoint = Checkpoint(args.apply_diff)
+        records = list(checkpoint.tags.values())
+        changed = sum(1 for r in records if r['status'] == 'changed')
+        if not confirm(args, f"Apply {changed} reviewed changes from {args.apply_diff}?"):
+            print("Cancelled.")
+            return
+        with app.app_context():
+            updated, conflicts = apply_changes(records)
+        print(f"✅ Updated {updated} tags ({conflicts} field(s) edited since the read were kept)")
+        return
+
+    fields = [f.strip() for f in args.fields.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        sys.exit(f"❌ Unknown fields: {', '.join(unknown)} (choose from {', '.join(FIELDS)})")
+
+    checkpoint = Checkpoint(args.checkpoint)
+    selection = selection_of(args)
+    if checkpoint.run and (checkpoint.run['selection'] != selection or checkpoint.run['fields'] != fields):
+        sys.exit(f"❌ {args.checkpoint} was written for a different selection or fields; "
+                 "use another --checkpoint or the same arguments")
+
+    backend = get_model_backend(ModelGovernor.from_env())
+    if args.batch and not getattr(backend, 'supports_batches', False):
+        sys.exit(f"❌ The {backend.name} backend has no batch API; run without --batch")
+    store = get_blob_store(app)
+    with app.app_context():
+        tags = select_tags(args, fields)
+    done = checkpoint.done()
+    todo = [t for t in tags if t[0] not in done]
+    print(f"🏷️  {len(tags)} tags selected, {len(tags) - len(todo)} already read, {len(todo)} to read "
+          f"with {backend.name}" + (" (batches)" if args.batch else f" ({args.workers} workers)"))
+    if todo and not confirm(args, f"Re-read {len(todo)} tag images?"):
+        print("Cancelled.")
+        return
+    if not checkpoint.run:
+        checkpoint.write({'type': 'run', 'selection': selection, 'fields': fields,
+                          'started_at': datetime.utcnow().isoformat(timespec='seconds')})
+
+    if args.batch:
+        read_in_batches(app, store, backend, todo, fields, checkpoint, args.batch_size, args.workers)
+    elif todo:
+        read_concurrently(app, store, backend, todo, fields, checkpoint, args.workers)
+    checkpoint.close()
+
+    records = summarize(checkpoint, [t[0] for t in tags])
+    print(f"  Diff: {args.checkpoint}")
+    if args.apply:
+        with app.app_context():
+            updated, conflicts = apply_changes(records)
+        print(f"✅ Updated {updated} tags ({conflicts} field(s) edited since the read were kept)")
+    else:
+        print(f"  Review it, then apply with: python reextract.py --apply-diff {args.checkpoint}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Re-run extraction over stored tag images')
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument('--folder', type=int, metavar='ID', help='tags in this folder')
+    scope.add_argument('--general', action='store_true', help='tags in the General Inbox')
+    parser.add_argument('--since', metavar='YYYY-MM-DD', help='scanned on or after')
+    parser.add_argument('--until', metavar='YYYY-MM-DD', help='scanned on or before')
+    parser.add_argument('--missing-price', action='store_true', help='only tags without a price')
+    parser.add_argument('--ids', type=int, nargs='+', metavar='N')
+    parser.add_argument('--limit', type=int, help='at most this many tags (lowest ids first)')
+    parser.add_argument('--fields', default=','.join(FIELDS), help='fields to compare and update')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent reads (the governor also caps them)')
+    parser.add_argument('--batch', action='store_true', help='submit reads as Message Batches')
+    parser.add_argument('--batch-size', type=int, default=500, help='requests per batch')
+    parser.add_argument('--checkpoint', default=f"reextract-{datetime.now():%Y%m%d-%H%M%S}.jsonl",
+                        help='JSONL progress and diff file; reuse it to resume')
+    parser.add_argument('--apply', action='store_true', help='write the changes to the tags at the end')
+    parser.add_argument('--apply-diff', metavar='FILE', help='apply a reviewed checkpoint and exit')
+    parser.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    init_db(app)
+    print(f"🗄️  Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    main(app, args)
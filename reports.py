@@ -0,0 +1,77 @@
+"""
+Outstanding return value, totalled in the database.
+
+outstanding_value() runs one GROUP BY over the live tags - by source, folder
+and due week (the Monday of the week the return date falls in) - counting
+tags and summing the integer Tag.price_cents column, then rolls those rows
+up into per-source, per-folder and per-week totals. No tag rows are loaded
+and no prices are parsed in Python.
+
+Every tag in the tags table is outstanding; archive.py moves settled ones out.
+Values are in dollars; tags without a parseable price count towards `count`
+but not `priced` or `value`.
+"""
+from datetime import date
+from database import db, Tag, Folder
+
+
+def due_week():
+    """SQL expression for the Monday of Tag.return_date's week"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.cast(db.func.date_trunc('week', Tag.return_date), db.Date)
+    # SQLite: forward to the Sunday ending the week, then back to its Monday
+    return db.func.date(Tag.return_date, 'weekday 0', '-6 days')
+
+
+def empty_totals(**keys):
+    return dict(keys, count=0, priced=0, value=0)
+
+
+def add_totals(target, count, priced, cents):
+    target['count'] += count
+    target['priced'] += priced
+    target['value'] += cents
+
+
+def in_dollars(entry):
+    entry['value'] = round(entry['value'] / 100, 2)
+    return entry
+
+
+def outstanding_value(query):
+    """Outstanding value of a Tag query's tags: totals, by_source, by_folder, by_week and the grouped rows"""
+    week = due_week().label('week')
+    rows = query.with_entities(
+        Tag.source, Tag.folder_id, Folder.name, week,
+        db.func.count(Tag.id), db.func.count(Tag.price_cents), db.func.sum(Tag.price_cents)
+    ).outerjoin(Folder, Tag.folder_id == Folder.id) \
+     .group_by(Tag.source, Tag.folder_id, Folder.name, week) \
+     .order_by(week, Folder.name, Tag.source) \
+     .all()
+
+    totals = empty_totals()
+    by_source, by_folder, by_week, groups = {}, {}, {}, []
+    for source, folder_id, folder_name, week_start, count, priced, cents in rows:
+        week_start = week_start if isinstance(week_start, str) else week_start.isoformat()
+        cents = cents or 0
+        for entry in (
+            totals,
+            by_source.setdefault(source, empty_totals(source=source)),
+            by_folder.setdefault(folder_id, empty_totals(folder_id=folder_id, folder_name=folder_name)),
+            by_week.setdefault(week_start, empty_totals(week=week_start)),
+        ):
+            add_totals(entry, count, priced, cents)
+        groups.append(in_dollars(dict(source=source, folder_id=folder_id, folder_name=folder_name,
+                                      week=week_start, count=count, priced=priced, value=cents)))
+
+    def by_value(entries):
+        return sorted((in_dollars(e) for e in entries), key=lambda e: -e['value'])
+
+    return {
+        'as_of': date.today().isoformat(),
+        'totals': in_dollars(totals),
+        'by_source': by_value(by_source.values()),
+        'by_folder': by_value(by_folder.values()),
+        'by_week': [in_dollars(by_week[w]) for w in sorted(by_week)],
+        'rows': groups
+    }
@@ -0,0 +1,127 @@
+"""
+Indexed tag search over style number, description and PO number.
+
+SQLite: an FTS5 table (tags_fts) over the tags rows, kept in sync by
+triggers, so every insert/update/delete path (including bulk deletes) is
+covered without app code. '-' is a token character, so a style number such
+as 123456-00 is one token and "123456" prefix-matches it.
+
+PostgreSQL: a pg_trgm GIN index on the concatenated columns, used by the
+ILIKE match below.
+
+Every whitespace-separated search term must match (AND), as a prefix on
+SQLite and as a substring on Postgres.
+"""
+import re
+from sqlalchemy import text
+from database import db, Tag
+
+# Set by detect_search_backend() at startup
+_backend = 'like'
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tags_fts USING fts5(
+        style_number, description, po_number,
+        content='tags', content_rowid='id',
+        tokenize="unicode61 tokenchars '-'"
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS tags_fts_ai AFTER INSERT ON tags BEGIN
+        INSERT INTO tags_fts(rowid, style_number, description, po_number)
+        VALUES (new.id, new.style_number, new.description, new.po_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tags_fts_ad AFTER DELETE ON tags BEGIN
+        INSERT INTO tags_fts(tags_fts, rowid, style_number, description, po_number)
+        VALUES ('delete', old.id, old.style_number, old.description, old.po_number);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tags_fts_au AFTER UPDATE OF style_number, description, po_number ON tags BEGIN
+        INSERT INTO tags_fts(tags_fts, rowid, style_number, description, po_number)
+        VALUES ('delete', old.id, old.style_number, old.description, old.po_number);
+        INSERT INTO tags_fts(rowid, style_number, description, po_number)
+        VALUES (new.id, new.style_number, new.description, new.po_number);
+    END""",
+]
+
+POSTGRES_DOCUMENT = "(style_number || ' ' || description || ' ' || po_number)"
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_tags_search_trgm ON tags USING gin ({POSTGRES_DOCUMENT} gin_trgm_ops)",
+]
+
+
+def ensure_search_index(conn):
+    """Create the search index for this database if missing (run by migrations.py)"""
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='tags_fts'")).first()
+        for ddl in SQLITE_DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            # Index rows that predate the FTS table
+            conn.execute(text("INSERT INTO tags_fts(tags_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for ddl in POSTGRES_DDL:
+            conn.execute(text(ddl))
+
+
+def detect_search_backend():
+    """Pick the search strategy from what the migrations created. Needs an app context."""
+    global _backend
+    dialect = db.engine.dialect.name
+    with db.engine.connect() as conn:
+        if dialect == 'sqlite':
+            found = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='tags_fts'")).first()
+            _backend = 'fts5' if found else 'like'
+        elif dialect == 'postgresql':
+            found = conn.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_tags_search_trgm'")).first()
+            _backend = 'trigram' if found else 'like'
+        else:
+            _backend = 'like'
+    return _backend
+
+
+def search_terms(q):
+    return [t for t in re.split(r'\s+', q.strip()) if t]
+
+
+def apply_search(query, q, model=Tag):
+    """
+    Restrict a query over model to rows matching every term in q.
+
+    For another model with the same columns (ArchivedTag) the terms are
+    matched with LIKE: the index only covers live tags.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return query
+    if model is not Tag:
+        return like_search(query, terms, model)
+
+    if _backend == 'fts5':
+        # Quote each term so FTS5 syntax characters are literal, then prefix-match
+        match = ' AND '.join('"' + t.replace('"', '""') + '"*' for t in terms)
+        matching_ids = db.select(text('rowid')).select_from(text('tags_fts')) \
+            .where(text('tags_fts MATCH :match').bindparams(match=match))
+        return query.filter(Tag.id.in_(matching_ids))
+
+    if _backend == 'trigram':
+        for t in terms:
+            pattern = '%' + re.sub(r'([\\%_])', r'\\\1', t) + '%'
+            query = query.filter(db.literal_column(POSTGRES_DOCUMENT).ilike(pattern, escape='\\'))
+        return query
+
+    return like_search(query, terms, Tag)
+
+
+def like_search(query, terms, model):
+    for t in terms:
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', t) + '%'
+        query = query.filter(db.or_(
+            model.style_number.ilike(pattern, escape='\\'),
+            model.description.ilike(pattern, escape='\\'),
+            model.po_number.ilike(pattern, escape='\\')
+        ))
+    return query
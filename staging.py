@@ -0,0 +1,91 @@
+"""
+Server-side staging for uploaded tag images.
+
+/upload keeps the image bytes here under a random token and the scanner only
+ever holds the token: extraction reads the staged bytes, swaps in the
+normalized image, and /save refers to the token instead of sending the
+image back up.
+
+Staged images live in process memory (like the job queue) and are evicted
+when unused for UPLOAD_STAGE_TTL seconds, or least-recently-used first once
+their total size passes UPLOAD_STAGE_MAX_MB.
+
+Environment:
+    UPLOAD_STAGE_TTL     seconds a staged upload is kept without being used (default 3600)
+    UPLOAD_STAGE_MAX_MB  total size of staged uploads before the oldest are evicted (default 256)
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+
+class StagedUploads:
+    """Token -> image bytes, bounded by age and total size"""
+
+    def __init__(self, ttl=3600, max_bytes=256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # token -> (bytes, last used), least recently used first
+        self._size = 0
+        self._evicted = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl=int(os.environ.get('UPLOAD_STAGE_TTL', '3600')),
+            max_bytes=int(os.environ.get('UPLOAD_STAGE_MAX_MB', '256')) * 1024 * 1024
+        )
+
+    def put(self, data):
+        """Stage data and return its token"""
+        token = secrets.token_urlsafe(16)
+        self.replace(token, data)
+        return token
+
+    def replace(self, token, data):
+        """Store data under token, replacing any bytes already staged there"""
+        with self._lock:
+            self._discard(token)
+            self._items[token] = (data, time.time())
+            self._size += len(data)
+            self._evict()
+
+    def get(self, token):
+        """Staged bytes for token, or None if unknown/evicted"""
+        with self._lock:
+            item = self._items.pop(token, None) if token else None
+            if item is None:
+                return None
+            self._items[token] = (item[0], time.time())
+            return item[0]
+
+    def discard(self, token):
+        with self._lock:
+            self._discard(token)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'staged': len(self._items),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'evicted': self._evicted
+            }
+
+    def _discard(self, token):
+        item = self._items.pop(token, None)
+        if item:
+            self._size -= len(item[0])
+
+    def _evict(self):
+        # Oldest first: anything past the TTL, then whatever is over budget
+        cutoff = time.time() - self.ttl
+        while self._items:
+            token, (data, last_used) = next(iter(self._items.items()))
+            if last_used >= cutoff and self._size <= self.max_bytes:
+                break
+            self._discard(token)
+            self._evicted += 1
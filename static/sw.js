@@ -0,0 +1,279 @@
+// Tag Tracker service worker (served at /sw.js so it controls every page).
+//
+// - Pages are fetched from the network and fall back to the last copy seen
+//   when the stockroom Wi-Fi drops; static files come from the cache and
+//   are refreshed in the background (stale-while-revalidate).
+// - Tags are mirrored into IndexedDB from /api/tags/changes, so only what
+//   changed since the last sync is downloaded. /api/tags is answered from
+//   that copy while offline.
+// - Scans taken offline are handed over by the scanner page, kept in an
+//   IndexedDB outbox and uploaded, read and saved once the connection is back.
+
+const PAGE_CACHE = 'tag-tracker-pages-v1';
+const STATIC_CACHE = 'tag-tracker-static-v2';
+const PRECACHE = ['/', '/scan', '/tracker', '/static/manifest.json', '/static/icon.svg'];
+
+const DB_NAME = 'tag-tracker';
+const SYNC_PAGE_SIZE = 500;
+const POLL_INTERVAL = 1000;
+const MAX_SCAN_ATTEMPTS = 5;
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(caches.open(PAGE_CACHE).then(cache => cache.addAll(PRECACHE)).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(k => ![PAGE_CACHE, STATIC_CACHE].includes(k)).map(k => caches.delete(k))))
+            .then(() => self.clients.claim())
+            .then(() => syncTags().catch(() => {}))
+    );
+});
+
+// ── IndexedDB ─────────────────────────────────────────────────────────
+// tags: the synced copy, by id. meta: the sync cursor. outbox: offline scans.
+function openDb() {
+    return new Promise((resolve, reject) => {
+        const req = indexedDB.open(DB_NAME, 1);
+        req.onupgradeneeded = () => {
+            req.result.createObjectStore('tags', { keyPath: 'id' });
+            req.result.createObjectStore('meta');
+            req.result.createObjectStore('outbox', { keyPath: 'id', autoIncrement: true });
+        };
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+    });
+}
+
+// Run fn(stores...) in one transaction; resolves with fn's result once it commits
+async function transact(storeNames, mode, fn) {
+    const db = await openDb();
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(storeNames, mode);
+        let result;
+        tx.oncomplete = () => resolve(result);
+        tx.onerror = tx.onabort = () => reject(tx.error);
+        Promise.resolve(fn(...storeNames.map(name => tx.objectStore(name)))).then(r => { result = r; });
+    });
+}
+
+function requestValue(req) {
+    return new Promise((resolve, reject) => {
+        req.onsuccess = () => resolve(req.result);
+        req.onerror = () => reject(req.error);
+    });
+}
+
+async function notifyClients(message) {
+    const clients = await self.clients.matchAll();
+    clients.forEach(client => client.postMessage(message));
+}
+
+// ── Tag sync ──────────────────────────────────────────────────────────
+let syncing = null;
+
+function syncTags() {
+    // One sync at a time; callers during a sync share it
+    if (!syncing) syncing = pullChanges().finally(() => { syncing = null; });
+    return syncing;
+}
+
+async function pullChanges() {
+    let cursor = await transact(['meta'], 'readonly', meta => requestValue(meta.get('cursor')));
+    let changed = 0;
+    while (true) {
+        const params = new URLSearchParams({ limit: SYNC_PAGE_SIZE });
+        if (cursor) params.set('since', cursor);
+        const resp = await fetch('/api/tags/changes?' + params);
+        if (resp.status === 410) {
+            // Too old to catch up from: start over
+            await transact(['tags', 'meta'], 'readwrite', (tags, meta) => { tags.clear(); meta.delete('cursor'); });
+            cursor = null;
+            continue;
+        }
+        const data = await resp.json();
+        if (!data.success) throw new Error(data.error);
+
+        // Deletes, upserts and the new cursor land together or not at all
+        await transact(['tags', 'meta'], 'readwrite', (tags, meta) => {
+            data.deleted.forEach(id => tags.delete(id));
+            data.tags.forEach(tag => tags.put(tag));
+            meta.put(data.next_cursor, 'cursor');
+        });
+        changed += data.tags.length + data.deleted.length;
+        cursor = data.next_cursor;
+        if (!data.has_more) break;
+    }
+    if (changed) notifyClients({ type: 'tags-synced', changed });
+}
+
+// /api/tags from the synced copy, with the same folder filters and order
+async function offlineTags(url) {
+    const folderId = url.searchParams.get('folder_id');
+    const general = url.searchParams.get('general') === '1';
+    const all = await transact(['tags'], 'readonly', tags => requestValue(tags.getAll()));
+    const tags = all
+        .filter(t => general ? t.folder_id === null : (!folderId || t.folder_id === Number(folderId)))
+        .sort((a, b) => a.return_date.localeCompare(b.return_date) || a.id - b.id);
+    return new Response(JSON.stringify({ success: true, offline: true, tags, next_cursor: null }),
+                        { headers: { 'Content-Type': 'application/json' } });
+}
+
+// ── Offline scans ─────────────────────────────────────────────────────
+function retryLater(message) {
+    const err = new Error(message);
+    err.retryLater = true;
+    return err;
+}
+
+// The server refused the scan (e.g. a rejected duplicate): sending it again gets the same answer
+function refused(message) {
+    const err = new Error(message);
+    err.refused = true;
+    return err;
+}
+
+async function postJson(url, body) {
+    const resp = await fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    if (resp.status === 503) throw retryLater('Server busy');
+    const data = await resp.json();
+    if (resp.status === 409) throw refused(data.error);
+    return data;
+}
+
+// Upload, wait for the extraction, then save - what the scanner page does online
+async function uploadScan(scan) {
+    const resp = await fetch('/upload', { method: 'POST', body: scan.image });
+    if (resp.status === 503) throw retryLater('Server busy');
+    let job = await resp.json();
+    while (job.success && job.status !== 'done') {
+        await new Promise(r => setTimeout(r, POLL_INTERVAL));
+        job = await (await fetch(`/upload/${job.job_id}`)).json();
+    }
+    // The model API was busy, not the image: the same scan can be sent again
+    if (job.retryable) throw retryLater('Model busy');
+    if (!job.success) throw new Error('Could not read tag: ' + job.error);
+
+    const saved = await postJson('/save', {
+        ...job.fields,
+        scan_date: scan.scan_date,
+        return_date: scan.return_date,
+        upload_token: job.upload_token,
+        folder_id: scan.folder_id
+    });
+    if (!saved.success) throw new Error('Save failed: ' + saved.error);
+    return saved;
+}
+
+let draining = null;
+
+function drainOutbox() {
+    if (!draining) draining = sendQueuedScans().finally(() => { draining = null; });
+    return draining;
+}
+
+async function sendQueuedScans() {
+    const scans = await transact(['outbox'], 'readonly', outbox => requestValue(outbox.getAll()));
+    let sent = 0;
+    for (const scan of scans) {
+        try {
+            const saved = await uploadScan(scan);
+            await transact(['outbox'], 'readwrite', outbox => outbox.delete(scan.id));
+            sent++;
+            notifyClients({ type: 'scan-saved', id: saved.id, return_date: saved.return_date });
+        } catch (err) {
+            // Still offline (fetch throws TypeError) or busy: keep the rest for the next attempt
+            if (err instanceof TypeError || err.retryLater) break;
+            if (err.refused) {
+                await transact(['outbox'], 'readwrite', outbox => outbox.delete(scan.id));
+                notifyClients({ type: 'scan-failed', error: err.message });
+                continue;
+            }
+            scan.attempts = (scan.attempts || 0) + 1;
+            scan.error = err.message;
+            await transact(['outbox'], 'readwrite', outbox =>
+                scan.attempts >= MAX_SCAN_ATTEMPTS ? outbox.delete(scan.id) : outbox.put(scan));
+            if (scan.attempts >= MAX_SCAN_ATTEMPTS) notifyClients({ type: 'scan-failed', error: err.message });
+        }
+    }
+    notifyClients({ type: 'outbox', count: await outboxCount() });
+    if (sent) syncTags().catch(() => {});
+}
+
+function outboxCount() {
+    return transact(['outbox'], 'readonly', outbox => requestValue(outbox.count()));
+}
+
+async function queueScan(scan) {
+    await transact(['outbox'], 'readwrite', outbox => outbox.add({ ...scan, queued_at: Date.now(), attempts: 0 }));
+    // Background Sync retries even if every page is closed; elsewhere pages ask on 'online'
+    if (self.registration.sync) await self.registration.sync.register('scan-outbox').catch(() => {});
+    return outboxCount();
+}
+
+self.addEventListener('sync', (event) => {
+    if (event.tag === 'scan-outbox') event.waitUntil(drainOutbox());
+});
+
+// Messages from pages: {type: 'queue-scan', scan}, 'flush-scans', 'sync-tags', 'outbox-count'
+self.addEventListener('message', (event) => {
+    const reply = event.ports[0];
+    const work = {
+        'queue-scan': () => queueScan(event.data.scan),
+        'flush-scans': () => drainOutbox().then(outboxCount),
+        'sync-tags': () => syncTags(),
+        'outbox-count': () => outboxCount()
+    }[event.data.type];
+    if (!work) return;
+    event.waitUntil(work()
+        .then(result => reply && reply.postMessage({ success: true, result }))
+        .catch(err => reply && reply.postMessage({ success: false, error: err.message })));
+});
+
+// ── Fetch ─────────────────────────────────────────────────────────────
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+    if (url.pathname === '/api/tags') {
+        event.respondWith(fetch(request).catch(() => offlineTags(url)));
+    } else if (request.mode === 'navigate') {
+        event.respondWith(networkThenCache(request));
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(cacheThenRefresh(request, event));
+    }
+});
+
+// The cached copy straight away, with the network's copy stored for next time
+async function cacheThenRefresh(request, event) {
+    const cache = await caches.open(STATIC_CACHE);
+    const refresh = fetch(request).then(resp => {
+        if (resp.ok) cache.put(request, resp.clone());
+        return resp;
+    });
+    const hit = await cache.match(request);
+    if (!hit) return refresh;
+    event.waitUntil(refresh.catch(() => {}));
+    return hit;
+}
+
+async function networkThenCache(request) {
+    const cache = await caches.open(PAGE_CACHE);
+    try {
+        const resp = await fetch(request);
+        if (resp.ok) cache.put(request, resp.clone());
+        return resp;
+    } catch (err) {
+        // Same page, else the same page without its filters, else home
+        return (await cache.match(request)) ||
+               (await cache.match(request, { ignoreSearch: true })) ||
+               (await cache.match('/')) ||
+               Response.error();
+    }
+}
@@ -0,0 +1,62 @@
+"""
+Delete image blobs that no tag refers to.
+
+Deleting a tag only releases its image once no other tag (live or archived)
+uses it and it wasn't stored in the last BLOB_RELEASE_GRACE seconds, since a
+save in progress may be about to use it again (see blobstore.py). This
+collects the ones left behind - from both the live and the archive blob
+store - once they are older than the grace period.
+
+Run it on a schedule, e.g. daily from Heroku Scheduler:
+    python sweep_blobs.py --yes
+
+Usage:
+    python sweep_blobs.py [--grace SECONDS] [--dry-run] [--yes]
+"""
+import argparse
+from flask import Flask
+from archive import image_columns
+from blobstore import BLOB_RELEASE_GRACE, get_archive_blob_store, get_blob_store, shares_storage, sweep_unreferenced
+from database import ArchivedTag, Tag, init_db
+from migrations import run_migrations
+
+
+def stores(app):
+    """(name, store, columns whose keys live in it) for each distinct blob store"""
+    hot, cold = get_blob_store(app), get_archive_blob_store(app)
+    found = [('live', hot, image_columns(hot, cold, Tag.image_key, ArchivedTag.image_key))]
+    if not shares_storage(hot, cold):
+        found.append(('archive', cold, image_columns(cold, hot, ArchivedTag.image_key, Tag.image_key)))
+    return found
+
+
+def main(app, args):
+    run_migrations(app)
+    with app.app_context():
+        found = [(name, store, columns, sweep_unreferenced(store, columns, dry_run=True)[1])
+                 for name, store, columns in stores(app)]
+        for name, _, _, orphans in found:
+            print(f"🏷️  {orphans} unreferenced blobs in the {name} store")
+        if args.dry_run or not any(orphans for *_, orphans in found):
+            return
+        if not args.yes and input("Delete the ones older than the grace period? (yes/no): ").lower() != 'yes':
+            print("Cancelled.")
+            return
+        for name, store, columns, _ in found:
+            deleted, orphans = sweep_unreferenced(store, columns, args.grace)
+            print(f"✅ Deleted {deleted} blobs from the {name} store"
+                  + (f" ({orphans - deleted} stored too recently to delete)" if orphans > deleted else ""))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Delete image blobs no tag refers to')
+    parser.add_argument('--grace', type=float, default=BLOB_RELEASE_GRACE,
+                        help="keep blobs stored less than this many seconds ago")
+    parser.add_argument('--dry-run', action='store_true', help='only count the unreferenced blobs')
+    parser.add_argument('--yes', action='store_true', help="don't ask for confirmation")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    init_db(app)
+    print(f"🗄️  Database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    main(app, args)
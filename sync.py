@@ -0,0 +1,110 @@
+"""
+Delta sync for offline clients (the service worker in static/sw.js).
+
+GET /api/tags/changes?since=<cursor> returns the tags created or updated
+since the cursor, in (updated_at, id) order, and the ids of tags deleted
+since then, from the tag_tombstones table. Without ?since= it starts from
+the beginning, which is how a client does its first full load. Each
+response carries next_cursor; has_more means another page is waiting.
+
+Every route that deletes tags records tombstones (record_deletions). They
+are pruned after TAG_TOMBSTONE_DAYS days, so a cursor older than that can no
+longer be trusted to have seen every delete and is answered with 410: the
+client drops its copy and syncs from the start.
+
+Environment:
+    TAG_TOMBSTONE_DAYS  days deleted-tag tombstones are kept (default 30)
+"""
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy.orm import load_only
+from database import db, Tag, TagTombstone, TAG_FIELD_COLUMNS
+
+TOMBSTONE_DAYS = int(os.environ.get('TAG_TOMBSTONE_DAYS', '30'))
+
+# Everything to_dict() offers except what goes stale without the tag changing
+# (days_until_due ticks daily, folder_name changes on a folder rename)
+SYNC_FIELDS = [f for f in TAG_FIELD_COLUMNS if f not in ('days_until_due', 'folder_name')]
+SYNC_COLUMNS = sorted({c for f in SYNC_FIELDS for c in TAG_FIELD_COLUMNS[f]})
+
+
+class CursorExpired(Exception):
+    """The cursor predates the oldest kept tombstones; sync from the start"""
+
+
+def encode_sync_cursor(updated_at, tag_id, tombstone_id, started_at):
+    raw = json.dumps([updated_at.isoformat() if updated_at else None, tag_id, tombstone_id,
+                      started_at.isoformat()]).encode()
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_sync_cursor(cursor):
+    """Inverse of encode_sync_cursor; raises ValueError on a malformed cursor, CursorExpired on an old one"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        updated_at, tag_id, tombstone_id, started_at = json.loads(raw)
+        updated_at = datetime.fromisoformat(updated_at) if updated_at else None
+        started_at = datetime.fromisoformat(started_at)
+        tag_id, tombstone_id = int(tag_id), int(tombstone_id)
+    except (TypeError, json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(str(e))
+    if started_at < datetime.utcnow() - timedelta(days=TOMBSTONE_DAYS):
+        raise CursorExpired()
+    return updated_at, tag_id, tombstone_id, started_at
+
+
+def record_deletions(tag_ids):
+    """Add tombstones for deleted tags to the current transaction, pruning expired ones"""
+    now = datetime.utcnow()
+    rows = [{'tag_id': tag_id, 'deleted_at': now} for tag_id in tag_ids]
+    if rows:
+        db.session.execute(db.insert(TagTombstone), rows)
+        db.session.query(TagTombstone) \
+            .filter(TagTombstone.deleted_at < now - timedelta(days=TOMBSTONE_DAYS)) \
+            .delete(synchronize_session=False)
+
+
+def tag_changes(cursor=None, limit=500):
+    """One page of changes since cursor: {'tags', 'deleted', 'next_cursor', 'has_more'}"""
+    now = datetime.utcnow()
+    if cursor:
+        updated_at, tag_id, tombstone_id, started_at = decode_sync_cursor(cursor)
+    else:
+        # A full load has no copies to delete: start after the newest tombstone
+        tombstone_id = db.session.query(db.func.max(TagTombstone.id)).scalar() or 0
+        updated_at, tag_id, started_at = None, 0, now
+
+    query = Tag.query.options(load_only(*(getattr(Tag, c) for c in SYNC_COLUMNS)))
+    if updated_at:
+        query = query.filter(db.or_(
+            Tag.updated_at > updated_at,
+            db.and_(Tag.updated_at == updated_at, Tag.id > tag_id)
+        ))
+    tags = query.order_by(Tag.updated_at.asc(), Tag.id.asc()).limit(limit + 1).all()
+
+    # A live tag with a tombstoned id is a reused id (SQLite), not a delete
+    tombstones = db.session.query(TagTombstone.id, TagTombstone.tag_id) \
+        .filter(TagTombstone.id > tombstone_id) \
+        .filter(~db.exists().where(Tag.id == TagTombstone.tag_id)) \
+        .order_by(TagTombstone.id.asc()) \
+        .limit(limit + 1) \
+        .all()
+
+    has_more = len(tags) > limit or len(tombstones) > limit
+    tags, tombstones = tags[:limit], tombstones[:limit]
+    if tags:
+        updated_at, tag_id = tags[-1].updated_at, tags[-1].id
+    if tombstones:
+        tombstone_id = tombstones[-1].id
+    # A caught-up cursor has seen every tombstone that existed now, so it stays
+    # good until tombstones written after now start being pruned
+    if not has_more:
+        started_at = now
+    return {
+        'tags': [t.to_dict(SYNC_FIELDS) for t in tags],
+        'deleted': [t.tag_id for t in tombstones],
+        'next_cursor': encode_sync_cursor(updated_at, tag_id, tombstone_id, started_at),
+        'has_more': has_more
+    }
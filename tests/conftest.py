@@ -0,0 +1,54 @@
+import importlib
+import itertools
+import os
+import sys
+import pytest
+
+# The app's modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The app (imported once per run) on a temporary SQLite database, with response caches off"""
+    tmp = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('DATABASE_URL', f"sqlite:///{tmp / 'tags.db'}")
+        env.setenv('BLOB_STORE', 'fs')
+        env.setenv('BLOB_STORE_DIR', str(tmp / 'blobs'))
+        env.setenv('ARCHIVE_BLOB_STORE_DIR', str(tmp / 'archive-blobs'))
+        env.setenv('EXTRACTOR_BACKEND', 'fake')
+        env.setenv('LISTING_CACHE_SIZE', '0')
+        env.setenv('DASHBOARD_CACHE_TTL', '0')
+        app = importlib.import_module('app').app
+        from migrations import run_migrations
+        run_migrations(app)
+        yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+FOLDER_NUMBERS = itertools.count(1)
+
+
+@pytest.fixture
+def make_folder(client):
+    """Create a folder through the API (names are made unique across the run); returns its id"""
+    def make(name):
+        response = client.post('/api/folders', json={'name': f'{name} {next(FOLDER_NUMBERS)}'})
+        assert response.json['success'], response.json
+        return response.json['folder']['id']
+    return make
+
+
+@pytest.fixture
+def save_tag(client):
+    """POST /save for a tag without an image; returns the response"""
+    def save(style_number, po_number, folder_id=None, **fields):
+        return client.post('/save', json=dict(style_number=style_number, po_number=po_number,
+                                              description='Test tag', scan_date='2026-01-05',
+                                              folder_id=folder_id, **fields))
+    return save
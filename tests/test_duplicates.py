@@ -0,0 +1,68 @@
+"""Repeated style + PO numbers on /save and /save/batch under each DUPLICATE_TAGS mode"""
+import sys
+import pytest
+from database import db, Tag
+
+
+@pytest.fixture
+def duplicate_tags(app, monkeypatch):
+    """Set DUPLICATE_TAGS for one test (the app reads it at import)"""
+    return lambda mode: monkeypatch.setattr(sys.modules['app'], 'DUPLICATE_TAGS', mode)
+
+
+def count(app, style_key):
+    with app.app_context():
+        return db.session.query(Tag).filter(Tag.style_key == style_key).count()
+
+
+def test_warn_saves_and_reports_a_normalized_match(client, save_tag, duplicate_tags):
+    duplicate_tags('warn')
+    first = save_tag('DUP-100', 'PO 1').json['id']
+
+    response = save_tag('dup 100', 'po-1')
+    assert response.status_code == 200
+    assert response.json['success']
+    assert 'already saved' in response.json['warning']
+    assert [m['id'] for m in response.json['duplicates']] == [first]
+
+
+def test_reject_answers_409_until_allow_duplicate(app, save_tag, duplicate_tags):
+    duplicate_tags('reject')
+    first = save_tag('DUP-200', '1').json['id']
+
+    response = save_tag('DUP-200', '1')
+    assert response.status_code == 409
+    assert not response.json['success']
+    assert [m['id'] for m in response.json['duplicates']] == [first]
+    assert count(app, 'DUP200') == 1
+
+    response = save_tag('DUP-200', '1', allow_duplicate=True)
+    assert response.status_code == 200
+    assert response.json['success']
+    assert count(app, 'DUP200') == 2
+
+
+def test_allow_skips_the_check(save_tag, duplicate_tags):
+    duplicate_tags('allow')
+    save_tag('DUP-300', '1')
+
+    response = save_tag('DUP-300', '1')
+    assert response.status_code == 200
+    assert 'warning' not in response.json
+
+
+def test_batch_rejects_repeats_within_the_batch(app, client, duplicate_tags):
+    duplicate_tags('reject')
+    tags = [dict(style_number=s, po_number='1', description='Test tag', scan_date='2026-01-05')
+            for s in ('DUP-400', 'dup400')]
+
+    response = client.post('/save/batch', json={'tags': tags})
+    assert response.status_code == 409
+    assert response.json['error'].startswith('Tag 2:')
+    assert response.json['duplicates']['1'][0]['batch_index'] == 0
+    assert count(app, 'DUP400') == 0
+
+    response = client.post('/save/batch', json={'tags': tags, 'allow_duplicate': True})
+    assert response.status_code == 200
+    assert response.json['saved'] == 2
+    assert count(app, 'DUP400') == 2
@@ -0,0 +1,181 @@
+import pytest
+from governor import ModelGovernor, ModelUnavailable, TokenBucket
+
+
+class FakeClock:
+    """A clock that only moves when the governor sleeps (or a test advances it)"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+
+class APIError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = Response(headers or {})
+
+
+def failing(*errors, result='ok'):
+    """fn for governor.call(): raises each error in turn, then returns result"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    fn.calls = calls
+    return fn
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_governor(clock, **kwargs):
+    options = dict(requests_per_minute=0, tokens_per_minute=0, backoff_base=0.01,
+                   clock=clock, sleep=clock.sleep)
+    options.update(kwargs)
+    return ModelGovernor(**options)
+
+
+def test_backoff_waits_for_retry_after(clock):
+    governor = make_governor(clock)
+    fn = failing(APIError(429, {'retry-after': '7'}), APIError(529, {'retry-after-ms': '2500'}))
+
+    assert governor.call(fn) == 'ok'
+    assert len(fn.calls) == 3
+    assert clock.sleeps == [7.0, 2.5]
+    assert governor.stats()['retries'] == 2
+
+
+def test_non_retryable_error_is_raised_at_once(clock):
+    governor = make_governor(clock)
+    fn = failing(APIError(400))
+
+    with pytest.raises(APIError):
+        governor.call(fn)
+    assert len(fn.calls) == 1
+    assert clock.sleeps == []
+    assert governor.stats()['state'] == 'closed'
+
+
+def test_retries_exhausted(clock):
+    governor = make_governor(clock, max_retries=2)
+    fn = failing(*[APIError(503)] * 3)
+
+    with pytest.raises(ModelUnavailable):
+        governor.call(fn)
+    assert len(fn.calls) == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_circuit_opens_half_opens_and_closes(clock):
+    governor = make_governor(clock, max_retries=0, failure_threshold=2, reset_timeout=30, queue_timeout=0)
+
+    for _ in range(2):
+        with pytest.raises(ModelUnavailable):
+            governor.call(failing(APIError(503)))
+    assert governor.stats()['state'] == 'open'
+
+    # Open: fails fast without calling the API
+    fn = failing()
+    with pytest.raises(ModelUnavailable) as error:
+        governor.call(fn)
+    assert fn.calls == []
+    assert error.value.retry_after == 30
+    assert governor.stats()['rejected'] == 1
+
+    clock.now += 30
+    assert governor.stats()['state'] == 'half_open'
+    assert governor.call(fn) == 'ok'
+    assert governor.stats()['state'] == 'closed'
+    assert governor.stats()['consecutive_failures'] == 0
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    governor = make_governor(clock, max_retries=0, failure_threshold=1, reset_timeout=30, queue_timeout=0)
+    with pytest.raises(ModelUnavailable):
+        governor.call(failing(APIError(503)))
+
+    clock.now += 30
+    with pytest.raises(ModelUnavailable):
+        governor.call(failing(APIError(503)))
+    stats = governor.stats()
+    assert stats['state'] == 'open'
+    assert stats['reopens_in'] == 30
+    assert stats['circuit_opened'] == 2
+
+
+def test_token_bucket_paces_and_refills(clock):
+    bucket = TokenBucket(60, clock)
+
+    assert all(bucket.take(1) == 0 for _ in range(60))
+    assert bucket.take(1) == pytest.approx(1.0)
+    assert bucket.take(1) == pytest.approx(2.0)
+    clock.now += 2
+    assert bucket.take(1) == pytest.approx(1.0)
+    bucket.give_back(1)
+    assert bucket.take(1) == pytest.approx(1.0)
+    # Refills to one minute's worth, no more
+    clock.now += 600
+    assert bucket.take(60) == 0
+    assert bucket.take(1) == pytest.approx(1.0)
+
+
+def test_calls_are_paced_to_the_request_rate(clock):
+    governor = make_governor(clock, requests_per_minute=60)
+
+    for _ in range(62):
+        governor.call(lambda: 'ok')
+    assert clock.sleeps == pytest.approx([1.0, 1.0])
+    assert governor.stats()['throttled_seconds'] == 2.0
+
+
+def test_token_estimate_is_corrected_from_usage(clock):
+    governor = make_governor(clock, tokens_per_minute=1000)
+
+    governor.call(lambda: 'ok', tokens=900, usage=lambda result: 100)
+    assert governor.stats()['token_budget'] == 900
+    governor.call(lambda: 'ok', tokens=900)
+    assert clock.sleeps == []
+
+
+def test_retries_are_charged_once(clock):
+    governor = make_governor(clock, requests_per_minute=60, tokens_per_minute=1000)
+
+    governor.call(failing(APIError(429), APIError(529)), tokens=100)
+    stats = governor.stats()
+    assert stats['retries'] == 2
+    assert stats['request_budget'] == pytest.approx(59, abs=0.1)
+    assert stats['token_budget'] == 900
+
+
+def test_pacing_does_not_hold_a_slot(clock):
+    governor = make_governor(clock, requests_per_minute=1, max_in_flight=1)
+    in_flight = []
+
+    def sleep(seconds):
+        in_flight.append(governor.stats()['in_flight'])
+        clock.sleep(seconds)
+    governor._sleep = sleep
+
+    governor.call(lambda: 'ok')
+    governor.call(lambda: 'ok')
+    assert clock.sleeps == pytest.approx([60.0])
+    assert in_flight == [0]
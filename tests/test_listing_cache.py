@@ -0,0 +1,46 @@
+"""Per-folder listing ETags: a write moves on its own folder's listings and no other's"""
+import pytest
+
+
+@pytest.fixture
+def folders(make_folder):
+    # Created first: a folder change moves every listing on
+    return make_folder('ETag folder A'), make_folder('ETag folder B')
+
+
+def etag(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+@pytest.mark.parametrize('listing', ['/api/tags', '/tracker'])
+def test_etag_changes_with_a_write_to_its_folder_only(client, save_tag, folders, listing):
+    a, b = folders
+    path = f'{listing}?folder_id={a}'
+    before = etag(client, path)
+    assert client.get(path, headers={'If-None-Match': before}).status_code == 304
+
+    assert save_tag('ETAG-B', '1', folder_id=b).json['success']
+    assert etag(client, path) == before
+    assert client.get(path, headers={'If-None-Match': before}).status_code == 304
+
+    assert save_tag('ETAG-A', '1', folder_id=a).json['success']
+    after = etag(client, path)
+    assert after != before
+    assert client.get(path, headers={'If-None-Match': before}).status_code == 200
+
+
+def test_unscoped_listing_changes_with_any_write(client, save_tag, folders):
+    before = etag(client, '/api/tags')
+    assert save_tag('ETAG-ANY', '1', folder_id=folders[1]).json['success']
+    assert etag(client, '/api/tags') != before
+
+
+def test_general_inbox_is_its_own_scope(client, save_tag, folders):
+    path = '/api/tags?general=1'
+    before = etag(client, path)
+    assert save_tag('ETAG-GEN', '1', folder_id=folders[0]).json['success']
+    assert etag(client, path) == before
+    assert save_tag('ETAG-GEN', '2').json['success']
+    assert etag(client, path) != before
@@ -0,0 +1,50 @@
+"""Prices as entered, converted to the integer price_cents column"""
+import pytest
+from database import db, Tag, classify_source, price_cents
+
+
+@pytest.mark.parametrize('price, cents', [
+    ('$1,049.9', 104990),
+    ('49.99', 4999),
+    ('$ 12', 1200),
+    ('0.5', 50),
+    ('N/A', None),
+    ('', None),
+    ('   ', None),
+    (None, None),
+    ('12.999', None),
+    ('-5.00', None),
+])
+def test_price_cents(price, cents):
+    assert price_cents(price) == cents
+
+
+@pytest.mark.parametrize('price, source', [
+    ('$24.95', 'Inline (GAP)'),
+    ('1,019.99', 'Gap Factory'),
+    ('24.50', None),
+    ('N/A', None),
+])
+def test_classify_source(price, source):
+    assert classify_source(price) == source
+
+
+def test_tag_keeps_price_cents_in_step():
+    tag = Tag(price='$1,049.9')
+    assert tag.price_cents == 104990
+    tag.price = 'N/A'
+    assert tag.price_cents is None
+    tag.price = None
+    assert tag.price_cents is None
+
+
+def test_saved_tag_is_filtered_by_price(app, client, save_tag):
+    tag_id = save_tag('PRICE-1', '1', price='$1,049.9').json['id']
+    blank_id = save_tag('PRICE-2', '1', price='').json['id']
+
+    ids = [t['id'] for t in client.get('/api/tags?min_price=1049.90&max_price=1049.90').json['tags']]
+    assert ids == [tag_id]
+    with app.app_context():
+        assert db.session.get(Tag, tag_id).price_cents == 104990
+        assert db.session.get(Tag, blank_id).price_cents is None
+    assert client.get('/api/tags?min_price=N/A').status_code == 400
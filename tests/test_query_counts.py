@@ -0,0 +1,48 @@
+"""
+The listing pages must not issue more queries as tags are added (no N+1s).
+
+Runs against a temporary SQLite database filled by generate_data.py, with the
+listing and dashboard caches off so every request reaches the database.
+"""
+import argparse
+from sqlalchemy import event
+import generate_data
+
+PATHS = ['/', '/api/folders', '/tracker', '/api/tags']
+
+
+def seed(app, folders, tags, seed):
+    generate_data.generate(app, argparse.Namespace(
+        folders=folders, tags=tags, image_dim=64, image_pool=3, image_share=0.5, general_share=0.1, seed=seed))
+
+
+def query_counts(app):
+    """Statements run by a GET of each path, after one warm-up request"""
+    from database import db
+    client = app.test_client()
+    counts = {}
+    for path in PATHS:
+        assert client.get(path).status_code == 200
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            assert client.get(path).status_code == 200
+        finally:
+            with app.app_context():
+                event.remove(db.engine, 'before_cursor_execute', count)
+        counts[path] = len(statements)
+    return counts
+
+
+def test_query_counts_do_not_grow_with_rows(app):
+    seed(app, folders=3, tags=20, seed=1)
+    few = query_counts(app)
+    seed(app, folders=15, tags=400, seed=2)
+    many = query_counts(app)
+
+    assert all(few.values())
+    assert many == few
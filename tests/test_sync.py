@@ -0,0 +1,45 @@
+"""Delta sync: GET /api/tags/changes reports deletes as tombstones"""
+
+
+def changes(client, cursor=None):
+    """Every page of changes since cursor: (tags, deleted ids, next cursor)"""
+    tags, deleted = [], []
+    while True:
+        response = client.get('/api/tags/changes', query_string={'since': cursor} if cursor else {})
+        assert response.status_code == 200
+        data = response.json
+        tags += data['tags']
+        deleted += data['deleted']
+        cursor = data['next_cursor']
+        if not data['has_more']:
+            return tags, deleted, cursor
+
+
+def test_delete_is_reported_as_a_tombstone(client, save_tag):
+    tag_id = save_tag('SYNC-DEL', '1').json['id']
+    tags, _, cursor = changes(client)
+    assert tag_id in [t['id'] for t in tags]
+
+    assert client.delete(f'/api/tag/{tag_id}').json['success']
+    tags, deleted, cursor = changes(client, cursor)
+    assert deleted == [tag_id]
+    assert tags == []
+
+    # Reported once, and a full load has nothing to delete
+    assert changes(client, cursor)[:2] == ([], [])
+    tags, deleted, _ = changes(client)
+    assert deleted == []
+    assert tag_id not in [t['id'] for t in tags]
+
+
+def test_reused_id_is_not_reported_deleted(client, save_tag):
+    tag_id = save_tag('SYNC-OLD', '1').json['id']
+    _, _, cursor = changes(client)
+
+    assert client.delete(f'/api/tag/{tag_id}').json['success']
+    # SQLite hands the highest id out again
+    assert save_tag('SYNC-NEW', '1').json['id'] == tag_id
+
+    tags, deleted, _ = changes(client, cursor)
+    assert tag_id not in deleted
+    assert [(t['id'], t['style_number']) for t in tags] == [(tag_id, 'SYNC-NEW')]